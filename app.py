@@ -1,19 +1,273 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, nullcontext
+from datetime import datetime, timedelta
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from logging.handlers import QueueHandler, QueueListener
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from pydantic import BaseModel, ConfigDict, Field, PlainSerializer, TypeAdapter, computed_field, field_validator, model_validator
 from pydantic_ai import Agent, RunContext
+from pydantic_ai.messages import FinalResultEvent, FunctionToolCallEvent, FunctionToolResultEvent, ModelMessage, ModelRequest, ModelResponse, SystemPromptPart, TextPart, UserPromptPart
+from pydantic_ai.models import Model, ModelRequestParameters
 from pydantic_ai.models.openrouter import OpenRouterModel
+from pydantic_ai.models.wrapper import WrapperModel
 from pydantic_ai.providers.openrouter import OpenRouterProvider
-from typing import Literal, Union, TypedDict
+from pydantic_ai.settings import ModelSettings
+from pydantic_ai.tools import ToolDefinition
+from typing import Annotated, Any, AsyncIterator, Awaitable, Callable, Hashable, Literal, NamedTuple, Union, TypedDict
+from urllib.parse import quote
+from zoneinfo import ZoneInfo
+import array
+import asyncio
+import contextvars
+import functools
 import json
 import httpx
+import logging
+import mmap
 import os
+import queue
+import random
 import re
+import secrets
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+import unicodedata
 
-app = FastAPI()
+try:
+    import fcntl
+except ImportError:
+    # Windows: no cross-process lock, every worker refreshes and writes the snapshot
+    fcntl = None
 
 # Load environment variables
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
 GOOGLE_CSE_ID = os.getenv('GOOGLE_CSE_ID')
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+# Logging: hot-path events are kept at LOG_SAMPLE_RATE, warnings always
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '0.1'))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+# Request profiling and event loop stall detection
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '20'))
+LOOP_MONITOR_INTERVAL = float(os.getenv('LOOP_MONITOR_INTERVAL', '0.1'))
+LOOP_STALL_THRESHOLD = float(os.getenv('LOOP_STALL_THRESHOLD', '0.25'))
+LOOP_STALL_KEEP = int(os.getenv('LOOP_STALL_KEEP', '50'))
+
+# Upstream hosts and HTTP connection pool sizing
+EET_API_BASE_URL = os.getenv('EET_API_BASE_URL', 'https://stage-api.eetgroup.com')
+GOOGLE_API_BASE_URL = os.getenv('GOOGLE_API_BASE_URL', 'https://www.googleapis.com')
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '50'))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('HTTP_MAX_KEEPALIVE_CONNECTIONS', '20'))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '30'))
+HTTP_POOL_TIMEOUT = float(os.getenv('HTTP_POOL_TIMEOUT', '5'))
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '10'))
+
+# Upstream circuit breakers, adaptive timeouts and GET retries
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '30'))
+LATENCY_WINDOW = int(os.getenv('LATENCY_WINDOW', '200'))
+ADAPTIVE_TIMEOUT_PERCENTILE = float(os.getenv('ADAPTIVE_TIMEOUT_PERCENTILE', '99'))
+ADAPTIVE_TIMEOUT_MULTIPLIER = float(os.getenv('ADAPTIVE_TIMEOUT_MULTIPLIER', '2'))
+ADAPTIVE_TIMEOUT_MIN = float(os.getenv('ADAPTIVE_TIMEOUT_MIN', '1'))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '2'))
+HTTP_RETRY_BACKOFF = float(os.getenv('HTTP_RETRY_BACKOFF', '0.2'))
+
+# Connector catalog cache (seconds)
+CATALOG_TTL = float(os.getenv('CATALOG_TTL', '3600'))
+CATALOG_STALE_TTL = float(os.getenv('CATALOG_STALE_TTL', '86400'))
+CATALOG_REFRESH_INTERVAL = float(os.getenv('CATALOG_REFRESH_INTERVAL', '1800'))
+CATALOG_REFRESH_CONCURRENCY = int(os.getenv('CATALOG_REFRESH_CONCURRENCY', '8'))
+CATALOG_SNAPSHOT_PATH = os.getenv('CATALOG_SNAPSHOT_PATH', 'catalog_snapshot.bin')
+CATALOG_SNAPSHOT_POLL = float(os.getenv('CATALOG_SNAPSHOT_POLL', '30'))
+
+# Local product -> connector knowledge store
+PRODUCT_STORE_PATH = os.getenv('PRODUCT_STORE_PATH', 'product_store.sqlite3')
+PRODUCT_STORE_TTL = float(os.getenv('PRODUCT_STORE_TTL', str(30 * 24 * 3600)))
+PRODUCT_STORE_MIN_SIMILARITY = float(os.getenv('PRODUCT_STORE_MIN_SIMILARITY', '0.8'))
+
+# Order status cache (TTL in seconds)
+ORDER_CACHE_TTL = float(os.getenv('ORDER_CACHE_TTL', '15'))
+ORDER_CACHE_MAX_ENTRIES = int(os.getenv('ORDER_CACHE_MAX_ENTRIES', '5000'))
+
+# Multi-order lookups: orders fetched per query, and concurrently
+ORDER_MAX_IDS = int(os.getenv('ORDER_MAX_IDS', '10'))
+ORDER_FANOUT_LIMIT = int(os.getenv('ORDER_FANOUT_LIMIT', '5'))
+
+# Google Custom Search quota (the free tier allows 100 queries per day),
+# shared by the workers through the product store at PRODUCT_STORE_PATH
+CSE_DAILY_QUOTA = int(os.getenv('CSE_DAILY_QUOTA', '100'))
+CSE_QUERIES_PER_SECOND = float(os.getenv('CSE_QUERIES_PER_SECOND', '5'))
+CSE_MAX_QUEUE_WAIT = float(os.getenv('CSE_MAX_QUEUE_WAIT', '0.5'))
+
+# Admission control for agent runs
+ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', '16'))
+ADMISSION_MAX_PER_CUSTOMER = int(os.getenv('ADMISSION_MAX_PER_CUSTOMER', '4'))
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', '64'))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '5'))
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', '2'))
+
+# Tool calls started speculatively from the raw query: orders, catalog, products
+PREFETCH = {kind.strip() for kind in os.getenv('PREFETCH', 'orders,catalog,products').split(',') if kind.strip()}
+
+# Batch search
+BATCH_MAX_QUERIES = int(os.getenv('BATCH_MAX_QUERIES', '500'))
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', '4'))
+
+# /search response cache (TTLs in seconds)
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '10000'))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+RESPONSE_CACHE_CABLE_TTL = float(os.getenv('RESPONSE_CACHE_CABLE_TTL', '3600'))
+RESPONSE_CACHE_ORDER_TTL = float(os.getenv('RESPONSE_CACHE_ORDER_TTL', '30'))
+
+# Conversational sessions (/search?sessionId=...; TTL in seconds)
+SESSION_TTL = float(os.getenv('SESSION_TTL', '1800'))
+SESSION_MAX_ENTRIES = int(os.getenv('SESSION_MAX_ENTRIES', '10000'))
+SESSION_MAX_TURNS = int(os.getenv('SESSION_MAX_TURNS', '8'))
+
+# Tiered model routing
+MODEL_LARGE = os.getenv('MODEL_LARGE', 'mistralai/mistral-large-2512')
+MODEL_SMALL = os.getenv('MODEL_SMALL', 'mistralai/mistral-small-3.2-24b-instruct')
+# "rules": rule-based classifier only, "model": ask the small model when the
+# rules cannot tell, "off": every query goes to the large model
+ROUTING_MODE = os.getenv('ROUTING_MODE', 'rules')
+ROUTE_ORDER_TIER = os.getenv('ROUTE_ORDER_TIER', 'small')
+ROUTE_CABLE_TIER = os.getenv('ROUTE_CABLE_TIER', 'large')
+ROUTE_UNKNOWN_TIER = os.getenv('ROUTE_UNKNOWN_TIER', 'large')
+# Model calls slower than the HEDGE_PERCENTILE latency are duplicated to
+# MODEL_HEDGE (empty disables hedging); SEARCH_DEADLINE caps a whole agent run
+MODEL_HEDGE = os.getenv('MODEL_HEDGE', 'mistralai/mistral-medium-3.1')
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '95'))
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', '1'))
+HEDGE_DEFAULT_DELAY = float(os.getenv('HEDGE_DEFAULT_DELAY', '8'))
+SEARCH_DEADLINE = float(os.getenv('SEARCH_DEADLINE', '25'))
+# (input, output) USD per million tokens, for the cost estimates in /stats
+MODEL_PRICES = {
+    "small": (float(os.getenv('MODEL_SMALL_INPUT_PRICE', '0.1')), float(os.getenv('MODEL_SMALL_OUTPUT_PRICE', '0.3'))),
+    "large": (float(os.getenv('MODEL_LARGE_INPUT_PRICE', '0.5')), float(os.getenv('MODEL_LARGE_OUTPUT_PRICE', '1.5'))),
+}
+
+# Structured logging
+class StructuredLogger(logging.LoggerAdapter):
+    """
+    Logger taking event fields as keyword arguments.
+
+    Example: logger.info("Tool call", sampled=True, tool="resolve_cable", seconds=0.01)
+    """
+
+    def process(self, msg, kwargs):
+        passthrough = {key: kwargs.pop(key) for key in ("exc_info", "stack_info", "stacklevel") if key in kwargs}
+        sampled = kwargs.pop("sampled", False)
+        return msg, {**passthrough, "extra": {"fields": kwargs, "sampled": sampled}}
+
+logger = StructuredLogger(logging.getLogger("eet_ai_search"), {})
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, message and the event fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class SampleFilter(logging.Filter):
+    """Keep LOG_SAMPLE_RATE of the records logged with sampled=True; let everything else through."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not getattr(record, "sampled", False) or random.random() < LOG_SAMPLE_RATE
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of blocking or raising."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def setup_logging() -> QueueListener:
+    """
+    Route the app logger through a bounded queue to a JSON stdout writer thread.
+
+    Callers only format the message and enqueue it, so logging never blocks
+    the event loop on stdout.
+
+    Returns:
+        The started listener; stop() it on shutdown to flush the queue
+    """
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(SampleFilter())
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter())
+    base_logger = logging.getLogger("eet_ai_search")
+    base_logger.handlers = [queue_handler]
+    base_logger.setLevel(LOG_LEVEL)
+    base_logger.propagate = False
+    listener = QueueListener(log_queue, stream_handler)
+    listener.start()
+    return listener
+
+def clip(text: str, limit: int = 200) -> str:
+    """Shorten user text for log lines."""
+    return text if len(text) <= limit else text[:limit] + "..."
+
+# Prometheus metrics
+SEARCH_SECONDS = Histogram(
+    "eet_search_request_seconds",
+    "Time to answer one search query",
+    ["response_type", "source"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60),
+)
+TOOL_SECONDS = Histogram(
+    "eet_search_tool_seconds",
+    "Agent tool call latency",
+    ["tool"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+TOOL_ERRORS = Counter("eet_search_tool_errors_total", "Agent tool calls that raised or returned an error", ["tool"])
+AGENT_MODEL_REQUESTS = Histogram(
+    "eet_search_agent_model_requests",
+    "LLM round-trips per agent run",
+    ["tier"],
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15),
+)
+AGENT_TOKENS = Histogram(
+    "eet_search_agent_tokens",
+    "LLM tokens per agent run",
+    ["tier", "direction"],
+    buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000),
+)
+LOOP_LAG_SECONDS = Histogram(
+    "eet_search_event_loop_lag_seconds",
+    "How late the event loop monitor woke up",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+LOOP_STALLS = Counter("eet_search_event_loop_stalls_total", "Event loop stalls longer than LOOP_STALL_THRESHOLD")
+LOOP_STALL_SECONDS = Counter("eet_search_event_loop_stall_seconds_total", "Time the event loop spent stalled")
+
+def observe_search(started: float, response: "SearchResponse", source: str) -> "SearchResponse":
+    """Record one answered query in the request latency histogram and pass the response through."""
+    SEARCH_SECONDS.labels(response.response_type, source).observe(time.perf_counter() - started)
+    return response
 
 # Define models
 class CableQuery(BaseModel):
@@ -30,129 +284,1838 @@ class OrderStatusResponse(BaseModel):
     response_type: Literal["order"] = "order"
     summary: str
     order_id: str | None = None
+    # Every order the summary covers; order_id is the first of them
+    order_ids: list[str] = []
+
+    @model_validator(mode="after")
+    def _fill_order_ids(self) -> "OrderStatusResponse":
+        if self.order_id and not self.order_ids:
+            self.order_ids = [self.order_id]
+        elif self.order_ids and not self.order_id:
+            self.order_id = self.order_ids[0]
+        return self
+
+class TryAgainResponse(BaseModel):
+    response_type: Literal["try_again"] = "try_again"
+    message: str
+    retry_after: int
 
 # Union type for agent output
 AgentResponse = Union[CableResponse, OrderStatusResponse]
+# What /search returns: the agent's answer, or a degraded reply when the deadline passed
+SearchResponse = Union[CableResponse, OrderStatusResponse, TryAgainResponse]
+SEARCH_RESPONSE_ADAPTER = TypeAdapter(SearchResponse)
+
+class ModelJSONResponse(Response):
+    """
+    JSON response rendered from a SearchResponse model by pydantic-core.
+
+    Returned directly from an endpoint, it skips FastAPI's jsonable_encoder
+    pass and json.dumps: the model is serialized to bytes in one step.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: SearchResponse) -> bytes:
+        return SEARCH_RESPONSE_ADAPTER.dump_json(content)
+
+# HTTP connection pools
+def build_upstream_client(base_url: str) -> httpx.AsyncClient:
+    """
+    Build a keep-alive HTTP/2 client bounded to a fixed number of connections.
+
+    Args:
+        base_url: Scheme and host of the upstream, e.g. "https://www.googleapis.com"
+
+    Returns:
+        AsyncClient whose connection pool is reused across tool calls
+    """
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(HTTP_TIMEOUT, pool=HTTP_POOL_TIMEOUT)
+    return httpx.AsyncClient(base_url=base_url, http2=True, limits=limits, timeout=timeout)
+
+def pool_stats(client: httpx.AsyncClient) -> dict:
+    """
+    Report connection pool usage for one upstream client.
+
+    httpx does not expose pool metrics, so this reads the underlying httpcore
+    pool. Connections multiplexing HTTP/2 streams count as in use.
+
+    Returns:
+        dict with "in_use", "idle" and "waiting" connection/request counts
+    """
+    pool = getattr(client._transport, "_pool", None)
+    if pool is None:
+        return {"in_use": 0, "idle": 0, "waiting": 0}
+    connections = list(pool.connections)
+    idle = sum(1 for connection in connections if connection.is_idle())
+    waiting = sum(1 for pool_request in getattr(pool, "_requests", []) if pool_request.is_queued())
+    return {
+        "in_use": len(connections) - idle,
+        "idle": idle,
+        "waiting": waiting,
+    }
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+    def __init__(self, upstream: str):
+        super().__init__(f"{upstream} circuit breaker is open")
+        self.upstream = upstream
+
+class LatencyTracker:
+    """Rolling window of recent latencies in seconds."""
+
+    # Percentiles need some history before they mean anything
+    MIN_SAMPLES = 20
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self._samples: deque[float] = deque(maxlen=size)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> float | None:
+        """Nearest-rank p-th percentile, or None until MIN_SAMPLES were recorded."""
+        if len(self._samples) < self.MIN_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker with a latency-based timeout for one upstream.
+
+    After BREAKER_FAILURE_THRESHOLD failures in a row the circuit opens and
+    calls fail fast with CircuitOpen. After BREAKER_RESET_TIMEOUT one probe
+    call is let through (half-open); its outcome closes or reopens the circuit.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state: Literal["closed", "open", "half_open"] = "closed"
+        self.latency = LatencyTracker()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.counters = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0, "retries": 0}
+
+    def available(self) -> bool:
+        """Whether a call made now would be let through."""
+        if self.state == "open":
+            return time.monotonic() - self._opened_at >= BREAKER_RESET_TIMEOUT
+        return self.state == "closed" or not self._probing
+
+    def before_call(self):
+        """Let a call through or raise CircuitOpen."""
+        if self.state == "open" and time.monotonic() - self._opened_at >= BREAKER_RESET_TIMEOUT:
+            self.state = "half_open"
+        if self.state == "open" or (self.state == "half_open" and self._probing):
+            self.counters["rejected"] += 1
+            raise CircuitOpen(self.name)
+        if self.state == "half_open":
+            self._probing = True
+
+    def record_success(self, seconds: float):
+        self.counters["successes"] += 1
+        self.latency.record(seconds)
+        self._failures = 0
+        self._probing = False
+        if self.state != "closed":
+            logger.info("Circuit breaker closed", upstream=self.name)
+            self.state = "closed"
+
+    def record_failure(self):
+        self.counters["failures"] += 1
+        self._failures += 1
+        self._probing = False
+        if self.state == "half_open" or (self.state == "closed" and self._failures >= BREAKER_FAILURE_THRESHOLD):
+            logger.warning("Circuit breaker opened", upstream=self.name, consecutive_failures=self._failures)
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            self.counters["opened"] += 1
+
+    def release(self):
+        """Forget an abandoned (cancelled) call so a half-open circuit can probe again."""
+        self._probing = False
+
+    def timeout(self) -> float:
+        """Request timeout: a multiple of the observed latency percentile, capped at HTTP_TIMEOUT."""
+        observed = self.latency.percentile(ADAPTIVE_TIMEOUT_PERCENTILE)
+        if observed is None:
+            return HTTP_TIMEOUT
+        return min(HTTP_TIMEOUT, max(ADAPTIVE_TIMEOUT_MIN, observed * ADAPTIVE_TIMEOUT_MULTIPLIER))
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "timeout": self.timeout(),
+            "p50": self.latency.percentile(50),
+            f"p{ADAPTIVE_TIMEOUT_PERCENTILE:g}": self.latency.percentile(ADAPTIVE_TIMEOUT_PERCENTILE),
+            **self.counters,
+        }
+
+class UpstreamClients:
+    """One connection pool and circuit breaker per upstream host, shared by every tool call."""
+
+    def __init__(self):
+        self.eet = build_upstream_client(EET_API_BASE_URL)
+        self.google = build_upstream_client(GOOGLE_API_BASE_URL)
+        self.breakers = {"eet": CircuitBreaker("eet"), "google": CircuitBreaker("google")}
+
+    def available(self, upstream: str) -> bool:
+        return self.breakers[upstream].available()
+
+    async def get(self, upstream: str, url: str, retries: int = HTTP_RETRIES, **kwargs) -> httpx.Response:
+        """
+        GET through the upstream's circuit breaker with an adaptive timeout.
+
+        Transport errors, timeouts and 5xx responses count as failures and are
+        retried up to retries times with jittered exponential backoff.
+
+        Args:
+            upstream: "eet" or "google"
+            url: Path relative to the upstream's base URL
+            retries: Extra attempts after a failure
+            **kwargs: Passed to httpx.AsyncClient.get (params, headers)
+
+        Returns:
+            The response; a 5xx is returned once retries are used up
+
+        Raises:
+            CircuitOpen: when the circuit is open
+            httpx.TransportError: when the last attempt failed to connect or timed out
+        """
+        client = getattr(self, upstream)
+        breaker = self.breakers[upstream]
+        for attempt in range(retries + 1):
+            if attempt:
+                breaker.counters["retries"] += 1
+                await asyncio.sleep(random.uniform(0, HTTP_RETRY_BACKOFF * 2 ** (attempt - 1)))
+            breaker.before_call()
+            started = time.monotonic()
+            try:
+                response = await client.get(url, timeout=httpx.Timeout(breaker.timeout(), pool=HTTP_POOL_TIMEOUT), **kwargs)
+            except httpx.TransportError:
+                breaker.record_failure()
+                if attempt == retries:
+                    raise
+                continue
+            except BaseException:
+                breaker.release()
+                raise
+            if response.status_code < 500:
+                breaker.record_success(time.monotonic() - started)
+                return response
+            breaker.record_failure()
+            if attempt == retries:
+                return response
+            await response.aclose()
+
+    def breaker_stats(self) -> dict:
+        return {upstream: breaker.stats() for upstream, breaker in self.breakers.items()}
+
+    def stats(self) -> dict:
+        return {
+            "eet": pool_stats(self.eet),
+            "google": pool_stats(self.google),
+            "limits": {
+                "max_connections": HTTP_MAX_CONNECTIONS,
+                "max_keepalive_connections": HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            },
+        }
+
+    async def aclose(self):
+        await self.eet.aclose()
+        await self.google.aclose()
+
+# Headers expected by the CableGuide endpoints
+CABLE_GUIDE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:145.0) Gecko/20100101 Firefox/145.0',
+    'Accept': 'application/json, text/plain, */*',
+    'Accept-Encoding': 'identity',
+    'Content-Type': 'application/json',
+    'x-eet-culture': 'en-zz',
+    'x-eet-businessentityid': '9',
+    'x-eet-marketid': '1006',
+    'x-eet-siteid': '23',
+}
+
+# Connector catalog served when the CableGuide API has not been reached yet
+DEFAULT_CABLE_ENDS_A = [
+    "2.5mm Female", "2.5mm Male", "3.5mm Female", "3.5mm Male", "6.35mm Female", "6.35mm Male",
+    "Power Type I - Australia Male", "BNC Female", "BNC Male", "Power Type N - Brazil Female",
+    "Power Type N - Brazil Male", "Power Type C13 Female", "Power Type C14 Male",
+    "Power Type C15 Female", "Power Type C19 Female", "Power Type C20 Male", "C21 coupler Female",
+    "Power Type C5 Female", "Power Type C7 Female", "DB25 Female", "DB25 Male", "DB9 Female",
+    "DB9 Male", "Power Type K - Denmark Female", "Power Type K - Denmark Male",
+    "Powerstrip Type K - Denmark", "DisplayPort Female", "DisplayPort Male", "DVI-D Female",
+    "DVI-D Male", "DVI-I Female", "DVI-I Male", "E2000 Male", "Power Type C - EU Male", "FC Male",
+    "Powerstrip Type E - French", "HDMI Female", "HDMI Male", "HDMI Micro Male",
+    "HDMI Mini Female", "HDMI Mini Male", "IEC Female", "IEC Male", "Power Type D - India Male",
+    "Power Type L - Italy Male", "LC Female", "LC Male", "Lightning Female", "Lightning Male",
+    "Mini DisplayPort Female", "Mini DisplayPort Male", "MPO/MTP Female", "MPO/MTP Male",
+    "MTRJ Male", "MU/UPC Male", "Multi Male", "Open End", "PS/2 Female", "PS/2 Male", "QSFP+ Male",
+    "RCA Female", "RCA Male", "RJ11 Female", "RJ11 Male", "RJ12 Male", "RJ45 Female", "RJ45 Male",
+    "RP-SMA Female", "RP-SMA Male", "SATA 15-pin Female", "SATA 15-pin Male", "SATA 7-pin Female",
+    "SATA 7-pin Male", "SC Female", "SC Male", "Power Type E/F - Schuko Female",
+    "Power Type E/F - Schuko Male", "Powerstrip Type F - Schuko", "SFF Male", "SFP Male",
+    "Power Type M - South Africa Male", "Speaker Raw Cable Male", "ST Male", "ST/UPC Male",
+    "Power Type J - Switzerland Female", "Power Type J - Switzerland Male", "Thunderbolt Male",
+    "TOSLINK Male", "Power Type G - UK Male", "Powerstrip Type G - UK", "Power Type A - USA Male",
+    "Power Type B - USA Male", "USB A Female", "USB A Male", "USB B Female", "USB B Male",
+    "USB C Female", "USB C Male", "USB Micro A Male", "USB Micro B Female", "USB Micro B Male",
+    "USB Mini B Male", "VGA Female", "VGA Male", "XLR (3-pin) Female", "XLR (3-pin) Male",
+]
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers asking for the same key."""
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run fn() for key unless a call for the same key is already running.
+
+        The shared call is shielded, so a cancelled caller does not cancel it
+        for the others.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception as retrieved when every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+class CatalogEntry(NamedTuple):
+    values: list[str]
+    fetched_at: float
+
+# CableGuide payload, validated straight from the response bytes; other fields are skipped
+class CableType(BaseModel):
+    id: str | None = None
+
+class CableTypeList(BaseModel):
+    cableTypes: list[CableType] = []
+
+class CableGuideReply(BaseModel):
+    model: CableTypeList | None = None
+
+def parse_cable_types(content: bytes) -> list[str]:
+    """Extract connector IDs from a CableGuide response body."""
+    reply = CableGuideReply.model_validate_json(content)
+    if reply.model is None:
+        return []
+    return [item.id for item in reply.model.cableTypes if item.id is not None]
+
+class CatalogSnapshot:
+    """
+    Read-only, memory-mapped catalog snapshot shared by all workers on a host.
+
+    Layout, in native byte order as the file never leaves the host: a header
+    (magic, version, created_at as Unix time, name count, A-end count), then
+    uint32 arrays: name offsets into the UTF-8 name blob, the name index of
+    each A end, a flag per A end telling whether its B ends are known, CSR
+    offsets into the B-end array and the name index of each B end; then the
+    blob. Pages are shared through the page cache; each process decodes the
+    names once and a B list only when it is first asked for.
+    """
+
+    MAGIC = b"EETCAT01"
+    HEADER = struct.Struct("=8sQdII")
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.file_id = (stat.st_ino, stat.st_mtime_ns)
+        try:
+            magic, self.version, self.created_at, n_names, n_a = self.HEADER.unpack_from(self._mmap)
+            if magic != self.MAGIC:
+                raise ValueError(f"Not a catalog snapshot: {path}")
+            offset = self.HEADER.size
+            name_offsets, a_names, self._b_known, self._b_offsets = [], [], [], []
+            for values, size in ((name_offsets, n_names + 1), (a_names, n_a), (self._b_known, n_a), (self._b_offsets, n_a + 1)):
+                values.extend(self._uint32s(offset, size))
+                offset += 4 * size
+            self._b_names_at = offset
+            blob = self._mmap[offset + 4 * self._b_offsets[-1]:]
+            self.names = [blob[name_offsets[i]:name_offsets[i + 1]].decode() for i in range(n_names)]
+            self.ends_a = [self.names[i] for i in a_names]
+        except Exception:
+            self._mmap.close()
+            raise
+
+    def _uint32s(self, offset: int, count: int) -> array.array:
+        values = array.array("I")
+        values.frombytes(self._mmap[offset:offset + 4 * count])
+        return values
+
+    def ends_b_at(self, index: int) -> list[str] | None:
+        """B ends of the index-th A end, None if the snapshot does not know them."""
+        if not self._b_known[index]:
+            return None
+        start, end = self._b_offsets[index], self._b_offsets[index + 1]
+        return [self.names[i] for i in self._uint32s(self._b_names_at + 4 * start, end - start)]
+
+    def close(self):
+        self._mmap.close()
+
+    @classmethod
+    def write(cls, path: str, version: int, ends_a: list[str], ends_b: dict[str, list[str]]):
+        """
+        Write a snapshot and atomically replace the one at path.
+
+        Readers keep their mapping of the old file until they reopen, so a
+        swap never shows them a half-written snapshot.
+
+        Args:
+            version: Snapshot version, one more than the one replaced
+            ends_a: A ends in CableGuide order
+            ends_b: Known B ends by A end name
+        """
+        names = list(dict.fromkeys([*ends_a, *(name for values in ends_b.values() for name in values)]))
+        position = {name: i for i, name in enumerate(names)}
+        encoded = [name.encode() for name in names]
+        name_offsets = array.array("I", [0])
+        for data in encoded:
+            name_offsets.append(name_offsets[-1] + len(data))
+        b_known = array.array("I", (name in ends_b for name in ends_a))
+        b_offsets = array.array("I", [0])
+        b_names = array.array("I")
+        for name in ends_a:
+            b_names.extend(position[b] for b in ends_b.get(name, []))
+            b_offsets.append(len(b_names))
+        a_names = array.array("I", (position[name] for name in ends_a))
+
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".catalog_snapshot.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(cls.HEADER.pack(cls.MAGIC, version, time.time(), len(names), len(ends_a)))
+                for values in (name_offsets, a_names, b_known, b_offsets, b_names):
+                    values.tofile(f)
+                f.write(b"".join(encoded))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+class ConnectorCatalog:
+    """
+    In-memory CableGuide catalog with TTL and stale-while-revalidate.
+
+    Entries younger than CATALOG_TTL are served directly. Older entries are
+    served for up to CATALOG_STALE_TTL more while a single background request
+    revalidates them. Concurrent misses for the same connector share one
+    upstream request, and a background refresher rebuilds the full A->B map.
+
+    With CATALOG_SNAPSHOT_PATH set, the map is also persisted as a shared
+    CatalogSnapshot: workers start from it without network access, one
+    process per host (holding a file lock) refreshes and writes new
+    versions, and the others pick them up every CATALOG_SNAPSHOT_POLL seconds.
+    """
+
+    def __init__(self, http: UpstreamClients):
+        self.http = http
+        # Seed with the bundled list, marked stale so the first read revalidates it
+        self._ends_a = CatalogEntry(DEFAULT_CABLE_ENDS_A, time.monotonic() - CATALOG_TTL)
+        self._canonical = {self.key(name): name for name in DEFAULT_CABLE_ENDS_A}
+        self._ends_b: dict[str, CatalogEntry] = {}
+        self._flight = SingleFlight()
+        self._refresher: asyncio.Task | None = None
+        self._index: "ConnectorIndex | None" = None
+        self._b_indexes: "dict[int, ConnectorIndex]" = {}
+        self.snapshot: CatalogSnapshot | None = None
+        self._snapshot_fetched_at = 0.0
+        self._snapshot_index: dict[str, int] = {}
+        self._writer_lock = None
+        self.counters = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "fallbacks": 0,
+            "upstream_fetches": 0,
+            "upstream_errors": 0,
+            "refreshes": 0,
+            "snapshot_loads": 0,
+            "snapshot_hits": 0,
+            "snapshot_writes": 0,
+        }
+        self.last_refresh: float | None = None
+
+    @staticmethod
+    def key(name: str) -> str:
+        """Cache key for a connector name: whitespace collapsed, case folded."""
+        return " ".join(name.split()).casefold()
+
+    def canonical(self, name: str) -> str:
+        """Return the catalog spelling of name, or name itself if unknown."""
+        return self._canonical.get(self.key(name), name.strip())
+
+    def index(self, names: list[str] | None = None) -> "ConnectorIndex":
+        """
+        Similarity index over a catalog list, built once per list.
+
+        Args:
+            names: A B-end list as returned by get_ends_b; the current A ends by default
+        """
+        if names is None:
+            if self._index is None or self._index.names is not self._ends_a.values:
+                self._index = ConnectorIndex(self._ends_a.values)
+            return self._index
+        # Keyed by identity: cached lists are replaced, never mutated, on refresh
+        index = self._b_indexes.get(id(names))
+        if index is None or index.names is not names:
+            if len(self._b_indexes) >= 2 * len(self._ends_a.values):
+                self._b_indexes.clear()
+            index = self._b_indexes[id(names)] = ConnectorIndex(names)
+        return index
+
+    def taxonomy(self) -> "ConnectorTaxonomy":
+        """Parsed standard/variant/gender view of the current A ends."""
+        return self.index().taxonomy
+
+    def _ends_b_entry(self, key: str) -> CatalogEntry | None:
+        """The in-memory B entry for key, or the snapshot's if that is newer."""
+        entry = self._ends_b.get(key)
+        index = self._snapshot_index.get(key)
+        if index is not None and (entry is None or entry.fetched_at < self._snapshot_fetched_at):
+            values = self.snapshot.ends_b_at(index)
+            if values is not None:
+                entry = CatalogEntry(values, self._snapshot_fetched_at)
+                self._ends_b[key] = entry
+                self.counters["snapshot_hits"] += 1
+        return entry
+
+    async def get_ends_a(self) -> list[str]:
+        try:
+            return await self._cached(("a",), self._ends_a, self._fetch_ends_a)
+        except Exception as e:
+            logger.warning("CableGuide A lookup failed, serving last known catalog", error=str(e))
+            return self._ends_a.values
+
+    async def get_ends_b(self, cable_end_a: str) -> list[str]:
+        cable_end_a = self.canonical(cable_end_a)
+        key = self.key(cable_end_a)
+        try:
+            return await self._cached(("b", key), self._ends_b_entry(key), lambda: self._fetch_ends_b(cable_end_a))
+        except Exception as e:
+            logger.warning("CableGuide B lookup failed", cable_end_a=cable_end_a, error=str(e))
+            return []
+
+    async def _cached(self, key: tuple, entry: CatalogEntry | None, fetch: Callable[[], Awaitable[list[str]]]) -> list[str]:
+        if entry is not None:
+            age = time.monotonic() - entry.fetched_at
+            if age < CATALOG_TTL:
+                self.counters["hits"] += 1
+                return entry.values
+            # Past the stale window too, but the upstream is down: last known data beats none
+            if age < CATALOG_TTL + CATALOG_STALE_TTL or not self.http.available("eet"):
+                self.counters["stale_hits"] += 1
+                if not self._flight.in_flight(key) and self.http.available("eet"):
+                    asyncio.ensure_future(self._revalidate(key, fetch))
+                return entry.values
+        self.counters["misses"] += 1
+        try:
+            return await self._flight.do(key, fetch)
+        except Exception as e:
+            if entry is None:
+                raise
+            self.counters["fallbacks"] += 1
+            logger.warning("CableGuide lookup failed, serving expired entry", key=key, error=str(e))
+            return entry.values
+
+    async def _revalidate(self, key: tuple, fetch: Callable[[], Awaitable[list[str]]]):
+        try:
+            await self._flight.do(key, fetch)
+        except Exception as e:
+            logger.warning("CableGuide revalidation failed", key=key, error=str(e))
+
+    async def _fetch(self, url: str) -> list[str]:
+        self.counters["upstream_fetches"] += 1
+        try:
+            response = await self.http.get("eet", url, headers=CABLE_GUIDE_HEADERS)
+            response.raise_for_status()
+            return parse_cable_types(response.content)
+        except Exception:
+            self.counters["upstream_errors"] += 1
+            raise
+
+    async def _fetch_ends_a(self) -> list[str]:
+        values = await self._fetch('/api/CableGuide/GetCableEndTypesA')
+        if values:
+            self._ends_a = CatalogEntry(values, time.monotonic())
+            self._canonical = {self.key(name): name for name in values}
+        return values or self._ends_a.values
+
+    async def _fetch_ends_b(self, cable_end_a: str) -> list[str]:
+        # Encode the whole name so "/", "(" and spaces survive, e.g. "MPO/MTP Male"
+        values = await self._fetch(f'/api/CableGuide/GetCableEndTypesB?cableEndTypeA={quote(cable_end_a, safe="")}')
+        self._ends_b[self.key(cable_end_a)] = CatalogEntry(values, time.monotonic())
+        return values
+
+    async def refresh(self):
+        """Rebuild the full A->B compatibility map from the CableGuide API."""
+        ends_a = await self._flight.do(("a",), self._fetch_ends_a)
+        semaphore = asyncio.Semaphore(CATALOG_REFRESH_CONCURRENCY)
+
+        async def fetch_b(cable_end_a: str) -> list[str]:
+            async with semaphore:
+                return await self._flight.do(("b", self.key(cable_end_a)), lambda: self._fetch_ends_b(cable_end_a))
+
+        results = await asyncio.gather(*(fetch_b(name) for name in ends_a), return_exceptions=True)
+        failed = sum(1 for result in results if isinstance(result, BaseException))
+        self.counters["refreshes"] += 1
+        self.last_refresh = time.time()
+        logger.info("Connector catalog refreshed", ends_a=len(ends_a), failed_b_lookups=failed)
+
+    def load_snapshot(self) -> bool:
+        """
+        Map the snapshot at CATALOG_SNAPSHOT_PATH if it changed since the last load.
+
+        Returns:
+            True if a new snapshot was loaded
+        """
+        try:
+            stat = os.stat(CATALOG_SNAPSHOT_PATH)
+        except FileNotFoundError:
+            return False
+        if self.snapshot is not None and self.snapshot.file_id == (stat.st_ino, stat.st_mtime_ns):
+            return False
+        try:
+            snapshot = CatalogSnapshot(CATALOG_SNAPSHOT_PATH)
+        except Exception as e:
+            logger.warning("Catalog snapshot unreadable", path=CATALOG_SNAPSHOT_PATH, error=str(e))
+            return False
+        if self.snapshot is not None:
+            self.snapshot.close()
+        self.snapshot = snapshot
+        # On the monotonic clock of the in-memory entries, so the TTLs apply to snapshot data as is
+        self._snapshot_fetched_at = time.monotonic() - max(0.0, time.time() - snapshot.created_at)
+        self._snapshot_index = {self.key(name): i for i, name in enumerate(snapshot.ends_a)}
+        if snapshot.ends_a and self._snapshot_fetched_at > self._ends_a.fetched_at:
+            self._ends_a = CatalogEntry(snapshot.ends_a, self._snapshot_fetched_at)
+            self._canonical = {self.key(name): name for name in snapshot.ends_a}
+        self.counters["snapshot_loads"] += 1
+        logger.info("Catalog snapshot loaded", version=snapshot.version, ends_a=len(snapshot.ends_a), age=round(self.snapshot_age()))
+        return True
+
+    def snapshot_age(self) -> float | None:
+        return None if self.snapshot is None else max(0.0, time.time() - self.snapshot.created_at)
+
+    async def write_snapshot(self):
+        """Persist the current catalog as the next snapshot version and map it."""
+        ends_b = {}
+        for name in self._ends_a.values:
+            entry = self._ends_b_entry(self.key(name))
+            if entry is not None:
+                ends_b[name] = entry.values
+        version = (self.snapshot.version if self.snapshot else 0) + 1
+        await asyncio.to_thread(CatalogSnapshot.write, CATALOG_SNAPSHOT_PATH, version, self._ends_a.values, ends_b)
+        self.counters["snapshot_writes"] += 1
+        self.load_snapshot()
+
+    def _lead(self) -> bool:
+        """Become the host's snapshot writer unless another process already is."""
+        if self._writer_lock is not None:
+            return True
+        lock = open(CATALOG_SNAPSHOT_PATH + ".lock", "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock.close()
+                return False
+        # The lock is released when this process exits, and the next poller takes over
+        self._writer_lock = lock
+        logger.info("Catalog snapshot writer elected", pid=os.getpid())
+        return True
+
+    async def _refresh_loop(self):
+        while True:
+            delay = CATALOG_REFRESH_INTERVAL
+            try:
+                if not CATALOG_SNAPSHOT_PATH:
+                    await self.refresh()
+                elif self._lead():
+                    # Refresh only once the shared snapshot is due, not on every worker boot
+                    age = self.snapshot_age()
+                    if age is None or age >= CATALOG_REFRESH_INTERVAL:
+                        await self.refresh()
+                        await self.write_snapshot()
+                    else:
+                        delay = CATALOG_REFRESH_INTERVAL - age
+                else:
+                    self.load_snapshot()
+                    delay = CATALOG_SNAPSHOT_POLL
+            except Exception as e:
+                logger.warning("Connector catalog refresh failed", error=str(e))
+            await asyncio.sleep(delay)
+
+    def start(self):
+        if CATALOG_SNAPSHOT_PATH:
+            self.load_snapshot()
+        if CATALOG_REFRESH_INTERVAL > 0:
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+        if self._writer_lock is not None:
+            self._writer_lock.close()
+            self._writer_lock = None
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+            self._snapshot_index = {}
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "ends_a": len(self._ends_a.values),
+            "ends_b_cached": len(self._ends_b),
+            "last_refresh": self.last_refresh,
+            "snapshot_version": self.snapshot.version if self.snapshot else None,
+            "snapshot_age": self.snapshot_age(),
+            "snapshot_writer": self._writer_lock is not None,
+        }
+
+# Words describing what is wanted rather than which product it is for
+PRODUCT_QUERY_STOPWORDS = {
+    "cable", "cables", "connector", "connectors", "connection", "connections",
+    "charger", "charging", "charge", "cord", "adapter", "adaptor", "port", "ports",
+    "plug", "lead", "what", "which", "does", "do", "use", "uses", "for", "the",
+    "a", "an", "of", "to", "my", "i", "need", "with", "and",
+}
+
+def product_tokens(product_query: str) -> list[str]:
+    """
+    Reduce a product query to the tokens that identify the product.
+
+    Letter/digit runs are split so "iphone15" and "iPhone 15" agree, and
+    generic words such as "cable" or "charger" are dropped.
+
+    Example: "iphone15 pro charger" -> ["15", "iphone", "pro"]
+    """
+    text = normalize_query(product_query)
+    text = re.sub(r'(?<=[^\W\d])(?=\d)|(?<=\d)(?=[^\W\d])', " ", text)
+    return sorted({token for token in re.findall(r'\w+', text) if token not in PRODUCT_QUERY_STOPWORDS})
+
+class QuotaGrant(NamedTuple):
+    granted: bool
+    used: int     # calls spent today, including this one when granted
+    wait: float   # seconds to wait before making the call
+
+class ProductKnowledgeStore:
+    """
+    Persistent product -> connector store backed by SQLite with FTS5.
+
+    Each successful Google lookup is stored under the product's identifying
+    tokens. Lookups first try the exact token key, then an FTS5 search whose
+    candidates must reach PRODUCT_STORE_MIN_SIMILARITY (token Jaccard), so
+    "iphone15 pro charger" finds "iPhone 15 Pro cable connectors". Without
+    FTS5 support the candidates come from a plain table scan.
+
+    Other workers write to the same file, so every call is best-effort: a
+    lookup that fails is a miss and a store that fails is skipped. Lookups
+    only read; their hit counts are written with the next store, in one
+    statement.
+    """
+
+    # Pending hit counts flushed by put() once this many entries were hit
+    HIT_FLUSH_BATCH = 20
+
+    def __init__(self, path: str = PRODUCT_STORE_PATH, ttl: float = PRODUCT_STORE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS products (
+                id INTEGER PRIMARY KEY,
+                product_key TEXT NOT NULL UNIQUE,
+                query TEXT NOT NULL,
+                connector_types TEXT NOT NULL,
+                snippets TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )"""
+        )
+        # Quotas shared by every worker using this file, see take_quota()
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS quotas (
+                name TEXT PRIMARY KEY,
+                day TEXT NOT NULL,
+                used INTEGER NOT NULL,
+                next_at REAL NOT NULL
+            )"""
+        )
+        try:
+            self._db.executescript(
+                """CREATE VIRTUAL TABLE IF NOT EXISTS products_fts
+                    USING fts5(product_key, content='products', content_rowid='id');
+                CREATE TRIGGER IF NOT EXISTS products_ai AFTER INSERT ON products BEGIN
+                    INSERT INTO products_fts(rowid, product_key) VALUES (new.id, new.product_key);
+                END;
+                CREATE TRIGGER IF NOT EXISTS products_ad AFTER DELETE ON products BEGIN
+                    INSERT INTO products_fts(products_fts, rowid, product_key) VALUES ('delete', old.id, old.product_key);
+                END;
+                CREATE TRIGGER IF NOT EXISTS products_au AFTER UPDATE OF product_key ON products BEGIN
+                    INSERT INTO products_fts(products_fts, rowid, product_key) VALUES ('delete', old.id, old.product_key);
+                    INSERT INTO products_fts(rowid, product_key) VALUES (new.id, new.product_key);
+                END;"""
+            )
+            self.fts = True
+        except sqlite3.OperationalError as e:
+            logger.warning("SQLite FTS5 unavailable, product lookups fall back to a table scan", error=str(e))
+            self.fts = False
+        self._pending_hits: dict[int, int] = {}
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "errors": 0}
+
+    def lookup(self, product_query: str, include_expired: bool = False) -> dict | None:
+        """
+        Find stored connector data for a product query. Blocks on SQLite, call it in a thread.
+
+        Returns:
+            dict with "query", "connector_types", "snippets", "similarity" and
+            "expired", or None when nothing similar enough is stored or the
+            store could not be read
+        """
+        tokens = product_tokens(product_query)
+        if not tokens:
+            return None
+        now = time.time()
+        with self._lock:
+            try:
+                row = self._db.execute("SELECT * FROM products WHERE product_key = ?", (" ".join(tokens),)).fetchone()
+                similarity = 1.0
+                if row is None or (row["expires_at"] <= now and not include_expired):
+                    row, similarity = self._fuzzy_match(tokens, now, include_expired)
+            except sqlite3.Error as e:
+                self.counters["errors"] += 1
+                logger.warning("Product store lookup failed", product_query=clip(product_query), error=str(e))
+                return None
+            if row is None:
+                self.counters["misses"] += 1
+                return None
+            self._pending_hits[row["id"]] = self._pending_hits.get(row["id"], 0) + 1
+        self.counters["hits"] += 1
+        return {
+            "query": row["query"],
+            "connector_types": json.loads(row["connector_types"]),
+            "snippets": json.loads(row["snippets"]),
+            "similarity": similarity,
+            "expired": row["expires_at"] <= now,
+        }
+
+    def _fuzzy_match(self, tokens: list[str], now: float, include_expired: bool) -> tuple[sqlite3.Row | None, float]:
+        expiry_filter = "" if include_expired else " AND p.expires_at > :now"
+        if self.fts:
+            rows = self._db.execute(
+                "SELECT p.* FROM products_fts JOIN products p ON p.id = products_fts.rowid "
+                "WHERE products_fts MATCH :match" + expiry_filter + " ORDER BY products_fts.rank LIMIT 20",
+                {"match": " OR ".join(f'"{token}"' for token in tokens), "now": now},
+            ).fetchall()
+        else:
+            rows = self._db.execute("SELECT p.* FROM products p WHERE 1" + expiry_filter, {"now": now}).fetchall()
+
+        query_tokens = set(tokens)
+        best, best_similarity = None, 0.0
+        for row in rows:
+            row_tokens = set(row["product_key"].split())
+            similarity = len(query_tokens & row_tokens) / len(query_tokens | row_tokens)
+            if similarity > best_similarity:
+                best, best_similarity = row, similarity
+        if best_similarity < PRODUCT_STORE_MIN_SIMILARITY:
+            return None, 0.0
+        return best, best_similarity
+
+    def put(self, product_query: str, connector_types: list[str], snippets: list[str]):
+        """Store a product's connector data. Blocks on SQLite, call it in a thread."""
+        tokens = product_tokens(product_query)
+        if not tokens:
+            return
+        now = time.time()
+        with self._lock:
+            try:
+                self._db.execute(
+                    """INSERT INTO products (product_key, query, connector_types, snippets, created_at, expires_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(product_key) DO UPDATE SET
+                        query = excluded.query,
+                        connector_types = excluded.connector_types,
+                        snippets = excluded.snippets,
+                        created_at = excluded.created_at,
+                        expires_at = excluded.expires_at""",
+                    (" ".join(tokens), product_query, json.dumps(connector_types), json.dumps(snippets), now, now + self.ttl),
+                )
+            except sqlite3.Error as e:
+                self.counters["errors"] += 1
+                logger.warning("Product store write failed", product_query=clip(product_query), error=str(e))
+                return
+            if len(self._pending_hits) >= self.HIT_FLUSH_BATCH:
+                self._flush_hits()
+        self.counters["stores"] += 1
+
+    def _flush_hits(self):
+        """Write the pending hit counts; they are dropped if the write fails. Call with the lock held."""
+        pending, self._pending_hits = self._pending_hits, {}
+        try:
+            self._db.executemany("UPDATE products SET hits = hits + ? WHERE id = ?", [(hits, entry_id) for entry_id, hits in pending.items()])
+        except sqlite3.Error as e:
+            self.counters["errors"] += 1
+            logger.warning("Product store hit counts not written", entries=len(pending), error=str(e))
+
+    def take_quota(self, name: str, day: str, daily_quota: int, interval: float, burst: float, max_wait: float) -> QuotaGrant | None:
+        """
+        Reserve one call from a quota shared by every worker using this file. Blocks on SQLite, call it in a thread.
+
+        The daily count starts over when day changes. The rate is a GCRA:
+        calls are spaced interval seconds apart, with room for burst calls
+        at once.
+
+        Returns:
+            QuotaGrant, or None when the shared quota could not be read
+        """
+        now = time.time()
+        with self._lock:
+            try:
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    row = self._db.execute("SELECT day, used, next_at FROM quotas WHERE name = ?", (name,)).fetchone()
+                    used, next_at = (row["used"], row["next_at"]) if row is not None and row["day"] == day else (0, 0.0)
+                    next_at = max(next_at, now)
+                    wait = max(0.0, next_at - (burst - 1) * interval - now)
+                    if used >= daily_quota or wait > max_wait:
+                        return QuotaGrant(False, used, wait)
+                    self._db.execute(
+                        "INSERT INTO quotas (name, day, used, next_at) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT(name) DO UPDATE SET day = excluded.day, used = excluded.used, next_at = excluded.next_at",
+                        (name, day, used + 1, next_at + interval),
+                    )
+                    return QuotaGrant(True, used + 1, wait)
+                finally:
+                    self._db.execute("COMMIT")
+            except sqlite3.Error as e:
+                self.counters["errors"] += 1
+                logger.warning("Shared quota not available", quota=name, error=str(e))
+                return None
+
+    def quota_used(self, name: str, day: str) -> int | None:
+        """Calls spent today from a shared quota, or None when it could not be read."""
+        with self._lock:
+            try:
+                row = self._db.execute("SELECT day, used FROM quotas WHERE name = ?", (name,)).fetchone()
+            except sqlite3.Error as e:
+                self.counters["errors"] += 1
+                logger.warning("Shared quota not available", quota=name, error=str(e))
+                return None
+        return row["used"] if row is not None and row["day"] == day else 0
+
+    def spend_quota(self, name: str, day: str, used: int):
+        """Mark a shared quota as used up to used today, e.g. after the upstream answered 429. Blocks on SQLite."""
+        with self._lock:
+            try:
+                self._db.execute(
+                    "INSERT INTO quotas (name, day, used, next_at) VALUES (?, ?, ?, 0) "
+                    "ON CONFLICT(name) DO UPDATE SET used = MAX(CASE WHEN day = excluded.day THEN used ELSE 0 END, excluded.used), day = excluded.day",
+                    (name, day, used),
+                )
+            except sqlite3.Error as e:
+                self.counters["errors"] += 1
+                logger.warning("Shared quota not written", quota=name, error=str(e))
+
+    def entries(self, search: str | None = None, limit: int = 50) -> list[dict]:
+        """List stored entries, newest first, optionally filtered by product tokens."""
+        tokens = product_tokens(search) if search else []
+        sql = "SELECT * FROM products"
+        if tokens:
+            sql += " WHERE " + " AND ".join("product_key LIKE ?" for _ in tokens)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        params = [f"%{token}%" for token in tokens] + [limit]
+        now = time.time()
+        with self._lock:
+            self._flush_hits()
+            rows = self._db.execute(sql, params).fetchall()
+        return [
+            {
+                "id": row["id"],
+                "product_key": row["product_key"],
+                "query": row["query"],
+                "connector_types": json.loads(row["connector_types"]),
+                "snippets": json.loads(row["snippets"]),
+                "created_at": row["created_at"],
+                "expires_at": row["expires_at"],
+                "expired": row["expires_at"] <= now,
+                "hits": row["hits"],
+            }
+            for row in rows
+        ]
+
+    def delete(self, entry_id: int) -> bool:
+        with self._lock:
+            return self._db.execute("DELETE FROM products WHERE id = ?", (entry_id,)).rowcount > 0
+
+    def purge(self, expired_only: bool = True, older_than: float = 0.0) -> int:
+        """
+        Delete entries; by default only those expired more than older_than seconds ago.
+
+        Returns:
+            Number of deleted entries
+        """
+        with self._lock:
+            if expired_only:
+                return self._db.execute("DELETE FROM products WHERE expires_at <= ?", (time.time() - older_than,)).rowcount
+            return self._db.execute("DELETE FROM products").rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+        return {**self.counters, "entries": entries, "fts": self.fts}
+
+    def close(self):
+        with self._lock:
+            self._flush_hits()
+            self._db.close()
+
+class QuotaExhausted(Exception):
+    """Raised when a Google Custom Search call would exceed the local quota budget."""
+
+    def __init__(self, remaining: dict):
+        super().__init__("Google Custom Search quota exhausted")
+        self.remaining = remaining
+
+class QuotaLimiter:
+    """
+    Per-second rate limit plus a daily query budget, shared by every worker.
+
+    Both are kept in the SQLite product store, which all workers on the host
+    open, so N workers together stay within CSE_DAILY_QUOTA and
+    CSE_QUERIES_PER_SECOND and a restart does not reset the day's count.
+    The daily budget resets at midnight Pacific time, like Google's quota.
+    Callers wait at most max_wait for their turn and otherwise fail fast, as
+    they do once the daily budget is spent or the shared count cannot be
+    read. remaining() reports the count this worker saw last.
+    """
+
+    NAME = "google_cse"
+
+    def __init__(self, store: ProductKnowledgeStore, daily_quota: int, per_second: float, max_wait: float):
+        self.store = store
+        self.daily_quota = daily_quota
+        self.per_second = per_second
+        self.max_wait = max_wait
+        self._burst = max(per_second, 1.0)
+        self._day = self._quota_day()
+        self._used = store.quota_used(self.NAME, self._day.isoformat()) or 0
+        self.counters = {"acquired": 0, "rejected_daily": 0, "rejected_rate": 0, "rejected_unavailable": 0}
+
+    @staticmethod
+    def _quota_day():
+        return datetime.now(ZoneInfo("America/Los_Angeles")).date()
+
+    def _roll_day(self):
+        today = self._quota_day()
+        if today != self._day:
+            self._day = today
+            self._used = 0
+
+    def exhausted(self) -> bool:
+        self._roll_day()
+        return self._used >= self.daily_quota
+
+    async def exhaust(self):
+        """Spend the rest of today's budget, e.g. after Google answered 429."""
+        self._roll_day()
+        self._used = self.daily_quota
+        await asyncio.to_thread(self.store.spend_quota, self.NAME, self._day.isoformat(), self.daily_quota)
+
+    async def acquire(self) -> bool:
+        """Take one query from the shared budget, waiting briefly for the rate limit."""
+        if self.exhausted():
+            self.counters["rejected_daily"] += 1
+            return False
+        grant = await asyncio.to_thread(
+            self.store.take_quota, self.NAME, self._day.isoformat(), self.daily_quota, 1 / self.per_second, self._burst, self.max_wait,
+        )
+        if grant is None:
+            self.counters["rejected_unavailable"] += 1
+            return False
+        self._used = grant.used
+        if not grant.granted:
+            self.counters["rejected_daily" if grant.used >= self.daily_quota else "rejected_rate"] += 1
+            return False
+        self.counters["acquired"] += 1
+        if grant.wait:
+            await asyncio.sleep(grant.wait)
+        return True
+
+    def remaining(self) -> dict:
+        self._roll_day()
+        resets_at = datetime.combine(self._day + timedelta(days=1), datetime.min.time(), ZoneInfo("America/Los_Angeles"))
+        return {
+            "daily_remaining": max(0, self.daily_quota - self._used),
+            "daily_quota": self.daily_quota,
+            "resets_at": resets_at.isoformat(),
+        }
+
+class GoogleSearch:
+    """
+    Rate-limited, coalescing access to Google Custom Search for product lookups.
+
+    Identical in-flight product queries (same identifying tokens) share one
+    request; the result is extracted once and written to the product store.
+    """
+
+    def __init__(self, http: UpstreamClients, product_store: ProductKnowledgeStore):
+        self.http = http
+        self.product_store = product_store
+        self.quota = QuotaLimiter(product_store, CSE_DAILY_QUOTA, CSE_QUERIES_PER_SECOND, CSE_MAX_QUEUE_WAIT)
+        self._flight = SingleFlight()
+        self.counters = {"requests": 0, "coalesced": 0}
+
+    @staticmethod
+    def configured() -> bool:
+        return bool(GOOGLE_API_KEY and GOOGLE_CSE_ID)
+
+    async def search(self, product_query: str) -> dict:
+        """
+        Look up a product on Google and extract its connector types.
+
+        Returns:
+            dict with "connector_types" and "snippets"
+
+        Raises:
+            QuotaExhausted: when the local budget does not allow another query
+            CircuitOpen: while Google is failing
+            httpx.HTTPError: when the request to Google fails
+        """
+        key = " ".join(product_tokens(product_query)) or normalize_query(product_query)
+        if self._flight.in_flight(key):
+            self.counters["coalesced"] += 1
+        return await self._flight.do(key, lambda: self._request(product_query))
+
+    async def _request(self, product_query: str) -> dict:
+        # Don't spend quota on a call the circuit breaker would reject
+        if not self.http.available("google"):
+            raise CircuitOpen("google")
+        if not await self.quota.acquire():
+            raise QuotaExhausted(self.quota.remaining())
+
+        # Build Google Custom Search API request
+        params = {
+            "key": GOOGLE_API_KEY,
+            "cx": GOOGLE_CSE_ID,
+            "q": product_query,
+            "num": 5  # Fetch top 5 results for better connector extraction
+        }
+        self.counters["requests"] += 1
+        # No retries: every attempt is billed against the CSE quota
+        response = await self.http.get("google", "/customsearch/v1", retries=0, params=params)
+        if response.status_code == 429:
+            await self.quota.exhaust()
+        response.raise_for_status()
+        reply = CustomSearchReply.model_validate_json(response.content)
+
+        # Extract connector types from search results
+        connector_types = extract_connector_types(reply)
+
+        # Get top 3 snippets for agent context
+        snippets = [item.snippet for item in reply.items[:3] if item.snippet is not None]
+
+        if connector_types:
+            await asyncio.to_thread(self.product_store.put, product_query, connector_types, snippets)
+        return {"connector_types": connector_types, "snippets": snippets}
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            **self.quota.counters,
+            **self.quota.remaining(),
+        }
+
+class OrderCacheEntry(NamedTuple):
+    processed: "ProcessedOrder"
+    etag: str | None
+    last_modified: str | None
+    fetched_at: float
+
+class OrderStatusCache:
+    """
+    Short-TTL cache of processed order status per customer and order.
+
+    Entries younger than ORDER_CACHE_TTL are served directly. Older entries
+    are revalidated with If-None-Match / If-Modified-Since when the upstream
+    sent an ETag or Last-Modified, so an unchanged order costs a 304 and no
+    reprocessing. Concurrent identical lookups share one upstream call.
+    """
+
+    def __init__(self, http: UpstreamClients):
+        self.http = http
+        self._entries: OrderedDict[tuple, OrderCacheEntry] = OrderedDict()
+        self._flight = SingleFlight()
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "not_modified": 0, "upstream_requests": 0}
+
+    @staticmethod
+    def key(deps: "AgentDependencies", order_id: str | None) -> tuple:
+        return (deps["customer_id"], deps["erp_business_entity_id"], deps["language"], order_id or "latest")
+
+    async def get(self, deps: "AgentDependencies", order_id: str | None) -> "ProcessedOrder":
+        """
+        Return processed order data, fetching or revalidating it when stale.
+
+        Args:
+            deps: Request dependencies with customer_id, language and erp_business_entity_id
+            order_id: Order to look up, or None for the customer's latest order
+
+        Raises:
+            CircuitOpen: while the order status API is failing
+            httpx.HTTPError: when the order status API fails
+        """
+        key = self.key(deps, order_id)
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry.fetched_at < ORDER_CACHE_TTL:
+            self.counters["hits"] += 1
+            self._entries.move_to_end(key)
+            return entry.processed
+        self.counters["misses"] += 1
+        if self._flight.in_flight(key):
+            self.counters["coalesced"] += 1
+        return await self._flight.do(key, lambda: self._fetch(key, deps, order_id, entry))
+
+    async def _fetch(self, key: tuple, deps: "AgentDependencies", order_id: str | None, entry: OrderCacheEntry | None) -> "ProcessedOrder":
+        params = {
+            "customerId": deps["customer_id"],
+            "language": deps["language"],
+            "erpBusinessEntityId": deps["erp_business_entity_id"],
+        }
+        if order_id:
+            params["orderId"] = order_id
+        headers = {}
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+
+        self.counters["upstream_requests"] += 1
+        response = await self.http.get("eet", "/api/AiSearch/OrderStatus", params=params, headers=headers)
+        if response.status_code == 304 and entry is not None:
+            self.counters["not_modified"] += 1
+            self._store(key, entry._replace(fetched_at=time.monotonic()))
+            return entry.processed
+        response.raise_for_status()
+
+        # Decode once with json and validate into the processed structure, with translated status;
+        # model_validate_json peaks higher on orders with thousands of lines
+        processed = ProcessedOrder.model_validate(json.loads(response.content))
+        self._store(key, OrderCacheEntry(
+            processed=processed,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            fetched_at=time.monotonic(),
+        ))
+        return processed
+
+    def _store(self, key: tuple, entry: OrderCacheEntry):
+        if ORDER_CACHE_TTL <= 0:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > ORDER_CACHE_MAX_ENTRIES:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {**self.counters, "entries": len(self._entries)}
+
+class ToolMemo:
+    """
+    Tool results shared by the agent runs of one request or batch.
+
+    Results are keyed by tool and normalized arguments. A call that is still
+    running is shared too, so the same lookup made by several runs does the
+    I/O once. Failed calls are not kept and run again on the next request.
+    Calls can also be started speculatively with prefetch() before any tool
+    asks for them.
+    """
+
+    def __init__(self):
+        self._results: dict[Hashable, asyncio.Task] = {}
+        self._speculative: set[Hashable] = set()
+        self.counters = {"hits": 0, "misses": 0}
+
+    async def get_or_run(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self._speculative.discard(key)
+        task = self._results.get(key)
+        if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+            self.counters["misses"] += 1
+            task = asyncio.ensure_future(fn())
+            self._results[key] = task
+        else:
+            self.counters["hits"] += 1
+        return await asyncio.shield(task)
+
+    def peek(self, key: Hashable) -> Any | None:
+        """Return the result for key if it already finished successfully, without waiting."""
+        task = self._results.get(key)
+        if task is None or not task.done() or task.cancelled() or task.exception() is not None:
+            return None
+        return task.result()
+
+    def prefetch(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> bool:
+        """
+        Start fn() under key in the background unless key already ran or is running.
+
+        Returns:
+            True if the prefetch was started; settle it with settle_prefetch()
+        """
+        if key in self._results:
+            return False
+        self._results[key] = asyncio.ensure_future(fn())
+        self._speculative.add(key)
+        return True
+
+    def settle_prefetch(self, key: Hashable) -> Literal["used", "cancelled", "unused"]:
+        """
+        Returns:
+            "used" if get_or_run asked for key after it was prefetched,
+            otherwise "cancelled" if it was still running (it is stopped and
+            forgotten) or "unused" if it finished with nobody asking
+        """
+        if key not in self._speculative:
+            return "used"
+        self._speculative.discard(key)
+        task = self._results[key]
+        if not task.done():
+            task.cancel()
+            del self._results[key]
+            return "cancelled"
+        if not task.cancelled():
+            task.exception()
+        return "unused"
+
+    def forget(self, tool: str):
+        """Drop the finished results of one tool (keys are (tool, ...) tuples), so its next call runs again."""
+        for key in [key for key, task in self._results.items() if key[0] == tool and task.done()]:
+            del self._results[key]
+            self._speculative.discard(key)
+
+    def trim(self, max_entries: int):
+        """Drop the oldest finished results beyond max_entries."""
+        finished = [key for key, task in self._results.items() if task.done()]
+        for key in finished[:max(0, len(self._results) - max_entries)]:
+            del self._results[key]
+            self._speculative.discard(key)
+
+    def __len__(self) -> int:
+        return len(self._results)
 
 # Dependencies for passing API parameters to tools
 class AgentDependencies(TypedDict):
     customer_id: str
     language: str
     erp_business_entity_id: int
+    http: UpstreamClients
+    catalog: ConnectorCatalog
+    product_store: ProductKnowledgeStore
+    google: GoogleSearch
+    orders: OrderStatusCache
+    memo: ToolMemo
 
 # Define tools based on instrumentation (real for get_cable_types)
 async def get_cable_ends_a(ctx: RunContext[AgentDependencies]) -> list[str]:
-    print("calling get_cable_ends_a")
-    return ["2.5mm Female", "2.5mm Male", "3.5mm Female", "3.5mm Male", "6.35mm Female", "6.35mm Male", "Power Type I - Australia Male", "BNC Female", "BNC Male", "Power Type N - Brazil Female", "Power Type N - Brazil Male", "Power Type C13 Female", "Power Type C14 Male", "Power Type C15 Female", "Power Type C19 Female", "Power Type C20 Male", "C21 coupler Female", "Power Type C5 Female", "Power Type C7 Female", "DB25 Female", "DB25 Male", "DB9 Female", "DB9 Male", "Power Type K - Denmark Female", "Power Type K - Denmark Male", "Powerstrip Type K - Denmark", "DisplayPort Female", "DisplayPort Male", "DVI-D Female", "DVI-D Male", "DVI-I Female", "DVI-I Male", "E2000 Male", "Power Type C - EU Male", "FC Male", "Powerstrip Type E - French", "HDMI Female", "HDMI Male", "HDMI Micro Male", "HDMI Mini Female", "HDMI Mini Male", "IEC Female", "IEC Male", "Power Type D - India Male", "Power Type L - Italy Male", "LC Female", "LC Male", "Lightning Female", "Lightning Male", "Mini DisplayPort Female", "Mini DisplayPort Male", "MPO/MTP Female", "MPO/MTP Male", "MTRJ Male", "MU/UPC Male", "Multi Male", "Open End", "PS/2 Female", "PS/2 Male", "QSFP+ Male", "RCA Female", "RCA Male", "RJ11 Female", "RJ11 Male", "RJ12 Male", "RJ45 Female", "RJ45 Male", "RP-SMA Female", "RP-SMA Male", "SATA 15-pin Female", "SATA 15-pin Male", "SATA 7-pin Female", "SATA 7-pin Male", "SC Female", "SC Male", "Power Type E/F - Schuko Female", "Power Type E/F - Schuko Male", "Powerstrip Type F - Schuko", "SFF Male", "SFP Male", "Power Type M - South Africa Male", "Speaker Raw Cable Male", "ST Male", "ST/UPC Male", "Power Type J - Switzerland Female", "Power Type J - Switzerland Male", "Thunderbolt Male", "TOSLINK Male", "Power Type G - UK Male", "Powerstrip Type G - UK", "Power Type A - USA Male", "Power Type B - USA Male", "USB A Female", "USB A Male", "USB B Female", "USB B Male", "USB C Female", "USB C Male", "USB Micro A Male", "USB Micro B Female", "USB Micro B Male", "USB Mini B Male", "VGA Female", "VGA Male", "XLR (3-pin) Female", "XLR (3-pin) Male"]
-    url = 'https://stage-api.eetgroup.com/api/CableGuide/GetCableEndTypesA'
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:145.0) Gecko/20100101 Firefox/145.0',
-        'Accept': 'application/json, text/plain, */*',
-        'Accept-Encoding': 'identity',
-        'Content-Type': 'application/json',
-        'x-eet-culture': 'en-zz',
-        'x-eet-businessentityid': '9',
-        'x-eet-marketid': '1006',
-        'x-eet-siteid': '23',
-    }
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, headers=headers)
-        data = response.json()
-        # Extract names from cableTypes
-        if 'model' in data and 'cableTypes' in data['model']:
-            return [item['id'] for item in data['model']['cableTypes'] if 'id' in item]
-        return []
+    return await ctx.deps["catalog"].get_ends_a()
 
 async def get_cable_ends_b(ctx: RunContext[AgentDependencies], cable_end_a: str) -> list[str]:
-    print(f"calling the get_cable_ends_b with {cable_end_a}")
-    url = f'https://stage-api.eetgroup.com/api/CableGuide/GetCableEndTypesB?cableEndTypeA={cable_end_a}'
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:145.0) Gecko/20100101 Firefox/145.0',
-        'Accept': 'application/json, text/plain, */*',
-        'Accept-Encoding': 'identity',
-        'Content-Type': 'application/json',
-        'x-eet-culture': 'en-zz',
-        'x-eet-businessentityid': '9',
-        'x-eet-marketid': '1006',
-        'x-eet-siteid': '23',
+    catalog = ctx.deps["catalog"]
+    key = ("get_cable_ends_b", catalog.key(catalog.canonical(cable_end_a)))
+    return await ctx.deps["memo"].get_or_run(key, lambda: catalog.get_ends_b(cable_end_a))
+
+async def find_connector_candidates(ctx: RunContext[AgentDependencies], hints: list[str], k: int = 5) -> dict[str, list[str]]:
+    """
+    Find the catalog connectors that best match each connector hint.
+
+    Prefer this over get_cable_ends_a: it returns only the closest catalog
+    connector IDs instead of the whole catalog.
+
+    Args:
+        hints: Connector descriptions from the query or product search, e.g. ["HDMI", "USB-C female"]
+        k: Number of candidates to return per hint
+
+    Returns:
+        Mapping of each hint to catalog connector IDs, best match first
+    """
+    await ctx.deps["catalog"].get_ends_a()
+    index = ctx.deps["catalog"].index()
+    return {hint: [name for name, _ in index.search(hint, k)] for hint in hints}
+
+# Variant families listed in a resolve_cable result, to keep it short
+RESOLVE_MAX_VARIANTS = 8
+
+async def resolve_cable(ctx: RunContext[AgentDependencies], from_hint: str, to_hint: str, k: int = 3) -> dict:
+    """
+    Resolve both ends of a cable in one call.
+
+    Finds the catalog connector that best matches from_hint, fetches the
+    connectors compatible with it and picks the best match for to_hint.
+
+    Args:
+        from_hint: First connector from the query or product search, e.g. "HDMI" or "USB-C female"
+        to_hint: Second connector, e.g. "DisplayPort"
+        k: Number of alternative pairs to return
+
+    Returns:
+        dict with structure:
+        {
+            "resolved": bool,  # True when both ends matched confidently
+            "from_connector": str,  # Best catalog connector for from_hint, "" if none
+            "to_connector": str,  # Best compatible connector for to_hint, "" if none
+            "alternatives": [{"from_connector": str, "to_connector": str}],  # Next best valid pairs
+            "from_counterpart": str,  # Other gender of from_connector that also fits to_connector, "" if none
+            "to_counterpart": str,  # Other gender of to_connector that also fits from_connector, "" if none
+            "to_variants": [str]  # Other families of to_connector's standard that fit from_connector
+        }
+
+    The counterparts and variants come from the catalog taxonomy, so "the
+    female version" or "which USB ends fit" is answered from this result.
+    """
+    catalog = ctx.deps["catalog"]
+    memo = ctx.deps["memo"]
+    await catalog.get_ends_a()
+    a_candidates = catalog.index().search(from_hint, k)
+
+    async def ends_b(cable_end_a: str) -> list[str]:
+        key = ("get_cable_ends_b", catalog.key(cable_end_a))
+        return await memo.get_or_run(key, lambda: catalog.get_ends_b(cable_end_a))
+
+    # Score every compatible pair for the top A candidates
+    pairs = []
+    compatible = await asyncio.gather(*(ends_b(name) for name, _ in a_candidates))
+    b_lists = {a_name: b_names for (a_name, _), b_names in zip(a_candidates, compatible)}
+    for (a_name, a_score), b_names in zip(a_candidates, compatible):
+        if not b_names:
+            continue
+        for b_name, b_score in catalog.index(b_names).search(to_hint, k):
+            pairs.append((a_score + b_score, b_score, a_name, b_name))
+    pairs.sort(key=lambda pair: pair[0], reverse=True)
+
+    if not pairs:
+        return {
+            "resolved": False, "from_connector": "", "to_connector": "", "alternatives": [],
+            "from_counterpart": "", "to_counterpart": "", "to_variants": [],
+        }
+    best_score, best_b_score, from_connector, to_connector = pairs[0]
+    # Scores above 1 mean the connector family was recognized, not just spelled
+    # alike; a tie with the runner-up ("dvi" -> DVI-D or DVI-I) needs a decision
+    tied = len(pairs) > 1 and pairs[1][0] == best_score
+
+    # The B list's own taxonomy only knows connectors compatible with from_connector;
+    # the A end's counterpart counts if its B list, already fetched, has to_connector
+    b_taxonomy = catalog.index(b_lists[from_connector]).taxonomy
+    from_counterpart = catalog.taxonomy().counterpart(from_connector)
+    if to_connector not in b_lists.get(from_counterpart, ()):
+        from_counterpart = None
+    return {
+        "resolved": a_candidates[0][1] > 1.0 and best_b_score > 1.0 and not tied,
+        "from_connector": from_connector,
+        "to_connector": to_connector,
+        "alternatives": [
+            {"from_connector": a_name, "to_connector": b_name}
+            for _, _, a_name, b_name in pairs[1:k + 1]
+        ],
+        "from_counterpart": from_counterpart or "",
+        "to_counterpart": b_taxonomy.counterpart(to_connector) or "",
+        "to_variants": b_taxonomy.other_variants(to_connector)[:RESOLVE_MAX_VARIANTS],
     }
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, headers=headers)
-        data = response.json()
-        # Extract names from cableTypes
-        if 'model' in data and 'cableTypes' in data['model']:
-            out = [item['id'] for item in data['model']['cableTypes'] if 'id' in item]
-            print(out)
-            return out
-        return []
 
-def extract_connector_types(search_data: dict) -> list[str]:
+
+# Connector matching
+# Surface forms seen in queries and search results, written as lowercase
+# token sequences, mapped to the catalog connector families (catalog IDs
+# without the gender suffix) they name. Ambiguous forms ("dvi", "sata") list
+# every family they may refer to.
+CONNECTOR_SURFACE_FORMS: list[tuple[tuple[str, ...], tuple[str, ...]]] = [
+    # USB variants
+    (("usb c", "usbc", "usb type c", "usb typec", "type c", "typec"), ("USB C",)),
+    (("usb micro", "usb micro b", "micro usb", "micro usb b", "microusb"), ("USB Micro B",)),
+    (("usb mini", "usb mini b", "mini usb", "mini usb b", "miniusb"), ("USB Mini B",)),
+    (("usb a", "usba", "usb type a"), ("USB A",)),
+    (("usb b", "usbb", "usb type b"), ("USB B",)),
+
+    # Display connectors
+    (("hdmi",), ("HDMI",)),
+    (("mini hdmi", "hdmi mini"), ("HDMI Mini",)),
+    (("micro hdmi", "hdmi micro"), ("HDMI Micro",)),
+    (("displayport", "dp"), ("DisplayPort",)),
+    (("mini displayport", "mini dp", "minidp"), ("Mini DisplayPort",)),
+    (("dvi d", "dvid"), ("DVI-D",)),
+    (("dvi i", "dvii"), ("DVI-I",)),
+    (("dvi",), ("DVI-D", "DVI-I")),
+    (("vga",), ("VGA",)),
+
+    # Apple/Mobile
+    (("lightning",), ("Lightning",)),
+    (("thunderbolt",), ("Thunderbolt",)),
+
+    # Audio
+    (("3.5mm", "3.5 mm", "headphone jack", "aux"), ("3.5mm",)),
+    (("6.35mm", "6.35 mm", "1/4 inch"), ("6.35mm",)),
+    (("2.5mm", "2.5 mm"), ("2.5mm",)),
+    (("xlr",), ("XLR (3-pin)",)),
+    (("rca",), ("RCA",)),
+    (("toslink",), ("TOSLINK",)),
+
+    # Networking
+    (("rj45", "rj 45", "ethernet"), ("RJ45",)),
+    (("rj11", "rj 11"), ("RJ11",)),
+    (("rj12", "rj 12"), ("RJ12",)),
+
+    # Power
+    (("power type a",), ("Power Type A - USA",)),
+    (("power type b",), ("Power Type B - USA",)),
+    (("power type c",), ("Power Type C - EU",)),
+    (("power type d",), ("Power Type D - India",)),
+    (("power type e", "power type f", "power type e/f", "schuko"), ("Power Type E/F - Schuko",)),
+    (("power type g",), ("Power Type G - UK",)),
+    (("power type i",), ("Power Type I - Australia",)),
+    (("power type j",), ("Power Type J - Switzerland",)),
+    (("power type k",), ("Power Type K - Denmark",)),
+    (("power type l",), ("Power Type L - Italy",)),
+    (("power type m",), ("Power Type M - South Africa",)),
+    (("power type n",), ("Power Type N - Brazil",)),
+    (("c5",), ("Power Type C5",)),
+    (("c7",), ("Power Type C7",)),
+    (("c13",), ("Power Type C13",)),
+    (("c14",), ("Power Type C14",)),
+    (("c15",), ("Power Type C15",)),
+    (("c19",), ("Power Type C19",)),
+    (("c20",), ("Power Type C20",)),
+    (("iec",), ("IEC",)),
+
+    # Other
+    (("bnc",), ("BNC",)),
+    (("sata",), ("SATA 15-pin", "SATA 7-pin")),
+    (("db9", "db 9"), ("DB9",)),
+    (("db25", "db 25"), ("DB25",)),
+    (("ps/2", "ps2"), ("PS/2",)),
+]
+
+# Built once at import: token-sequence lookup table, scanned longest-first so
+# "mini hdmi" wins over "hdmi" and "usb type c" over "usb"
+_CONNECTOR_PHRASES = {
+    tuple(phrase.split()): families
+    for phrases, families in CONNECTOR_SURFACE_FORMS
+    for phrase in phrases
+}
+_CONNECTOR_FIRST_TOKENS = {phrase[0] for phrase in _CONNECTOR_PHRASES}
+_CONNECTOR_MAX_TOKENS = max(len(phrase) for phrase in _CONNECTOR_PHRASES)
+_TOKEN_RE = re.compile(r'[a-z0-9]+(?:[./][a-z0-9]+)*')
+_GENDERS = {"male": "Male", "female": "Female"}
+
+class ConnectorMention(NamedTuple):
+    families: tuple[str, ...]
+    gender: str | None
+    start: int
+    end: int
+
+def find_connector_mentions(text: str) -> list[ConnectorMention]:
+    """
+    Find connector families mentioned in free text in a single pass.
+
+    The text is tokenized once and each token is looked up in a prebuilt
+    phrase table, so the cost is linear in the text length regardless of
+    how many surface forms are known.
+
+    Args:
+        text: Query or search result text, e.g. "DisplayPort male to HDMI female"
+
+    Returns:
+        Mentions in order of appearance, each with the catalog families it may
+        refer to (e.g. ("DisplayPort",)) and the explicit gender ("Male"/"Female")
+        or None when not stated
+    """
+    matches = list(_TOKEN_RE.finditer(text.lower()))
+    tokens = [match.group(0) for match in matches]
+    mentions = []
+    consumed = 0  # tokens before this index belong to an earlier mention
+    i = 0
+    while i < len(tokens):
+        if tokens[i] not in _CONNECTOR_FIRST_TOKENS:
+            i += 1
+            continue
+        for length in range(min(_CONNECTOR_MAX_TOKENS, len(tokens) - i), 0, -1):
+            families = _CONNECTOR_PHRASES.get(tuple(tokens[i:i + length]))
+            if families:
+                break
+        else:
+            i += 1
+            continue
+
+        # A gender word directly before or after belongs to this connector
+        start, end = i, i + length
+        gender = None
+        if end < len(tokens) and tokens[end] in _GENDERS:
+            gender = _GENDERS[tokens[end]]
+            end += 1
+        elif start > consumed and tokens[start - 1] in _GENDERS:
+            gender = _GENDERS[tokens[start - 1]]
+            start -= 1
+        mentions.append(ConnectorMention(
+            families=families,
+            gender=gender,
+            start=matches[start].start(),
+            end=matches[end - 1].end(),
+        ))
+        i = consumed = end
+    return mentions
+
+def split_connector_id(connector_id: str) -> tuple[str, str | None]:
+    """
+    Split a catalog connector ID into family and gender.
+
+    Example: "USB Micro B Female" -> ("USB Micro B", "Female"), "Open End" -> ("Open End", None)
+    """
+    for gender in ("Male", "Female"):
+        if connector_id.endswith(" " + gender):
+            return connector_id[:-len(gender) - 1], gender
+    return connector_id, None
+
+class ConnectorSpec(NamedTuple):
+    name: str              # catalog ID, e.g. "USB Micro B Female"
+    family: str            # ID without the gender, "USB Micro B"
+    standard: str          # "USB"
+    variant: str           # "Micro B", "" for the plain form ("HDMI")
+    gender: str | None     # "Male", "Female" or None ("Open End")
+
+# Standards named by more than one word, e.g. "Power Type C13" -> ("Power", "C13")
+_MULTI_WORD_STANDARDS = ("Power Type ", "Powerstrip Type ")
+_SIZE_VARIANTS = {"Mini", "Micro"}
+
+def parse_connector_id(connector_id: str) -> ConnectorSpec:
+    """
+    Parse a catalog connector ID into standard, variant and gender.
+
+    Examples:
+        "USB Micro B Female" -> standard "USB", variant "Micro B"
+        "Mini DisplayPort Male" -> "DisplayPort", "Mini"
+        "DVI-D Male" -> "DVI", "D"
+        "XLR (3-pin) Female" -> "XLR", "3-pin"
+        "Power Type C13 Female" -> "Power", "C13"
+        "Speaker Raw Cable Male" -> "Speaker Raw Cable", ""
+    """
+    family, gender = split_connector_id(connector_id)
+    standard, variant = family, ""
+    words = family.split()
+    prefix = next((prefix for prefix in _MULTI_WORD_STANDARDS if family.startswith(prefix)), None)
+    if prefix is not None:
+        standard, variant = prefix.split()[0], family[len(prefix):]
+    elif len(words) > 1 and words[0] in _SIZE_VARIANTS:
+        standard, variant = " ".join(words[1:]), words[0]
+    elif len(words) == 1 and re.fullmatch(r'[A-Z]{2,}-[A-Z]', family):
+        standard, variant = family.split("-")
+    elif len(words) > 1 and all(word in _SIZE_VARIANTS or len(word) == 1 or any(c.isdigit() for c in word) for word in words[1:]):
+        # Only size, letter or pin-count words are variants, "Open End" is one name
+        standard, variant = words[0], " ".join(words[1:]).strip("()")
+    return ConnectorSpec(sys.intern(connector_id), sys.intern(family), sys.intern(standard), sys.intern(variant), gender)
+
+class ConnectorTaxonomy:
+    """
+    Catalog connector IDs parsed once into family, standard, variant and gender.
+
+    Every lookup is a dict access, so the tools and the non-LLM resolution
+    paths apply connector rules locally: the male/female counterpart of an
+    ID, all variants of a standard ("USB" -> USB A, USB C, USB Micro B, ...)
+    and the default ID of a family, male unless the catalog only lists it
+    with another gender or none.
+    """
+
+    def __init__(self, names: list[str]):
+        self.names = names
+        self.specs: dict[str, ConnectorSpec] = {}
+        self._genders: dict[str, dict[str | None, str]] = {}
+        self._variants: dict[str, list[str]] = {}
+        self._standards: dict[str, str] = {}
+        key = ConnectorCatalog.key
+        for name in names:
+            spec = parse_connector_id(name)
+            family, standard = key(spec.family), key(spec.standard)
+            self.specs[key(name)] = spec
+            self._genders.setdefault(family, {}).setdefault(spec.gender, name)
+            self._variants.setdefault(standard, []).append(name)
+            self._standards[key(name)] = self._standards[family] = standard
+        self._defaults = {
+            family: genders.get("Male") or genders.get(None) or next(iter(genders.values()))
+            for family, genders in self._genders.items()
+        }
+
+    def spec(self, name: str) -> ConnectorSpec | None:
+        return self.specs.get(ConnectorCatalog.key(name))
+
+    def defaults(self) -> list[str]:
+        """The default ID of every family."""
+        return list(self._defaults.values())
+
+    def counterpart(self, name: str) -> str | None:
+        """The other gender of a catalog ID ("HDMI Male" -> "HDMI Female"), None if not listed."""
+        spec = self.spec(name)
+        if spec is None or spec.gender is None:
+            return None
+        other = "Female" if spec.gender == "Male" else "Male"
+        return self._genders[ConnectorCatalog.key(spec.family)].get(other)
+
+    def variants(self, name: str) -> list[str]:
+        """
+        Catalog IDs of every variant of a standard.
+
+        Args:
+            name: A standard ("USB"), family ("USB Micro B") or catalog ID
+
+        Returns:
+            IDs in catalog order, empty if the standard is not listed
+        """
+        key = ConnectorCatalog.key(name)
+        return list(self._variants.get(self._standards.get(key, key), ()))
+
+    def other_variants(self, name: str) -> list[str]:
+        """
+        One catalog ID per other family of name's standard, in name's gender where listed.
+
+        E.g. "USB C Male" -> ["USB A Male", "USB B Male", "USB Micro B Male", ...]
+        """
+        spec = self.spec(name)
+        if spec is None:
+            return []
+        families = dict.fromkeys(self.specs[ConnectorCatalog.key(variant)].family for variant in self.variants(name))
+        return [self.default(family, spec.gender) or self.default(family) for family in families if family != spec.family]
+
+    def default(self, family: str, gender: str | None = None) -> str | None:
+        """
+        Catalog ID for a family and the gender a hint stated, if any.
+
+        Args:
+            family: Catalog family, e.g. "USB C" or "Power Type C13", as found by find_connector_mentions
+            gender: "Male"/"Female" when the hint stated one
+
+        Returns:
+            The ID with that gender, or without one the family's default
+            (male, else the only gender listed); None if not listed
+        """
+        key = ConnectorCatalog.key(family)
+        if gender is not None:
+            return self._genders.get(key, {}).get(gender)
+        return self._defaults.get(key)
+
+def _trigrams(text: str) -> frozenset[str]:
+    text = " " + " ".join(re.findall(r'[a-z0-9.+]+', text.lower())) + " "
+    return frozenset(text[i:i + 3] for i in range(len(text) - 2))
+
+class ConnectorIndex:
+    """
+    Local similarity index over catalog connector names.
+
+    Each ID is parsed once into a ConnectorTaxonomy and its family name into
+    character trigrams. A hint is scored against every ID by trigram overlap
+    (Dice coefficient), boosted when the connector matcher recognizes the
+    hint's family and adjusted for the stated gender, or toward the family's
+    default ID when no gender is given.
+    """
+
+    def __init__(self, names: list[str]):
+        self.names = names
+        self.taxonomy = ConnectorTaxonomy(names)
+        self._entries = []
+        defaults = set(self.taxonomy.defaults())
+        for spec in self.taxonomy.specs.values():
+            self._entries.append((spec.name, spec.family, spec.gender, spec.name in defaults, _trigrams(spec.family)))
+
+    def search(self, hint: str, k: int = 5) -> list[tuple[str, float]]:
+        """
+        Rank catalog connectors for a free-text hint.
+
+        Args:
+            hint: Connector description, e.g. "usb-c female" or "mini displayport"
+            k: Number of candidates to return
+
+        Returns:
+            Up to k (connector ID, score) pairs, best first
+        """
+        mentions = find_connector_mentions(hint)
+        families = {family for mention in mentions for family in mention.families}
+        gender = next((mention.gender for mention in mentions if mention.gender), None)
+        if gender is None:
+            gender = next((_GENDERS[word] for word in re.findall(r'[a-z]+', hint.lower()) if word in _GENDERS), None)
+        hint_grams = _trigrams(re.sub(r'\b(?:fe)?male\b', " ", hint, flags=re.IGNORECASE))
+
+        scored = []
+        for name, family, entry_gender, is_default, grams in self._entries:
+            score = 2 * len(hint_grams & grams) / (len(hint_grams) + len(grams)) if hint_grams else 0.0
+            if family in families:
+                score += 1.0
+            if gender is not None and entry_gender is not None:
+                score += 0.2 if entry_gender == gender else -0.2
+            elif is_default:
+                score += 0.05
+            scored.append((name, score))
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return [(name, round(score, 3)) for name, score in scored[:k] if score > 0.2]
+
+# Google Custom Search payload, validated straight from the response bytes; other fields are skipped
+class SearchItem(BaseModel):
+    title: str | None = None
+    snippet: str | None = None
+    htmlSnippet: str | None = None
+
+class CustomSearchReply(BaseModel):
+    items: list[SearchItem] = []
+
+def extract_connector_types(reply: CustomSearchReply) -> list[str]:
     """
     Extract cable connector types from Google search results.
 
     Strategy:
     1. Collect all text from titles, snippets, and page text
-    2. Match against common connector patterns
-    3. Return unique matches in order of confidence
+    2. Scan it once with the precompiled connector matcher
+    3. Return unique catalog families in order of appearance
 
     Args:
-        search_data: JSON response from Google Custom Search API
-
-    Returns:
-        List of detected connector types (e.g., ["HDMI", "USB-C", "Lightning"])
-    """
-    # Common connector patterns to search for
-    connector_patterns = [
-        # USB variants
-        r'\bUSB[\s-]?C\b', r'\bUSB-C\b', r'\bUSB Type-C\b',
-        r'\bUSB[\s-]?A\b', r'\bUSB-A\b', r'\bUSB Type-A\b',
-        r'\bUSB[\s-]?B\b', r'\bUSB-B\b',
-        r'\bUSB[\s-]?Micro\b', r'\bMicro USB\b',
-        r'\bUSB[\s-]?Mini\b', r'\bMini USB\b',
-
-        # Display connectors
-        r'\bHDMI\b',
-        r'\bDisplayPort\b', r'\bDP\b',
-        r'\bMini DisplayPort\b', r'\bMini DP\b',
-        r'\bDVI[-]?[DI]?\b',
-        r'\bVGA\b',
-
-        # Apple/Mobile
-        r'\bLightning\b',
-        r'\bThunderbolt\b',
-
-        # Audio
-        r'\b3\.5mm\b', r'\b3\.5\s?mm\b', r'\bheadphone jack\b',
-        r'\b6\.35mm\b', r'\b1/4["\s]inch\b',
-        r'\b2\.5mm\b',
-        r'\bXLR\b',
-        r'\bRCA\b',
-
-        # Networking
-        r'\bRJ45\b', r'\bRJ-45\b', r'\bEthernet\b',
-        r'\bRJ11\b', r'\bRJ-11\b',
-
-        # Power
-        r'\bPower Type [A-Z]\b',
-        r'\bIEC\b',
-        r'\bSchuko\b',
-
-        # Other
-        r'\bBNC\b',
-        r'\bSATA\b',
-        r'\beSATA\b',
-    ]
+        reply: Google Custom Search API response
 
+    Returns:
+        List of detected catalog connector families (e.g., ["HDMI", "USB C", "Lightning"]).
+        Catalog IDs are the family plus " Male" or " Female".
+    """
     # Collect all searchable text
-    text_corpus = []
-    if "items" in search_data:
-        for item in search_data["items"]:
-            if "title" in item:
-                text_corpus.append(item["title"])
-            if "snippet" in item:
-                text_corpus.append(item["snippet"])
-            if "htmlSnippet" in item:
-                text_corpus.append(item["htmlSnippet"])
+    text_corpus = [
+        text
+        for item in reply.items
+        for text in (item.title, item.snippet, item.htmlSnippet)
+        if text is not None
+    ]
 
     combined_text = " ".join(text_corpus)
 
@@ -160,19 +2123,23 @@ def extract_connector_types(search_data: dict) -> list[str]:
     found_connectors = []
     seen = set()
 
-    for pattern in connector_patterns:
-        matches = re.finditer(pattern, combined_text, re.IGNORECASE)
-        for match in matches:
-            # Normalize the match
-            connector = match.group(0).strip()
-            connector_normalized = connector.upper().replace("-", " ").replace("  ", " ")
-
-            if connector_normalized not in seen:
-                found_connectors.append(connector)
-                seen.add(connector_normalized)
+    for mention in find_connector_mentions(combined_text):
+        for family in mention.families:
+            if family not in seen:
+                found_connectors.append(family)
+                seen.add(family)
 
     return found_connectors[:10]  # Limit to top 10 unique connectors
 
+# Order references that cannot be anything else
+EXPLICIT_ORDER_ID_PATTERNS = [
+    r'order\s*#?(\d+)',           # "order 12345" or "order #12345" (most common)
+    r'#(\d+)',                    # "#12345" (alternative)
+]
+ORDER_ID_PATTERNS = EXPLICIT_ORDER_ID_PATTERNS + [
+    r'\b(\d{4,})\b',              # standalone 4+ digit numbers (fallback)
+]
+
 def extract_order_id(query: str) -> str | None:
     """
     Extract order ID from natural language query.
@@ -181,19 +2148,28 @@ def extract_order_id(query: str) -> str | None:
 
     Returns: Order ID string or None if not found
     """
-    patterns = [
-        r'order\s*#?(\d+)',           # "order 12345" or "order #12345" (most common)
-        r'#(\d+)',                    # "#12345" (alternative)
-        r'\b(\d{4,})\b',              # standalone 4+ digit numbers (fallback)
-    ]
-
-    for pattern in patterns:
+    for pattern in ORDER_ID_PATTERNS:
         match = re.search(pattern, query, re.IGNORECASE)
         if match:
             return match.group(1)
 
     return None
 
+def extract_order_ids(query: str) -> list[str]:
+    """
+    Extract every order ID from a natural language query, in order of appearance.
+
+    Same formats as extract_order_id, e.g. "status of orders 12345, 12388
+    and #12391" -> ["12345", "12388", "12391"].
+
+    Returns: Unique order ID strings, empty if none found
+    """
+    found = {}
+    for pattern in ORDER_ID_PATTERNS:
+        for match in re.finditer(pattern, query, re.IGNORECASE):
+            found.setdefault(match.start(1), match.group(1))
+    return list(dict.fromkeys(order_id for _, order_id in sorted(found.items())))
+
 def translate_order_status(status_code: int) -> str:
     """
     Translate order status code to human-readable text.
@@ -213,247 +2189,1173 @@ def translate_order_status(status_code: int) -> str:
     }
     return status_map.get(status_code, f"Unknown Status ({status_code})")
 
-def process_order_response(data: dict) -> dict:
+class ProcessedOrder(BaseModel):
+    """
+    Order status in the clean structure the tools and the LLM see.
+
+    Validated from the decoded OrderStatus API response: the upstream
+    camelCase fields are read through validation aliases, fields not listed
+    here are dropped, and the status code is translated when the order is
+    serialized. Order lines are copied as plain dicts of item_id and status,
+    as process_order_response did: validating thousands of lines against a
+    schema cost more CPU and memory than the copy.
+    """
+
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
+    order_id: str | None = Field(default=None, validation_alias="orderId")
+    status_code: int | None = Field(default=None, validation_alias="status")
+    order_date: str | None = Field(default=None, validation_alias="orderDate")
+    shipping_agent: str | None = Field(default=None, validation_alias="shippingAgentName")
+    ship_to_address: str | None = Field(default=None, validation_alias="shipToAddress")
+    subtotal: float | None = Field(default=None, validation_alias="subTotal")
+    next_shipment: str | None = Field(default=None, validation_alias="nextShipment")
+    # Lines are plain dicts: serialize them as such, not field by field against a schema
+    order_lines: Annotated[list[dict[str, Any]], PlainSerializer(lambda lines: lines, return_type=Any)] = Field(
+        default_factory=list, validation_alias="orderLines",
+    )
+
+    @field_validator("order_lines", mode="plain")
+    @classmethod
+    def _copy_lines(cls, value: Any) -> list[dict[str, Any]]:
+        return [{"item_id": line.get("itemId"), "status": line.get("status")} for line in value or []]
+
+    @computed_field
+    @property
+    def status(self) -> str:
+        return translate_order_status(-1 if self.status_code is None else self.status_code)
+
+    @computed_field
+    @property
+    def total_items(self) -> int:
+        return len(self.order_lines)
+
+async def search_product_info(ctx: RunContext[AgentDependencies], product_query: str) -> dict:
+    """
+    Search Google Custom Search API for product cable information.
+
+    Args:
+        ctx: RunContext from pydantic-ai
+        product_query: Search query (e.g., "iPhone 15 Pro cable connectors")
+
+    Returns:
+        dict with structure:
+        {
+            "success": bool,
+            "connector_types": list[str],  # Extracted connector types
+            "snippets": list[str],  # Top 3 result snippets for context
+            "error": str | None,
+            "source": str,  # "store" when answered from the local product store,
+                            # "store_expired" for an old entry while Google fails
+            "quota_remaining": int  # Google queries left today
+        }
+    """
+    key = ("search_product_info", " ".join(product_tokens(product_query)) or normalize_query(product_query))
+    return await ctx.deps["memo"].get_or_run(key, lambda: lookup_product_info(ctx.deps, product_query))
+
+async def lookup_product_info(deps: AgentDependencies, product_query: str) -> dict:
+    """Body of search_product_info: product store first, then Google."""
+    google = deps["google"]
+
+    # Products looked up before are answered from the local store
+    stored = await asyncio.to_thread(deps["product_store"].lookup, product_query)
+    if stored is not None:
+        logger.info("Product store hit", sampled=True, product_query=clip(product_query), stored_query=stored["query"])
+        return {
+            "success": True,
+            "connector_types": stored["connector_types"],
+            "snippets": stored["snippets"],
+            "error": None,
+            "source": "store",
+            "quota_remaining": google.quota.remaining()["daily_remaining"],
+        }
+
+    # Validate configuration
+    if not google.configured():
+        return {
+            "success": False,
+            "connector_types": [],
+            "snippets": [],
+            "error": "Google Custom Search not configured. Set GOOGLE_API_KEY and GOOGLE_CSE_ID environment variables."
+        }
+
+    try:
+        result = await google.search(product_query)
+        return {
+            "success": True,
+            "connector_types": result["connector_types"],
+            "snippets": result["snippets"],
+            "error": None,
+            "source": "google",
+            "quota_remaining": google.quota.remaining()["daily_remaining"],
+        }
+
+    except QuotaExhausted:
+        error_msg = "Google search quota exhausted - continue without web search"
+    except CircuitOpen:
+        error_msg = "Google search temporarily unavailable - continue without web search"
+    except httpx.HTTPStatusError as e:
+        error_msg = f"Google API HTTP error: {e.response.status_code}"
+        if e.response.status_code == 429:
+            error_msg += " - Rate limit exceeded"
+        elif e.response.status_code == 403:
+            error_msg += " - Invalid API key or CSE ID"
+    except httpx.TimeoutException:
+        error_msg = "Google API request timed out"
+    except Exception as e:
+        error_msg = f"Unexpected error: {str(e)}"
+    logger.warning("Google product search failed", error=error_msg)
+
+    # Google failed: an expired store entry is still better than nothing
+    stored = await asyncio.to_thread(deps["product_store"].lookup, product_query, True)
+    if stored is not None:
+        logger.info("Serving expired product store entry", product_query=clip(product_query), stored_query=stored["query"])
+        return {
+            "success": True,
+            "connector_types": stored["connector_types"],
+            "snippets": stored["snippets"],
+            "error": None,
+            "source": "store_expired",
+            "quota_remaining": google.quota.remaining()["daily_remaining"],
+        }
+    return {
+        "success": False,
+        "connector_types": [],
+        "snippets": [],
+        "error": error_msg,
+        "quota_remaining": google.quota.remaining()["daily_remaining"],
+    }
+
+async def prepare_search_product_info(ctx: RunContext[AgentDependencies], tool_def: ToolDefinition) -> ToolDefinition | None:
+    """Hide web search from the agent when Google is not configured or today's quota is spent."""
+    google = ctx.deps["google"]
+    if not google.configured() or google.quota.exhausted():
+        return None
+    return tool_def
+
+async def get_order_status(ctx: RunContext[AgentDependencies], user_query: str) -> ProcessedOrder | dict:
+    """
+    Fetch order status from EET Order Status API.
+
+    Extracts order ID from user_query. If no ID found, API returns latest order.
+
+    Args:
+        ctx: RunContext with dependencies (customer_id, language, erp_business_entity_id)
+        user_query: Original user query for order ID extraction
+
+    Returns:
+        Processed order data dict with structure:
+        {
+            "order_id": str,               # Order identifier
+            "status": str,                 # Human-readable: "Confirmed", "Picking in Progress",
+                                          # "Partly Dispatched", "Dispatched", "Received"
+            "status_code": int,            # Raw status code (0-10)
+            "order_date": str,             # When order was placed (ISO format)
+            "shipping_agent": str,         # Delivery company name
+            "ship_to_address": str,        # Shipping address
+            "subtotal": float,             # Order total amount
+            "next_shipment": str | None,   # Next shipment date if available
+            "order_lines": [               # Array of ordered items
+                {
+                    "item_id": str,        # Product identifier
+                    "status": str | None   # Item-specific status
+                }
+            ],
+            "total_items": int             # Count of items in order
+        }
+
+        Or error dict on failure:
+        {
+            "error": str,
+            "message": str
+        }
+    """
+    # Extract order ID from query; without one the API returns the latest order
+    order_id = extract_order_id(user_query)
+    key = ("get_order_status", order_id or "latest")
+    return await ctx.deps["memo"].get_or_run(key, lambda: fetch_order_status(ctx.deps, order_id))
+
+async def fetch_order_status(deps: AgentDependencies, order_id: str | None) -> ProcessedOrder | dict:
+    """Body of get_order_status: fetch and process one order, or the latest one."""
+    # Call API (through the short-TTL order cache) with error handling
+    try:
+        processed = await deps["orders"].get(deps, order_id)
+        logger.info("Order status fetched", sampled=True, order_id=processed.order_id, status=processed.status)
+        return processed
+
+    except httpx.HTTPStatusError as e:
+        error_msg = f"API error: {e.response.status_code}"
+        if e.response.status_code == 404:
+            error_msg += " - Order not found"
+        logger.warning("Order status lookup failed", order_id=order_id, error=error_msg)
+        return {
+            "error": error_msg,
+            "message": "Could not fetch order status"
+        }
+    except CircuitOpen:
+        error_msg = "Order status API is temporarily unavailable"
+        logger.warning("Order status lookup failed", order_id=order_id, error=error_msg)
+        return {
+            "error": "unavailable",
+            "message": error_msg
+        }
+    except httpx.TimeoutException:
+        error_msg = "Order status API request timed out"
+        logger.warning("Order status lookup failed", order_id=order_id, error=error_msg)
+        return {
+            "error": "timeout",
+            "message": error_msg
+        }
+    except Exception as e:
+        error_msg = f"Unexpected error: {str(e)}"
+        logger.warning("Order status lookup failed", order_id=order_id, error=error_msg)
+        return {
+            "error": "unknown",
+            "message": error_msg
+        }
+
+async def get_order_statuses(ctx: RunContext[AgentDependencies], user_query: str) -> dict:
     """
-    Process raw order API response into clean structure for LLM.
+    Fetch the status of every order referenced in the query in one call.
 
-    Translates status codes, formats dates, and extracts key information.
+    Use instead of get_order_status when the query names more than one order,
+    e.g. "status of orders 12345, 12388 and 12391". The orders are fetched
+    concurrently.
 
     Args:
-        data: Raw response from order status API
+        ctx: RunContext with dependencies (customer_id, language, erp_business_entity_id)
+        user_query: Original user query for order ID extraction
 
     Returns:
-        Processed order data with human-readable fields
-    """
-    processed = {
-        "order_id": data.get("orderId"),
-        "status": translate_order_status(data.get("status", -1)),
-        "status_code": data.get("status"),
-        "order_date": data.get("orderDate"),
-        "shipping_agent": data.get("shippingAgentName"),
-        "ship_to_address": data.get("shipToAddress"),
-        "subtotal": data.get("subTotal"),
-        "next_shipment": data.get("nextShipment"),
-        "order_lines": []
+        dict with structure:
+        {
+            "orders": [...],              # One entry per order ID, in query order: the
+                                          # structure get_order_status returns, or
+                                          # {"order_id": str, "error": str, "message": str}
+            "order_ids": [str],           # IDs looked up
+            "failed": int,                # Orders that could not be fetched
+            "skipped_order_ids": [str]    # IDs beyond the per-query limit, not looked up
+        }
+    """
+    return await fetch_order_statuses(ctx.deps, extract_order_ids(user_query))
+
+async def fetch_order_statuses(deps: AgentDependencies, order_ids: list[str]) -> dict:
+    """
+    Body of get_order_statuses: fetch up to ORDER_MAX_IDS orders, at most
+    ORDER_FANOUT_LIMIT at a time, or the latest order when there are no IDs.
+
+    Each order goes through the request's ToolMemo under get_order_status's
+    key, so orders already fetched or prefetched are not requested again.
+    """
+    fanout = asyncio.Semaphore(ORDER_FANOUT_LIMIT)
+    memo = deps["memo"]
+
+    async def fetch(order_id: str | None) -> ProcessedOrder | dict:
+        async with fanout:
+            return await fetch_order_status(deps, order_id)
+
+    async def lookup(order_id: str | None) -> ProcessedOrder | dict:
+        result = await memo.get_or_run(("get_order_status", order_id or "latest"), functools.partial(fetch, order_id))
+        return result if isinstance(result, ProcessedOrder) else {"order_id": order_id, **result}
+
+    fetched = order_ids[:ORDER_MAX_IDS]
+    orders = await asyncio.gather(*(lookup(order_id) for order_id in fetched or [None]))
+    return {
+        "orders": orders,
+        "order_ids": fetched,
+        "failed": sum(not isinstance(order, ProcessedOrder) for order in orders),
+        "skipped_order_ids": order_ids[ORDER_MAX_IDS:],
     }
 
-    # Process order lines if present
-    if "orderLines" in data and data["orderLines"]:
-        for line in data["orderLines"]:
-            processed["order_lines"].append({
-                "item_id": line.get("itemId"),
-                "status": line.get("status")
-            })
+# Words that mark a query as being about an order rather than a cable
+ORDER_QUERY_WORDS = {
+    "order", "orders", "status", "delivery", "deliver", "delivered", "tracking",
+    "track", "shipment", "shipping", "shipped", "dispatched", "arrive",
+}
+
+def classify_query(query: str) -> Literal["cable", "order"] | None:
+    """
+    Rule-based version of the agent's STEP 1 query classification.
+
+    An explicit order reference ("order 12345", "#12345") wins. Otherwise a
+    named connector does: years, model numbers and words like "shipping" or
+    "status" show up in cable queries too ("HDMI cable for my 2023 LG TV",
+    "usb c cable with fast shipping").
+
+    Returns:
+        "order" for an explicit order reference, else "cable" when a
+        connector is named, else "order" for bare order numbers or order
+        keywords, None when the rules cannot tell
+    """
+    if any(re.search(pattern, query, re.IGNORECASE) for pattern in EXPLICIT_ORDER_ID_PATTERNS):
+        return "order"
+    if find_connector_mentions(query):
+        return "cable"
+    if extract_order_id(query) or ORDER_QUERY_WORDS & set(re.findall(r'[a-z]+', query.lower())):
+        return "order"
+    return None
+
+# Deterministic fast path for direct cable queries
+# Words that may surround connector names without changing their meaning
+# Not "male"/"female": a gender word that is not part of a connector mention
+# ("hdmi male to female") says which end it belongs to only by word order
+FAST_PATH_FILLER_WORDS = {
+    "a", "an", "the", "to", "from", "cable", "cables", "cord", "lead", "wire",
+    "adapter", "adaptor", "converter", "connector",
+    "i", "need", "want", "looking", "for", "please",
+}
+
+class FastPathResolver:
+    """
+    Answer direct cable queries ("HDMI to USB-C") from the catalog without the LLM.
+
+    A query is only answered when every word is either a connector or a
+    filler word, it names one or two connectors, and the resulting pair is
+    listed as compatible by CableGuide. Anything else falls back to the agent.
+    """
+
+    def __init__(self, catalog: ConnectorCatalog):
+        self.catalog = catalog
+        self.counters = {"hits": 0, "misses": 0}
+
+    async def resolve(self, query: str) -> CableResponse | None:
+        response = await self._resolve(query)
+        self.counters["hits" if response else "misses"] += 1
+        return response
+
+    async def best_guess(self, query: str) -> CableResponse | None:
+        """
+        Looser resolve for when the agent ran out of time: other words are
+        ignored, the first two connectors named are used and ambiguous forms
+        take their first variant.
+        """
+        return await self._resolve(query, strict=False)
+
+    async def _resolve(self, query: str, strict: bool = True) -> CableResponse | None:
+        if extract_order_id(query):
+            return None
+        mentions = find_connector_mentions(query)
+        if not 1 <= len(mentions) <= (2 if strict else len(mentions)):
+            return None
+
+        if strict:
+            # Every remaining word must be filler, otherwise the query needs reasoning
+            remainder = query
+            for mention in reversed(mentions):
+                remainder = remainder[:mention.start] + " " + remainder[mention.end:]
+            if any(word not in FAST_PATH_FILLER_WORDS for word in re.findall(r'[a-z0-9]+', remainder.lower())):
+                return None
+
+            # Ambiguous forms ("dvi") need the agent to pick a variant
+            if any(len(mention.families) > 1 for mention in mentions):
+                return None
+
+        # A single connector ("hdmi cable") means the same connector on both ends
+        first, second = mentions[0], mentions[min(1, len(mentions) - 1)]
+        await self.catalog.get_ends_a()
+        taxonomy = self.catalog.taxonomy()
+        from_connector = taxonomy.default(first.families[0], first.gender)
+        if from_connector is None:
+            return None
+        ends_b = await self.catalog.get_ends_b(from_connector)
+        to_connector = taxonomy.default(second.families[0], second.gender)
+        if to_connector not in ends_b and second.gender is None:
+            # No gender stated and the default is not compatible, try the other one
+            to_connector = taxonomy.counterpart(to_connector) if to_connector else None
+        if to_connector not in ends_b:
+            return None
+        return CableResponse(from_connector=from_connector, to_connector=to_connector)
+
+    def stats(self) -> dict:
+        total = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": self.counters["hits"] / total if total else 0.0,
+        }
+
+def order_summary(processed: ProcessedOrder) -> str:
+    """Template summary of processed order data, for replies without the LLM."""
+    summary = f"Order {processed.order_id} is {processed.status}"
+    if processed.total_items:
+        summary += f" with {processed.total_items} items"
+    if processed.order_date:
+        summary += f", ordered on {processed.order_date}"
+    summary += "."
+    if processed.shipping_agent:
+        summary += f" {processed.shipping_agent} is handling delivery."
+    if processed.next_shipment:
+        summary += f" Next shipment: {processed.next_shipment}."
+    return summary
+
+class DegradedResponder:
+    """
+    Replies for queries whose agent run missed SEARCH_DEADLINE.
+
+    Cable queries get the fast path's best guess from the named connectors,
+    order queries a template summary if every order they name was already
+    fetched during the run, and anything else a structured "try again".
+    """
+
+    # The degraded reply itself must not blow the budget again
+    TIMEOUT = 1.0
+
+    def __init__(self, fast_path: FastPathResolver):
+        self.fast_path = fast_path
+        self.counters = {"deadline_exceeded": 0, "fast_path": 0, "order_summary": 0, "try_again": 0}
+
+    async def respond(self, query: str, deps: AgentDependencies) -> SearchResponse:
+        self.counters["deadline_exceeded"] += 1
+        logger.warning("Search deadline exceeded, degrading", query=clip(query), deadline=SEARCH_DEADLINE)
+        # Batch items share one memo: only order queries may read orders from it,
+        # and "latest" only for a query that names no order
+        order_ids = extract_order_ids(query)[:ORDER_MAX_IDS]
+        is_order = bool(order_ids) or classify_query(query) == "order"
+        orders = [deps["memo"].peek(("get_order_status", order_id or "latest")) for order_id in order_ids or [None]] if is_order else []
+        if orders and all(isinstance(processed, ProcessedOrder) for processed in orders):
+            self.counters["order_summary"] += 1
+            return OrderStatusResponse(
+                summary=" ".join(order_summary(processed) for processed in orders),
+                order_ids=[processed.order_id for processed in orders if processed.order_id],
+            )
+        try:
+            guess = await asyncio.wait_for(self.fast_path.best_guess(query), self.TIMEOUT)
+        except Exception as e:
+            logger.warning("Degraded cable lookup failed", error=str(e))
+            guess = None
+        if guess is not None:
+            self.counters["fast_path"] += 1
+            return guess
+        self.counters["try_again"] += 1
+        return TryAgainResponse(
+            message="This is taking longer than usual, please try again in a moment.",
+            retry_after=5,
+        )
+
+    def stats(self) -> dict:
+        return {**self.counters, "deadline": SEARCH_DEADLINE}
+
+# Speculative tool prefetch
+def guess_product_query(query: str) -> str | None:
+    """
+    The query as a product search, if it plainly names a product.
+
+    Only model numbers count: letters with digits ("PS5", "QN65Q80C",
+    "iphone15"), or a capitalized name followed by a number ("iPhone 15",
+    "Pixel 8"). Connector names are ignored and order queries never name a
+    product, so "my old monitor", "cable for Samsung TV" or "DisplayPort to
+    HDMI" do not spend Google quota on a guess.
+    """
+    if classify_query(query) == "order":
+        return None
+    remainder = query
+    for mention in reversed(find_connector_mentions(query)):
+        remainder = remainder[:mention.start] + " " + remainder[mention.end:]
+    words = re.findall(r'[^\W_]+', remainder)
+    if not any(
+        (any(c.isdigit() for c in word) and any(c.isalpha() for c in word))
+        or (any(c.isupper() for c in word) and next_word.isdigit())
+        for word, next_word in zip(words, words[1:] + [""])
+    ):
+        return None
+    return " ".join(remainder.split())
+
+class Prefetcher:
+    """
+    Start the tool calls the agent will most likely make as soon as a query reaches it.
+
+    Guesses from the raw query: an order ID or order words mean
+    get_order_status, connector names mean the CableGuide lookups of
+    resolve_cable, and a product name means search_product_info. The calls
+    run in the request's ToolMemo under the keys the tools use, so a tool
+    asking for the same data joins the running call instead of starting new
+    I/O. Prefetches the agent did not use are cancelled when it finishes;
+    upstream calls they share through SingleFlight still complete and fill
+    their caches.
+    """
+
+    KINDS = ("orders", "catalog", "products")
+
+    def __init__(self, kinds: set[str] = PREFETCH):
+        unknown = kinds - set(self.KINDS)
+        if unknown:
+            raise ValueError(f"PREFETCH must list orders, catalog and/or products, not {sorted(unknown)}")
+        self.kinds = kinds
+        self.counters = {"started": 0, "used": 0, "cancelled": 0, "unused": 0}
+        self.by_kind = {kind: {"started": 0, "used": 0} for kind in self.KINDS}
+
+    def start(self, query: str, deps: AgentDependencies) -> list[tuple[str, Hashable]]:
+        """
+        Start the prefetches for query.
+
+        Returns:
+            (kind, memo key) of each prefetch started, to pass to finish()
+        """
+        memo = deps["memo"]
+        started = []
+
+        def prefetch(kind: str, key: Hashable, fn: Callable[[], Awaitable[Any]]):
+            if memo.prefetch(key, fn):
+                started.append((kind, key))
+
+        if "orders" in self.kinds and classify_query(query) == "order":
+            # At most ORDER_FANOUT_LIMIT at once, like get_order_statuses
+            for order_id in extract_order_ids(query)[:min(ORDER_MAX_IDS, ORDER_FANOUT_LIMIT)] or [None]:
+                prefetch("orders", ("get_order_status", order_id or "latest"), functools.partial(fetch_order_status, deps, order_id))
+
+        if "catalog" in self.kinds:
+            # resolve_cable's B-end lookups for the catalog connectors closest to the first one named
+            catalog = deps["catalog"]
+            for mention in find_connector_mentions(query)[:1]:
+                for name, _ in catalog.index().search(query[mention.start:mention.end], 3):
+                    prefetch("catalog", ("get_cable_ends_b", catalog.key(name)), functools.partial(catalog.get_ends_b, name))
+
+        if "products" in self.kinds and deps["google"].configured():
+            product_query = guess_product_query(query)
+            if product_query:
+                key = ("search_product_info", " ".join(product_tokens(product_query)))
+                prefetch("products", key, lambda: lookup_product_info(deps, product_query))
+
+        self.counters["started"] += len(started)
+        for kind, _ in started:
+            self.by_kind[kind]["started"] += 1
+        return started
+
+    def finish(self, deps: AgentDependencies, started: list[tuple[str, Hashable]]):
+        """Count which prefetches the agent used and cancel the ones still running unused."""
+        outcomes = {"used": 0, "cancelled": 0, "unused": 0}
+        for kind, key in started:
+            outcome = deps["memo"].settle_prefetch(key)
+            outcomes[outcome] += 1
+            self.counters[outcome] += 1
+            if outcome == "used":
+                self.by_kind[kind]["used"] += 1
+        if started:
+            logger.info("Prefetch finished", sampled=True, **outcomes)
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "hit_rate": self.counters["used"] / self.counters["started"] if self.counters["started"] else 0.0,
+            "by_kind": self.by_kind,
+        }
+
+class Overloaded(Exception):
+    """Raised when an agent run is not admitted: the wait queue is full or the wait timed out."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Search is overloaded: {reason}")
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Caps concurrent agent runs globally and per customer, with a bounded wait queue.
+
+    Runs beyond the caps wait in a per-customer FIFO; freed slots go to
+    waiting customers round-robin, so one customer's burst cannot starve the
+    others. A full queue, or a wait longer than ADMISSION_QUEUE_TIMEOUT,
+    raises Overloaded right away instead of piling up more work.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = ADMISSION_MAX_CONCURRENT,
+        max_per_customer: int = ADMISSION_MAX_PER_CUSTOMER,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_per_customer = max_per_customer
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self.queued = 0
+        self._running_by_customer: dict[str, int] = {}
+        # Customers with waiters, in round-robin order
+        self._waiters: OrderedDict[str, deque[asyncio.Future]] = OrderedDict()
+        self.counters = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+            "wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+        }
+
+    @asynccontextmanager
+    async def slot(self, customer_id: str):
+        await self.acquire(customer_id)
+        try:
+            yield
+        finally:
+            self.release(customer_id)
+
+    async def acquire(self, customer_id: str):
+        """
+        Wait for a run slot for customer_id.
+
+        Raises:
+            Overloaded: when the queue is full or the wait timed out
+        """
+        if self._has_room(customer_id) and self._next_customer() is None:
+            self._grant(customer_id)
+            self.counters["admitted"] += 1
+            return
+        if self.queued >= self.queue_size:
+            self.counters["rejected_queue_full"] += 1
+            raise Overloaded("queue full", ADMISSION_RETRY_AFTER)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(customer_id, deque()).append(waiter)
+        self.queued += 1
+        self.counters["queued"] += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait({waiter}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            # Granted just before the caller went away: hand the slot on
+            if not self._abandon(customer_id, waiter):
+                self.release(customer_id)
+            raise
+        waited = time.monotonic() - started
+        self.counters["wait_seconds"] += waited
+        self.counters["max_wait_seconds"] = max(self.counters["max_wait_seconds"], waited)
+        if not waiter.done():
+            self._abandon(customer_id, waiter)
+            self.counters["rejected_timeout"] += 1
+            raise Overloaded("queue timeout", ADMISSION_RETRY_AFTER)
+        self.counters["admitted"] += 1
+
+    def release(self, customer_id: str):
+        self.running -= 1
+        remaining = self._running_by_customer[customer_id] - 1
+        if remaining:
+            self._running_by_customer[customer_id] = remaining
+        else:
+            del self._running_by_customer[customer_id]
+        self._dispatch()
+
+    def _has_room(self, customer_id: str) -> bool:
+        return self.running < self.max_concurrent and self._running_by_customer.get(customer_id, 0) < self.max_per_customer
+
+    def _grant(self, customer_id: str):
+        self.running += 1
+        self._running_by_customer[customer_id] = self._running_by_customer.get(customer_id, 0) + 1
+
+    def _next_customer(self) -> str | None:
+        """First waiting customer, in round-robin order, still under the per-customer cap."""
+        for customer_id in self._waiters:
+            if self._running_by_customer.get(customer_id, 0) < self.max_per_customer:
+                return customer_id
+        return None
+
+    def _dispatch(self):
+        while self.running < self.max_concurrent:
+            customer_id = self._next_customer()
+            if customer_id is None:
+                return
+            waiters = self._waiters.pop(customer_id)
+            waiter = waiters.popleft()
+            self.queued -= 1
+            if waiters:
+                # Back of the line until every other waiting customer had a turn
+                self._waiters[customer_id] = waiters
+            self._grant(customer_id)
+            waiter.set_result(None)
+
+    def _abandon(self, customer_id: str, waiter: asyncio.Future) -> bool:
+        """Remove a waiter that gave up; False if it had already been granted a slot."""
+        waiters = self._waiters.get(customer_id)
+        if waiters is None or waiter not in waiters:
+            return False
+        waiters.remove(waiter)
+        self.queued -= 1
+        if not waiters:
+            del self._waiters[customer_id]
+        return True
+
+    def stats(self) -> dict:
+        waits = self.counters["admitted"]
+        return {
+            "running": self.running,
+            "queue_depth": self.queued,
+            "customers_running": len(self._running_by_customer),
+            "customers_waiting": len(self._waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_per_customer": self.max_per_customer,
+            "queue_size": self.queue_size,
+            **self.counters,
+            "avg_wait_seconds": self.counters["wait_seconds"] / waits if waits else 0.0,
+        }
+
+# Response cache for /search
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query so trivially different spellings share a cache entry.
+
+    Unicode is NFKC-normalized and case-folded (so "Straße" and "STRASSE"
+    match), hyphens become spaces, punctuation that is not inside a token is
+    dropped and whitespace is collapsed. Tokens like "3.5mm" and "ps/2" keep
+    their inner punctuation.
+
+    Example: "Hdmi  cable?" -> "hdmi cable"
+    """
+    text = unicodedata.normalize("NFKC", query).casefold().replace("-", " ")
+    text = re.sub(r'[^\w\s]+(?!\w)|(?<!\w)[^\w\s]+', " ", text)
+    return " ".join(text.split())
+
+def language_tag(language: str) -> str:
+    """Primary language subtag, e.g. "en-US" -> "en"."""
+    return language.replace("_", "-").split("-")[0].lower()
+
+class ResponseCacheEntry(NamedTuple):
+    response: AgentResponse
+    expires_at: float
+    size: int
+
+class ResponseCache:
+    """
+    LRU + TTL cache of /search responses with an approximate memory cap.
+
+    Cable answers do not depend on who asks, so they are keyed on the
+    normalized query and language only and shared across customers. Order
+    answers, and cable answers to queries that read as order queries, are
+    keyed per customerId/erpBusinessEntityId and expire quickly. Empty cable
+    answers (no match) are not cached.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple, ResponseCacheEntry] = OrderedDict()
+        self._bytes = 0
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "skipped": 0}
+
+    @staticmethod
+    def cable_key(query: str, deps: AgentDependencies) -> tuple:
+        return ("cable", language_tag(deps["language"]), normalize_query(query))
+
+    @staticmethod
+    def order_key(query: str, deps: AgentDependencies) -> tuple:
+        return (
+            "order",
+            deps["customer_id"],
+            deps["erp_business_entity_id"],
+            language_tag(deps["language"]),
+            normalize_query(query),
+        )
+
+    def lookup(self, query: str, deps: AgentDependencies) -> AgentResponse | None:
+        for key in (self.cable_key(query, deps), self.order_key(query, deps)):
+            response = self._get(key)
+            if response is not None:
+                self.counters["hits"] += 1
+                return response
+        self.counters["misses"] += 1
+        return None
+
+    def store(self, query: str, deps: AgentDependencies, response: AgentResponse):
+        if isinstance(response, CableResponse) and not (response.from_connector and response.to_connector):
+            # "No match" is also what the agent answers while CableGuide is down
+            self.counters["skipped"] += 1
+        elif isinstance(response, CableResponse) and classify_query(query) != "order":
+            self._put(self.cable_key(query, deps), response, RESPONSE_CACHE_CABLE_TTL)
+        else:
+            self._put(self.order_key(query, deps), response, RESPONSE_CACHE_ORDER_TTL)
+
+    def _get(self, key: tuple) -> AgentResponse | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self.counters["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry.response
+
+    def _put(self, key: tuple, response: AgentResponse, ttl: float):
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        if key in self._entries:
+            self._remove(key)
+        size = len(response.model_dump_json()) + len(repr(key))
+        self._entries[key] = ResponseCacheEntry(response, time.monotonic() + ttl, size)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.counters["evictions"] += 1
+
+    def _remove(self, key: tuple):
+        self._bytes -= self._entries.pop(key).size
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+# Conversational sessions
+class Session:
+    """One conversation: the history the agent continues from and the tool results of its turns."""
+
+    def __init__(self):
+        self.messages: list[ModelMessage] = []
+        self.memo = ToolMemo()
+        self.lock = asyncio.Lock()
+        self.response_type: Literal["cable", "order"] | None = None
+        self.turns = 0
+        self.last_used = time.monotonic()
+
+class SessionStore:
+    """
+    Conversations for /search?sessionId=..., keyed by customerId and session ID.
+
+    A follow-up ("and the female version?", "what about order 12346?") is
+    answered with the session's earlier turns as message history, routed
+    like the previous answer when the rules cannot classify it, and shares a
+    ToolMemo with the earlier turns so catalog and product lookups are not
+    repeated. Order results are dropped after each turn and go through the
+    order cache again, which revalidates them.
+
+    History is compacted as turns are recorded: a turn is kept as the user's
+    query and the final answer only, without the tool calls and tool
+    results the agent made on the way, and only the last max_turns turns
+    are kept. Sessions idle for ttl seconds expire, and the least recently
+    used are evicted beyond max_entries.
+    """
+
+    # Finished tool results kept per session across turns
+    MAX_TOOL_RESULTS = 64
+
+    def __init__(self, ttl: float = SESSION_TTL, max_entries: int = SESSION_MAX_ENTRIES, max_turns: int = SESSION_MAX_TURNS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_turns = max_turns
+        self._sessions: OrderedDict[tuple[str, str], Session] = OrderedDict()
+        self.counters = {"created": 0, "resumed": 0, "expired": 0, "evicted": 0, "turns": 0, "compacted_turns": 0}
+
+    def get(self, customer_id: str, session_id: str) -> Session:
+        """Return the customer's session, or a new one if it expired or never existed."""
+        now = time.monotonic()
+        while self._sessions:
+            key, session = next(iter(self._sessions.items()))
+            if session.last_used + self.ttl > now:
+                break
+            del self._sessions[key]
+            self.counters["expired"] += 1
+
+        key = (customer_id, session_id)
+        session = self._sessions.get(key)
+        if session is None:
+            session = self._sessions[key] = Session()
+            self.counters["created"] += 1
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+                self.counters["evicted"] += 1
+        else:
+            self._sessions.move_to_end(key)
+            self.counters["resumed"] += 1
+        session.last_used = now
+        return session
+
+    def record(self, session: Session, query: str, response: SearchResponse):
+        """
+        Append a finished turn to the session, compacted.
+
+        Every answered turn is recorded, whether it came from the response
+        cache, the fast path, the agent or the degraded responder, so the
+        next turn has it as context.
 
-    # Add summary fields for quick reference
-    processed["total_items"] = len(processed["order_lines"])
+        Args:
+            session: Session the turn belongs to
+            query: The user query
+            response: The answer sent; a TryAgainResponse keeps the previous
+                response type for routing
+        """
+        session.messages.append(ModelRequest(parts=[UserPromptPart(query)]))
+        session.messages.append(ModelResponse(parts=[TextPart(response.model_dump_json())]))
+        excess = session.turns + 1 - self.max_turns
+        if excess > 0:
+            del session.messages[:2 * excess]
+            self.counters["compacted_turns"] += excess
+        # The agent only adds its system prompt to a run without history
+        first = session.messages[0]
+        session.messages[0] = ModelRequest(parts=[SystemPromptPart(AGENT_SYSTEM_PROMPT), *(part for part in first.parts if not isinstance(part, SystemPromptPart))])
+        session.turns = len(session.messages) // 2
+        if isinstance(response, (CableResponse, OrderStatusResponse)):
+            session.response_type = response.response_type
+        session.memo.forget("get_order_status")
+        session.memo.trim(self.MAX_TOOL_RESULTS)
+        session.last_used = time.monotonic()
+        self.counters["turns"] += 1
 
-    return processed
+    def stats(self) -> dict:
+        return {**self.counters, "sessions": len(self._sessions)}
 
-async def search_product_info(ctx: RunContext[AgentDependencies], product_query: str) -> dict:
-    """
-    Search Google Custom Search API for product cable information.
+# Agent usage accounting
+def usage_cost(tier: str, usage) -> float:
+    """Estimated USD cost of a run's tokens at the tier's MODEL_PRICES."""
+    input_price, output_price = MODEL_PRICES[tier]
+    return (usage.input_tokens * input_price + usage.output_tokens * output_price) / 1_000_000
 
-    Args:
-        ctx: RunContext from pydantic-ai
-        product_query: Search query (e.g., "iPhone 15 Pro cable connectors")
+class UsageStats:
+    """Per-run token usage, latency and cost from pydantic-ai, aggregated for /stats overall and per model tier."""
 
-    Returns:
-        dict with structure:
-        {
-            "success": bool,
-            "connector_types": list[str],  # Extracted connector types
-            "snippets": list[str],  # Top 3 result snippets for context
-            "error": str | None
-        }
-    """
-    print(f"Calling search_product_info with query: {product_query}")
+    def __init__(self):
+        self.counters = self._empty_counters()
+        self.tiers = {tier: self._empty_counters() for tier in MODEL_PRICES}
 
-    # Validate configuration
-    if not GOOGLE_API_KEY or not GOOGLE_CSE_ID:
+    @staticmethod
+    def _empty_counters() -> dict:
         return {
-            "success": False,
-            "connector_types": [],
-            "snippets": [],
-            "error": "Google Custom Search not configured. Set GOOGLE_API_KEY and GOOGLE_CSE_ID environment variables."
+            "runs": 0,
+            "model_requests": 0,
+            "tool_calls": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "seconds": 0.0,
+            "cost_usd": 0.0,
         }
 
-    # Build Google Custom Search API URL
-    base_url = "https://www.googleapis.com/customsearch/v1"
-    params = {
-        "key": GOOGLE_API_KEY,
-        "cx": GOOGLE_CSE_ID,
-        "q": product_query,
-        "num": 5  # Fetch top 5 results for better connector extraction
-    }
+    def record(self, query: str, usage, seconds: float, tier: str = "large"):
+        """
+        Record one agent run.
 
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(base_url, params=params)
-            response.raise_for_status()
-            data = response.json()
-
-            # Extract connector types from search results
-            connector_types = extract_connector_types(data)
-
-            # Get top 3 snippets for agent context
-            snippets = []
-            if "items" in data:
-                for item in data["items"][:3]:
-                    if "snippet" in item:
-                        snippets.append(item["snippet"])
-
-            return {
-                "success": True,
-                "connector_types": connector_types,
-                "snippets": snippets,
-                "error": None
-            }
+        Args:
+            query: The user query, for the log line
+            usage: RunUsage from result.usage
+            seconds: Wall-clock time of the run
+            tier: Model tier the run used ("small" or "large")
+        """
+        cost = usage_cost(tier, usage)
+        for counters in (self.counters, self.tiers[tier]):
+            counters["runs"] += 1
+            counters["model_requests"] += usage.requests
+            counters["tool_calls"] += usage.tool_calls
+            counters["input_tokens"] += usage.input_tokens
+            counters["output_tokens"] += usage.output_tokens
+            counters["seconds"] += seconds
+            counters["cost_usd"] += cost
+        AGENT_MODEL_REQUESTS.labels(tier).observe(usage.requests)
+        AGENT_TOKENS.labels(tier, "input").observe(usage.input_tokens)
+        AGENT_TOKENS.labels(tier, "output").observe(usage.output_tokens)
+        logger.info(
+            "Agent run",
+            sampled=True,
+            query=clip(query),
+            tier=tier,
+            model_requests=usage.requests,
+            tool_calls=usage.tool_calls,
+            input_tokens=usage.input_tokens,
+            output_tokens=usage.output_tokens,
+            cost_usd=round(cost, 6),
+            seconds=round(seconds, 3),
+        )
 
-    except httpx.HTTPStatusError as e:
-        error_msg = f"Google API HTTP error: {e.response.status_code}"
-        if e.response.status_code == 429:
-            error_msg += " - Rate limit exceeded"
-        elif e.response.status_code == 403:
-            error_msg += " - Invalid API key or CSE ID"
-        print(error_msg)
-        return {
-            "success": False,
-            "connector_types": [],
-            "snippets": [],
-            "error": error_msg
-        }
-    except httpx.TimeoutException:
-        error_msg = "Google API request timed out"
-        print(error_msg)
+    @staticmethod
+    def _summary(counters: dict) -> dict:
+        runs = counters["runs"]
         return {
-            "success": False,
-            "connector_types": [],
-            "snippets": [],
-            "error": error_msg
+            **counters,
+            "avg_model_requests": counters["model_requests"] / runs if runs else 0.0,
+            "avg_input_tokens": counters["input_tokens"] / runs if runs else 0.0,
+            "avg_output_tokens": counters["output_tokens"] / runs if runs else 0.0,
+            "avg_seconds": counters["seconds"] / runs if runs else 0.0,
+            "avg_cost_usd": counters["cost_usd"] / runs if runs else 0.0,
         }
-    except Exception as e:
-        error_msg = f"Unexpected error: {str(e)}"
-        print(error_msg)
+
+    def stats(self) -> dict:
         return {
-            "success": False,
-            "connector_types": [],
-            "snippets": [],
-            "error": error_msg
+            **self._summary(self.counters),
+            "tiers": {tier: self._summary(counters) for tier, counters in self.tiers.items()},
         }
 
-async def get_order_status(ctx: RunContext[AgentDependencies], user_query: str) -> dict:
-    """
-    Fetch order status from EET Order Status API.
+class RouteDecision(NamedTuple):
+    tier: str                  # "small" or "large"
+    response_type: str | None  # "cable", "order" or None when unknown
+    source: str                # "rules", "session", "model" or "off"
 
-    Extracts order ID from user_query. If no ID found, API returns latest order.
+class ModelRouter:
+    """
+    Pick the model tier for each agent run.
 
-    Args:
-        ctx: RunContext with dependencies (customer_id, language, erp_business_entity_id)
-        user_query: Original user query for order ID extraction
+    Order lookups and their summaries are simple enough for the small model;
+    cable reasoning and queries nobody could classify go to the large one.
+    With ROUTING_MODE=model, queries the rules cannot classify are first
+    classified by the small model.
+    """
 
-    Returns:
-        Processed order data dict with structure:
-        {
-            "order_id": str,               # Order identifier
-            "status": str,                 # Human-readable: "Confirmed", "Picking in Progress",
-                                          # "Partly Dispatched", "Dispatched", "Received"
-            "status_code": int,            # Raw status code (0-10)
-            "order_date": str,             # When order was placed (ISO format)
-            "shipping_agent": str,         # Delivery company name
-            "ship_to_address": str,        # Shipping address
-            "subtotal": float,             # Order total amount
-            "next_shipment": str | None,   # Next shipment date if available
-            "order_lines": [               # Array of ordered items
-                {
-                    "item_id": str,        # Product identifier
-                    "status": str | None   # Item-specific status
-                }
-            ],
-            "total_items": int             # Count of items in order
+    def __init__(self, mode: str = ROUTING_MODE):
+        self.mode = mode
+        self.tier_for = {"order": ROUTE_ORDER_TIER, "cable": ROUTE_CABLE_TIER, None: ROUTE_UNKNOWN_TIER}
+        if mode not in ("rules", "model", "off"):
+            raise ValueError(f"ROUTING_MODE must be rules, model or off, not {mode!r}")
+        for tier in self.tier_for.values():
+            if tier not in MODEL_PRICES:
+                raise ValueError(f"Unknown model tier {tier!r}, expected small or large")
+        self.counters = {
+            "small": 0,
+            "large": 0,
+            "classifier_runs": 0,
+            "classifier_failures": 0,
+            "classifier_seconds": 0.0,
+            "classifier_cost_usd": 0.0,
         }
 
-        Or error dict on failure:
-        {
-            "error": str,
-            "message": str
-        }
-    """
-    print(f"Calling get_order_status with query: {user_query}")
+    async def route(self, query: str, previous: Literal["cable", "order"] | None = None) -> RouteDecision:
+        """
+        Classify the query and choose a tier for it.
 
-    # Extract order ID from query
-    order_id = extract_order_id(user_query)
-    if order_id:
-        print(f"Extracted order ID: {order_id}")
-    else:
-        print("No order ID found, will fetch latest order")
-
-    # Build API request
-    url = "https://stage-api.eetgroup.com/api/AiSearch/OrderStatus"
-    params = {
-        "customerId": ctx.deps["customer_id"],
-        "language": ctx.deps["language"],
-        "erpBusinessEntityId": ctx.deps["erp_business_entity_id"],
-    }
-    if order_id:
-        params["orderId"] = order_id
+        Args:
+            query: Natural language query (cable or order related)
+            previous: Response type of the session's last answer; a follow-up
+                the rules cannot classify ("and the female version?") keeps it
 
-    # Call API with error handling
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            print(f"Raw order status response: {data}")
+        Returns:
+            RouteDecision with the tier, the response type it was based on
+            and which classifier decided
+        """
+        if self.mode == "off":
+            decision = RouteDecision("large", None, "off")
+        else:
+            response_type, source = classify_query(query), "rules"
+            if response_type is None and previous is not None:
+                response_type, source = previous, "session"
+            if response_type is None and self.mode == "model":
+                response_type, source = await self.classify(query), "model"
+            decision = RouteDecision(self.tier_for[response_type], response_type, source)
+        self.counters[decision.tier] += 1
+        logger.info("Routed query", sampled=True, query=clip(query), tier=decision.tier, source=decision.source, response_type=decision.response_type)
+        return decision
 
-            # Process response to clean structure with translated status
-            processed = process_order_response(data)
-            print(f"Processed order data: {processed}")
-            return processed
+    async def classify(self, query: str) -> Literal["cable", "order"] | None:
+        """STEP 1 classification on the small model, for queries the rules cannot tell."""
+        self.counters["classifier_runs"] += 1
+        started = time.perf_counter()
+        try:
+            result = await classifier_agent.run(query)
+        except Exception as e:
+            self.counters["classifier_failures"] += 1
+            logger.warning("Query classification failed", error=str(e))
+            return None
+        finally:
+            self.counters["classifier_seconds"] += time.perf_counter() - started
+        self.counters["classifier_cost_usd"] += usage_cost("small", result.usage)
+        return result.output if result.output != "other" else None
 
-    except httpx.HTTPStatusError as e:
-        error_msg = f"API error: {e.response.status_code}"
-        if e.response.status_code == 404:
-            error_msg += " - Order not found"
-        print(error_msg)
-        return {
-            "error": error_msg,
-            "message": "Could not fetch order status"
-        }
-    except httpx.TimeoutException:
-        error_msg = "Order status API request timed out"
-        print(error_msg)
+    def stats(self) -> dict:
+        runs = self.counters["classifier_runs"]
         return {
-            "error": "timeout",
-            "message": error_msg
+            "mode": self.mode,
+            "models": {"small": MODEL_SMALL, "large": MODEL_LARGE},
+            "tier_for": {str(response_type): tier for response_type, tier in self.tier_for.items()},
+            **self.counters,
+            "avg_classifier_seconds": self.counters["classifier_seconds"] / runs if runs else 0.0,
         }
-    except Exception as e:
-        error_msg = f"Unexpected error: {str(e)}"
-        print(error_msg)
+
+class HedgedModel(WrapperModel):
+    """
+    Model that duplicates slow requests to a fallback model and keeps the first answer.
+
+    A request still running after the HEDGE_PERCENTILE latency of recent
+    requests (at least HEDGE_MIN_DELAY, HEDGE_DEFAULT_DELAY until there is
+    enough history) is sent to the fallback model as well; whichever answers
+    first wins and the other is cancelled. A request that fails outright is
+    retried on the fallback. Streaming requests are not hedged.
+    """
+
+    def __init__(self, wrapped: Model, fallback: Model):
+        super().__init__(wrapped)
+        self.fallback = fallback
+        self.latency = LatencyTracker()
+        self.counters = {"requests": 0, "hedged": 0, "hedge_wins": 0, "failovers": 0}
+
+    def hedge_delay(self) -> float:
+        observed = self.latency.percentile(HEDGE_PERCENTILE)
+        return HEDGE_DEFAULT_DELAY if observed is None else max(HEDGE_MIN_DELAY, observed)
+
+    async def request(
+        self,
+        messages: list[ModelMessage],
+        model_settings: ModelSettings | None,
+        model_request_parameters: ModelRequestParameters,
+    ) -> ModelResponse:
+        self.counters["requests"] += 1
+        started = time.monotonic()
+        primary = asyncio.ensure_future(self.wrapped.request(messages, model_settings, model_request_parameters))
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay())
+            if done and primary.exception() is None:
+                self.latency.record(time.monotonic() - started)
+                return primary.result()
+            self.counters["failovers" if done else "hedged"] += 1
+            hedge = asyncio.ensure_future(self._fallback_request(messages, model_settings, model_request_parameters))
+            pending = {hedge} if done else {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.counters["hedge_wins"] += 1
+                        else:
+                            self.latency.record(time.monotonic() - started)
+                        return task.result()
+            raise primary.exception()
+        finally:
+            if not primary.done():
+                # A lower bound, but it keeps the percentile honest about slow calls
+                self.latency.record(time.monotonic() - started)
+            for task in (primary, hedge):
+                if task is not None:
+                    task.cancel()
+
+    async def _fallback_request(
+        self,
+        messages: list[ModelMessage],
+        model_settings: ModelSettings | None,
+        model_request_parameters: ModelRequestParameters,
+    ) -> ModelResponse:
+        prepared_messages = self.fallback.prepare_messages(messages, model_request_parameters)
+        return await self.fallback.request(prepared_messages, model_settings, model_request_parameters)
+
+    def stats(self) -> dict:
         return {
-            "error": "unknown",
-            "message": error_msg
+            **self.counters,
+            "fallback": self.fallback.model_name,
+            "hedge_delay": self.hedge_delay(),
+            "p50": self.latency.percentile(50),
         }
 
 # Agent setup
-model = OpenRouterModel(
-    'mistralai/mistral-large-2512',
-    provider=OpenRouterProvider(api_key=os.getenv('OPENROUTER_API_KEY')),
-)
-agent = Agent(
-    model,
-    deps_type=AgentDependencies,
-    system_prompt="""READ THE WHOLE SYSTEM_PROMPT VERY CAREFULLY.
+provider = OpenRouterProvider(api_key=os.getenv('OPENROUTER_API_KEY'))
+hedge_model = OpenRouterModel(MODEL_HEDGE, provider=provider) if MODEL_HEDGE else None
+
+def tier_model(model_name: str) -> Model:
+    model = OpenRouterModel(model_name, provider=provider)
+    return HedgedModel(model, hedge_model) if hedge_model else model
+
+models = {
+    "small": tier_model(MODEL_SMALL),
+    "large": tier_model(MODEL_LARGE),
+}
+AGENT_SYSTEM_PROMPT = """READ THE WHOLE SYSTEM_PROMPT VERY CAREFULLY.
 
 You are an AI agent that helps users with two main tasks:
 1. Finding specific cables
 2. Checking order status
 
-You have four tools available:
+Main tools:
 - search_product_info(product_query): Search for product cable information
-- get_cable_ends_a(): Get available cable connector types
-- get_cable_ends_b(cable_end_a): Get compatible connector types
+- resolve_cable(from_hint, to_hint): Resolve both cable ends in one call
 - get_order_status(user_query): Fetch order status information
+- get_order_statuses(user_query): Fetch several orders named in one query at once
+
+Fallback tools, only when resolve_cable returns no usable pair:
+- find_connector_candidates(hints): Get the closest catalog connector types for each hint
+- get_cable_ends_a(): Get all available cable connector types
+- get_cable_ends_b(cable_end_a): Get compatible connector types
 
 === STEP 1: QUERY CLASSIFICATION ===
 
@@ -484,9 +3386,14 @@ Sub-step A: Decide if web search is needed
   → Skip search, proceed to cable lookup
 
 Sub-step B: Cable lookup
-1. Call get_cable_ends_a() to get all connector types
-2. Select best match for FIRST connector from query/search results
-3. Call get_cable_ends_b(cable_end_a) ONCE with selected connector
+1. Call resolve_cable(from_hint, to_hint) ONCE with the two connectors from
+   the query/search results, e.g. resolve_cable("HDMI", "USB-C")
+2. If "resolved" is true, use its from_connector and to_connector
+3. Otherwise pick the best pair from the result or its "alternatives";
+   use the fallback tools only if none of them fits the query
+   - For "the female/male version" use "from_counterpart"/"to_counterpart",
+     and for another variant of the same standard (USB A/C/Micro B, ...)
+     pick from "to_variants"; these are already known to fit
 4. If no match found, return empty strings
 
 Sub-step C: Return result
@@ -499,6 +3406,8 @@ Sub-step C: Return result
 1. Call get_order_status(user_query)
    - Tool extracts order ID automatically from user_query
    - Tool fetches latest order if no ID found
+   - If the query names MORE THAN ONE order, call get_order_statuses(user_query)
+     ONCE instead: it returns every order in "orders" (same fields as below)
 
 2. Analyze the returned order data
    - Check for "error" field indicating API failure
@@ -517,19 +3426,23 @@ Sub-step C: Return result
 
 4. Return as OrderStatusResponse:
    - response_type: "order"
-   - summary: your generated natural language text (2-3 sentences)
+   - summary: your generated natural language text (2-3 sentences, one per
+     order when there are several)
    - order_id: extracted ID or null
+   - order_ids: every order ID the summary covers
 
 === IMPORTANT RULES ===
 
 1. For cable queries:
    - Never fabricate connector names
-   - Only use connectors from get_cable_ends_a/b responses
-   - Default to "male" connectors when gender is ambiguous
-   - Call get_cable_ends_b ONLY ONCE
+   - Only use connectors returned by the cable tools
+   - Keep the connector gender the cable tools return; they already apply
+     the default (male, or the only gender a connector comes in)
+   - Call resolve_cable ONLY ONCE
 
 2. For order queries:
-   - Always call get_order_status tool (pass full user_query as parameter)
+   - Always call get_order_status tool (pass full user_query as parameter),
+     or get_order_statuses when several orders are named
    - Be conversational and concise in summaries
    - If API returns error, inform user politely
 
@@ -550,7 +3463,7 @@ Response: OrderStatusResponse(
 
 Query: "HDMI to USB-C cable"
 Classification: CABLE SEARCH
-Action: Cable lookup flow
+Action: resolve_cable("HDMI", "USB-C")
 Response: CableResponse(
     response_type="cable",
     from_connector="HDMI Male",
@@ -566,6 +3479,16 @@ Response: OrderStatusResponse(
     order_id="12340"
 )
 
+Query: "Status of orders 12345, 12388 and 12391"
+Classification: ORDER STATUS (several orders)
+Action: get_order_statuses("Status of orders 12345, 12388 and 12391")
+Response: OrderStatusResponse(
+    response_type="order",
+    summary="Order 12345 is Dispatched via DHL. Order 12388 is Picking in Progress. Order 12391 was Received on December 8th.",
+    order_id="12345",
+    order_ids=["12345", "12388", "12391"]
+)
+
 Query: "Check order 67890"
 Classification: ORDER STATUS
 Action: get_order_status("Check order 67890")
@@ -577,28 +3500,559 @@ Response: OrderStatusResponse(
 
 Query: "iPhone 15 charging cable"
 Classification: CABLE SEARCH (with product search)
-Action: search_product_info → cable lookup flow
+Action: search_product_info → resolve_cable("USB-C", "Lightning")
 Response: CableResponse(
     response_type="cable",
     from_connector="USB C Male",
     to_connector="Lightning Male"
 )
-""",
+"""
+
+agent = Agent(
+    models["large"],
+    deps_type=AgentDependencies,
+    system_prompt=AGENT_SYSTEM_PROMPT,
     output_type=AgentResponse,
 )
 
 # Add tools
-agent.tool(get_cable_ends_a)
-agent.tool(get_cable_ends_b)
-agent.tool(search_product_info)
-agent.tool(get_order_status)
+def instrumented(tool: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Wrap an agent tool to record its latency and errors in metrics and the sampled log."""
+
+    @functools.wraps(tool)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = await tool(*args, **kwargs)
+            # Tools report upstream failures as {"error": ...} rather than raising
+            failed = isinstance(result, dict) and bool(result.get("error"))
+            return result
+        finally:
+            seconds = time.perf_counter() - started
+            TOOL_SECONDS.labels(tool.__name__).observe(seconds)
+            if failed:
+                TOOL_ERRORS.labels(tool.__name__).inc()
+            logger.info("Tool call", sampled=True, tool=tool.__name__, seconds=round(seconds, 4), failed=failed)
+
+    return wrapper
+
+agent.tool(instrumented(resolve_cable))
+agent.tool(instrumented(find_connector_candidates))
+agent.tool(instrumented(get_cable_ends_a))
+agent.tool(instrumented(get_cable_ends_b))
+agent.tool(instrumented(search_product_info), prepare=prepare_search_product_info)
+agent.tool(instrumented(get_order_status))
+agent.tool(instrumented(get_order_statuses))
+
+# STEP 1 of the system prompt as a standalone task for the small model
+classifier_agent = Agent(
+    models["small"],
+    system_prompt="""Classify the user query for an electronics cable shop.
+
+Answer "order" if it asks about an order, its status, delivery, tracking or
+shipment, or mentions an order number.
+Answer "cable" if it asks for a cable, adapter, charger or connector, or a
+cable for a named product (iPhone, MacBook, PS5).
+Answer "other" for anything else.""",
+    output_type=Literal["cable", "order", "other"],
+)
 
-@app.get("/search")
+# Diagnostics: per-request profiles and event loop stalls
+def frame_name(frame) -> str:
+    return f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})"
+
+def await_chain(task: asyncio.Task, marker=None) -> list[str]:
+    """
+    Where a suspended task is waiting, outermost first, down to the awaited future.
+
+    Args:
+        task: The suspended task
+        marker: Frame to start the chain at; the whole chain if None
+    """
+    names = []
+    found = marker is None
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        if isinstance(awaitable, asyncio.Task):
+            awaitable = awaitable.get_coro()
+            continue
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            # A plain future: gather(), a lock, a socket read or a thread's result
+            if found:
+                names.append(type(awaitable).__name__)
+            break
+        if found:
+            names.append(frame_name(frame))
+        found = found or frame is marker
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+    return names
+
+# The profiler of the request the current task works for, inherited by its child tasks
+PROFILED_REQUEST: contextvars.ContextVar["RequestProfiler | None"] = contextvars.ContextVar("profiled_request", default=None)
+
+def profiling_task_factory(loop: asyncio.AbstractEventLoop, coro, **kwargs) -> asyncio.Task:
+    """Task factory that hands tasks started by a profiled request to its profiler."""
+    task = asyncio.Task(coro, loop=loop, **kwargs)
+    profiler = PROFILED_REQUEST.get()
+    if profiler is not None:
+        profiler.tasks.append(task)
+    return task
+
+class RequestProfiler:
+    """
+    Sampling profiler for one request on the event loop.
+
+    A thread samples the event loop every PROFILE_INTERVAL. When the task on
+    the loop is the request or one it started (agent graph, gather(), hedged
+    model calls) the sample counts as "running", with its stack. Otherwise
+    the request is "waiting", with the await chain of its newest unfinished
+    task (the LLM, an upstream call, a lock), or "queued" when the loop is
+    busy with another request's task. Needs install() on the loop once.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.tasks: list[asyncio.Task] = []
+        self.stacks: dict[str, int] = {}
+        self.samples = 0
+        self.seconds = 0.0
+        self._done = threading.Event()
+
+    @staticmethod
+    def install(loop: asyncio.AbstractEventLoop):
+        """Track the tasks profiled requests start, unless the loop already has a task factory."""
+        if loop.get_task_factory() is None:
+            loop.set_task_factory(profiling_task_factory)
+
+    async def run(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Await call() while sampling; the profile is in report() afterwards."""
+        self.tasks.append(asyncio.current_task())
+        PROFILED_REQUEST.set(self)
+        sampler = threading.Thread(
+            target=self._sample,
+            args=(asyncio.get_running_loop(), threading.get_ident(), sys._getframe()),
+            name="request-profiler",
+            daemon=True,
+        )
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            return await call()
+        finally:
+            PROFILED_REQUEST.set(None)
+            self._done.set()
+            sampler.join()
+            self.seconds = time.perf_counter() - started
+            self.tasks = []
+
+    def _sample(self, loop: asyncio.AbstractEventLoop, thread_id: int, marker):
+        request_task = self.tasks[0]
+        while not self._done.wait(self.interval):
+            current = asyncio.current_task(loop)
+            if current is not None and current in self.tasks:
+                # Stack below the profiled call, or from the child task's coroutine inwards
+                root = None if current is request_task else current.get_coro().cr_frame
+                names = []
+                frame = sys._current_frames().get(thread_id)
+                while frame is not None and frame is not marker:
+                    names.append(frame_name(frame))
+                    if frame is root:
+                        break
+                    frame = frame.f_back
+                key = ";".join(["running", *reversed(names)])
+            elif current is not None:
+                key = f"queued;{current.get_name()}"
+            else:
+                waiting = next((task for task in reversed(self.tasks) if not task.done()), request_task)
+                chain = await_chain(waiting, marker if waiting is request_task else None)
+                key = ";".join(["waiting", *chain])
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def report(self) -> dict:
+        """
+        Returns:
+            dict with the run time, samples per state, the innermost frames
+            seen most often while running and while waiting, and every stack
+            in collapsed form ("running;outer;...;inner": samples)
+        """
+        leaves = {"running": {}, "waiting": {}, "queued": {}}
+        for key, count in self.stacks.items():
+            state, _, rest = key.partition(";")
+            leaf = rest.rsplit(";", 1)[-1] or "idle"
+            leaves[state][leaf] = leaves[state].get(leaf, 0) + count
+        return {
+            "seconds": round(self.seconds, 4),
+            "interval": self.interval,
+            "samples": self.samples,
+            **{f"{state}_samples": sum(counts.values()) for state, counts in leaves.items()},
+            "top_running": sorted(leaves["running"].items(), key=lambda item: -item[1])[:10],
+            "top_waiting": sorted(leaves["waiting"].items(), key=lambda item: -item[1])[:10],
+            "stacks": dict(sorted(self.stacks.items(), key=lambda item: -item[1])),
+        }
+
+class ProfileStore:
+    """The last PROFILE_KEEP request profiles, by ID."""
+
+    def __init__(self, keep: int = PROFILE_KEEP):
+        self._profiles: OrderedDict[str, dict] = OrderedDict()
+        self.keep = keep
+        self.counters = {"profiles": 0}
+
+    def add(self, query: str, profiler: RequestProfiler) -> str:
+        profile_id = secrets.token_hex(6)
+        self._profiles[profile_id] = {"id": profile_id, "query": query, "created_at": time.time(), **profiler.report()}
+        while len(self._profiles) > self.keep:
+            self._profiles.popitem(last=False)
+        self.counters["profiles"] += 1
+        return profile_id
+
+    def get(self, profile_id: str) -> dict | None:
+        return self._profiles.get(profile_id)
+
+    def list(self) -> list[dict]:
+        """Profiles newest first, without their stacks."""
+        return [
+            {key: value for key, value in profile.items() if key != "stacks"}
+            for profile in reversed(self._profiles.values())
+        ]
+
+    def stats(self) -> dict:
+        return {**self.counters, "kept": len(self._profiles)}
+
+class EventLoopMonitor:
+    """
+    Measure event loop lag and catch the code that blocks the loop.
+
+    A task sleeps LOOP_MONITOR_INTERVAL at a time and records how late it
+    wakes up. A watchdog thread watches the task's heartbeat: once the loop
+    has been stuck for LOOP_STALL_THRESHOLD it captures the loop thread's
+    stack, which is the blocking code. Stalls are logged with that stack and
+    the last LOOP_STALL_KEEP are kept for /admin/stalls.
+    """
+
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL, threshold: float = LOOP_STALL_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls: deque[dict] = deque(maxlen=LOOP_STALL_KEEP)
+        self.counters = {"stalls": 0, "stall_seconds": 0.0, "max_lag_seconds": 0.0}
+        self._heartbeat = time.monotonic()
+        self._blocked_stack: list[str] | None = None
+        self._loop_thread: int | None = None
+        self._ticker: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._done = threading.Event()
+
+    def start(self):
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._ticker = asyncio.create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="event-loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._done.set()
+        self._watchdog.join()
+        self._ticker.cancel()
+        try:
+            await self._ticker
+        except asyncio.CancelledError:
+            pass
+
+    async def _tick(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(0.0, now - expected)
+            LOOP_LAG_SECONDS.observe(lag)
+            self.counters["max_lag_seconds"] = max(self.counters["max_lag_seconds"], lag)
+            if lag >= self.threshold:
+                self._record_stall(lag)
+
+    def _record_stall(self, seconds: float):
+        stack, self._blocked_stack = self._blocked_stack or [], None
+        self.counters["stalls"] += 1
+        self.counters["stall_seconds"] += seconds
+        LOOP_STALLS.inc()
+        LOOP_STALL_SECONDS.inc(seconds)
+        self.stalls.append({"at": time.time(), "seconds": round(seconds, 4), "stack": stack})
+        logger.warning("Event loop stalled", seconds=round(seconds, 3), blocked_in=stack[-5:])
+
+    def _watch(self):
+        while not self._done.wait(self.threshold / 2):
+            stuck = time.monotonic() - self._heartbeat > self.interval + self.threshold
+            if stuck and self._blocked_stack is None:
+                frame = sys._current_frames().get(self._loop_thread)
+                names = []
+                while frame is not None:
+                    names.append(frame_name(frame))
+                    frame = frame.f_back
+                self._blocked_stack = names[::-1]
+
+    def stats(self) -> dict:
+        return {**self.counters, "threshold": self.threshold}
+
+class StatsCollector:
+    """Expose the /stats numbers of the shared components as Prometheus gauges, read at scrape time."""
+
+    COMPONENTS = ("catalog", "fast_path", "response_cache", "sessions", "product_store", "google", "orders", "admission", "degraded", "prefetch")
+
+    def __init__(self, state):
+        self.state = state
+
+    def collect(self):
+        for component in self.COMPONENTS:
+            for key, value in getattr(self.state, component).stats().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    yield GaugeMetricFamily(f"eet_search_{component}_{key}", f"{component} {key.replace('_', ' ')}", value=value)
+
+        connections = GaugeMetricFamily("eet_search_pool_connections", "Upstream pool connections by state", labels=["upstream", "state"])
+        for upstream, pool in self.state.http.stats().items():
+            if upstream != "limits":
+                for pool_state, count in pool.items():
+                    connections.add_metric([upstream, pool_state], count)
+        yield connections
+
+        breaker_open = GaugeMetricFamily("eet_search_breaker_open", "1 while the upstream circuit breaker is not closed", labels=["upstream"])
+        timeout = GaugeMetricFamily("eet_search_upstream_timeout_seconds", "Current adaptive upstream timeout", labels=["upstream"])
+        for upstream, breaker in self.state.http.breaker_stats().items():
+            breaker_open.add_metric([upstream], 0 if breaker["state"] == "closed" else 1)
+            timeout.add_metric([upstream], breaker["timeout"])
+        yield breaker_open
+        yield timeout
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the shared upstream connection pools and catalog cache for the lifetime of the app."""
+    log_listener = setup_logging()
+    app.state.loop_monitor = EventLoopMonitor()
+    app.state.loop_monitor.start()
+    RequestProfiler.install(asyncio.get_running_loop())
+    app.state.profiles = ProfileStore()
+    app.state.http = UpstreamClients()
+    app.state.catalog = ConnectorCatalog(app.state.http)
+    app.state.catalog.start()
+    app.state.fast_path = FastPathResolver(app.state.catalog)
+    app.state.degraded = DegradedResponder(app.state.fast_path)
+    app.state.prefetch = Prefetcher()
+    app.state.admission = AdmissionController()
+    app.state.response_cache = ResponseCache()
+    app.state.sessions = SessionStore()
+    app.state.usage = UsageStats()
+    app.state.router = ModelRouter()
+    app.state.product_store = ProductKnowledgeStore()
+    app.state.product_store.purge(older_than=PRODUCT_STORE_TTL)
+    app.state.google = GoogleSearch(app.state.http, app.state.product_store)
+    app.state.orders = OrderStatusCache(app.state.http)
+    stats_collector = StatsCollector(app.state)
+    REGISTRY.register(stats_collector)
+    try:
+        yield
+    finally:
+        REGISTRY.unregister(stats_collector)
+        await app.state.catalog.stop()
+        await app.state.http.aclose()
+        app.state.product_store.close()
+        await app.state.loop_monitor.stop()
+        log_listener.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.get("/stats")
+async def stats(request: Request):
+    """
+    Runtime statistics for sizing caches and connection pools.
+
+    Returns:
+        dict of counters per component: connection pools, circuit breakers, caches and stores,
+        fast path hit rate, Google quota, agent token usage, model routing
+        and event loop stalls
+    """
+    return {
+        "pools": request.app.state.http.stats(),
+        "breakers": request.app.state.http.breaker_stats(),
+        "catalog": request.app.state.catalog.stats(),
+        "fast_path": request.app.state.fast_path.stats(),
+        "response_cache": request.app.state.response_cache.stats(),
+        "sessions": request.app.state.sessions.stats(),
+        "product_store": request.app.state.product_store.stats(),
+        "google": request.app.state.google.stats(),
+        "orders": request.app.state.orders.stats(),
+        "usage": request.app.state.usage.stats(),
+        "routing": request.app.state.router.stats(),
+        "hedging": {tier: model.stats() for tier, model in models.items() if isinstance(model, HedgedModel)},
+        "degraded": request.app.state.degraded.stats(),
+        "admission": request.app.state.admission.stats(),
+        "prefetch": request.app.state.prefetch.stats(),
+        "event_loop": request.app.state.loop_monitor.stats(),
+        "profiles": request.app.state.profiles.stats(),
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: request, tool and LLM histograms plus the /stats gauges."""
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+def require_admin(x_admin_token: str | None = Header(default=None)):
+    """Admin endpoints are disabled unless ADMIN_TOKEN is set and sent as X-Admin-Token."""
+    if not ADMIN_TOKEN or not secrets.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.get("/admin/products", dependencies=[Depends(require_admin)])
+async def list_products(request: Request, q: str | None = None, limit: int = 50):
+    """
+    Inspect the local product knowledge store.
+
+    Args:
+        q: Optional product filter, e.g. "iphone 15"
+        limit: Maximum number of entries to return
+
+    Returns:
+        Stored entries, newest first
+    """
+    return request.app.state.product_store.entries(q, limit)
+
+@app.delete("/admin/products/{entry_id}", dependencies=[Depends(require_admin)])
+async def delete_product(request: Request, entry_id: int):
+    """Evict one product entry so the next lookup goes to Google again."""
+    if not request.app.state.product_store.delete(entry_id):
+        raise HTTPException(status_code=404, detail="Product entry not found")
+    return {"deleted": 1}
+
+@app.delete("/admin/products", dependencies=[Depends(require_admin)])
+async def purge_products(request: Request, expired_only: bool = True):
+    """Evict expired product entries, or every entry with expired_only=false."""
+    return {"deleted": request.app.state.product_store.purge(expired_only)}
+
+@app.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles(request: Request):
+    """Request profiles taken with the X-Profile header, newest first, without their stacks."""
+    return request.app.state.profiles.list()
+
+@app.get("/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def get_profile(request: Request, profile_id: str, format: Literal["json", "folded"] = "json"):
+    """
+    One request profile.
+
+    Args:
+        profile_id: The X-Profile-Id header of the profiled response
+        format: "folded" for one "stack samples" line per stack, as read by
+            flamegraph.pl and speedscope
+
+    Returns:
+        The profile, or its stacks as text
+    """
+    profile = request.app.state.profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "folded":
+        return Response("".join(f"{stack} {count}\n" for stack, count in profile["stacks"].items()), media_type="text/plain")
+    return profile
+
+@app.get("/admin/stalls", dependencies=[Depends(require_admin)])
+async def list_stalls(request: Request):
+    """Recent event loop stalls, newest first, with the stack that was blocking the loop."""
+    return list(reversed(request.app.state.loop_monitor.stalls))
+
+def build_deps(state, customer_id: str, language: str, erp_business_entity_id: int, memo: ToolMemo | None = None) -> AgentDependencies:
+    """Create dependencies to pass to agent from the shared app state, with a new ToolMemo unless given one."""
+    return AgentDependencies(
+        customer_id=customer_id,
+        language=language,
+        erp_business_entity_id=erp_business_entity_id,
+        http=state.http,
+        catalog=state.catalog,
+        product_store=state.product_store,
+        google=state.google,
+        orders=state.orders,
+        memo=memo if memo is not None else ToolMemo(),
+    )
+
+async def answer_query(query: str, deps: AgentDependencies, state, session: Session | None = None) -> SearchResponse:
+    """
+    Answer one query: response cache, then the fast path, then the agent on
+    the model tier chosen by the router, within SEARCH_DEADLINE, with its
+    likely tool calls prefetched.
+
+    Args:
+        query: Natural language query (cable or order related)
+        deps: Dependencies for the agent run, with the session's memo when
+            session is given
+        state: app.state holding the shared caches
+        session: Conversation the query continues; its turn is recorded
+
+    Returns:
+        CableResponse or OrderStatusResponse, or a degraded reply (possibly
+        TryAgainResponse) when the agent ran out of time
+
+    Raises:
+        Overloaded: when admission control turned the agent run away
+    """
+    received = time.perf_counter()
+
+    # A follow-up may only make sense after the earlier turns, so only
+    # standalone queries use the response cache
+    history = session.messages if session is not None else []
+
+    # Repeated and near-identical queries are served from the response cache
+    cached_response = None if history else state.response_cache.lookup(query, deps)
+    if cached_response is not None:
+        if session is not None:
+            state.sessions.record(session, query, cached_response)
+        return observe_search(received, cached_response, "cache")
+
+    # Direct cable queries are answered from the catalog without the LLM
+    fast_response = await state.fast_path.resolve(query)
+    if fast_response is not None:
+        state.response_cache.store(query, deps, fast_response)
+        if session is not None:
+            state.sessions.record(session, query, fast_response)
+        return observe_search(received, fast_response, "fast_path")
+
+    # Start the lookups the agent will most likely ask for while it waits for a slot and classifies
+    prefetched = state.prefetch.start(query, deps)
+
+    # Run agent with dependencies, on the model tier the query needs
+    # Waiting for a run slot does not count against the deadline
+    degraded = None
+    try:
+        async with state.admission.slot(deps["customer_id"]):
+            started = time.perf_counter()
+            try:
+                async with asyncio.timeout(SEARCH_DEADLINE):
+                    route = await state.router.route(query, session.response_type if session is not None else None)
+                    result = await agent.run(query, deps=deps, model=models[route.tier], message_history=history or None)
+            except TimeoutError:
+                degraded = await state.degraded.respond(query, deps)
+    finally:
+        state.prefetch.finish(deps, prefetched)
+    # Settle the prefetches before the session forgets its order results
+    if degraded is not None:
+        # Degraded replies are not cached, the next ask gets a full answer
+        if session is not None:
+            state.sessions.record(session, query, degraded)
+        return observe_search(received, degraded, "degraded")
+    state.usage.record(query, result.usage, time.perf_counter() - started, route.tier)
+    if session is not None:
+        state.sessions.record(session, query, result.output)
+    if not history:
+        state.response_cache.store(query, deps, result.output)
+    return observe_search(received, result.output, "agent")
+
+@app.get("/search", response_class=ModelJSONResponse)
 async def search(
+    request: Request,
     query: str,
     customerId: str,
     language: str,
-    erpBusinessEntityId: int
+    erpBusinessEntityId: int,
+    sessionId: str | None = None,
+    x_profile: str | None = Header(default=None),
+    x_admin_token: str | None = Header(default=None),
 ):
     """
     Universal search endpoint for cable queries and order status.
@@ -608,19 +4062,234 @@ async def search(
         customerId: Customer ID for order lookup
         language: Language code (e.g., 'en-US', 'en-GB')
         erpBusinessEntityId: Business entity ID for API routing
+        sessionId: Optional conversation ID chosen by the client; queries
+            sent with the same sessionId and customerId are answered as
+            follow-ups of each other
+        X-Profile: Set to 1, with X-Admin-Token, to profile this request; the
+            response's X-Profile-Id header names it under /admin/profiles
 
     Returns:
-        CableResponse (for cable queries) or OrderStatusResponse (for orders)
+        CableResponse (for cable queries) or OrderStatusResponse (for orders),
+        or TryAgainResponse when no answer was possible within SEARCH_DEADLINE
     """
-    # Create dependencies to pass to agent
-    deps = AgentDependencies(
-        customer_id=customerId,
-        language=language,
-        erp_business_entity_id=erpBusinessEntityId
+    # Create dependencies to pass to agent, sharing the session's tool results
+    session = request.app.state.sessions.get(customerId, sessionId) if sessionId is not None else None
+    deps = build_deps(request.app.state, customerId, language, erpBusinessEntityId, session.memo if session is not None else None)
+
+    # Return the discriminated union output, one turn of a session at a time
+    try:
+        async with session.lock if session is not None else nullcontext():
+            if x_profile in ("1", "true"):
+                require_admin(x_admin_token)
+                profiler = RequestProfiler()
+                result = await profiler.run(lambda: answer_query(query, deps, request.app.state, session))
+                return ModelJSONResponse(result, headers={"X-Profile-Id": request.app.state.profiles.add(query, profiler)})
+            return ModelJSONResponse(await answer_query(query, deps, request.app.state, session))
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail="Search is busy, please retry", headers={"Retry-After": str(e.retry_after)})
+
+# Response type implied by each tool the agent calls
+TOOL_RESPONSE_TYPES = {
+    "search_product_info": "cable",
+    "get_cable_ends_a": "cable",
+    "get_cable_ends_b": "cable",
+    "find_connector_candidates": "cable",
+    "resolve_cable": "cable",
+    "get_order_status": "order",
+    "get_order_statuses": "order",
+}
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_search_events(query: str, deps: AgentDependencies, state) -> AsyncIterator[str]:
+    """
+    Run a search and yield SSE messages as the agent makes progress.
+
+    Events, in order:
+        classification: {"response_type": "cable" | "order" | null, "source": "rules" | "model"}
+            sent immediately from the rule-based classifier, and again when the
+            agent's tool calls or output show a different type
+        tool_start: {"tool": str, "args": dict}
+        tool_end: {"tool": str}
+        summary_delta: {"text": str} incremental OrderStatusResponse summary text
+        result: the full validated CableResponse or OrderStatusResponse, or a
+            degraded reply (possibly TryAgainResponse) after SEARCH_DEADLINE
+        error: {"message": str} if the run fails, with "retry_after" (seconds)
+            when admission control turned it away
+    """
+    received = time.perf_counter()
+    classification = classify_query(query)
+    yield sse_event("classification", {"response_type": classification, "source": "rules"})
+
+    cached_response = state.response_cache.lookup(query, deps)
+    if cached_response is not None:
+        yield sse_event("result", observe_search(received, cached_response, "cache").model_dump(mode="json"))
+        return
+    fast_response = await state.fast_path.resolve(query)
+    if fast_response is not None:
+        state.response_cache.store(query, deps, fast_response)
+        yield sse_event("result", observe_search(received, fast_response, "fast_path").model_dump(mode="json"))
+        return
+
+    prefetched = state.prefetch.start(query, deps)
+    try:
+        await state.admission.acquire(deps["customer_id"])
+    except Overloaded as e:
+        state.prefetch.finish(deps, prefetched)
+        yield sse_event("error", {"message": "Search is busy, please retry", "retry_after": e.retry_after})
+        return
+    try:
+        started = time.perf_counter()
+        async with asyncio.timeout(SEARCH_DEADLINE):
+            route = await state.router.route(query)
+            if route.source == "model" and route.response_type != classification:
+                classification = route.response_type
+                yield sse_event("classification", {"response_type": classification, "source": "model"})
+            async with agent.iter(query, deps=deps, model=models[route.tier]) as run:
+                async for node in run:
+                    if Agent.is_model_request_node(node):
+                        async with node.stream(run.ctx) as request_stream:
+                            final_result_found = False
+                            async for event in request_stream:
+                                if isinstance(event, FinalResultEvent):
+                                    final_result_found = True
+                                    break
+                            if not final_result_found:
+                                continue
+                            # Stream the output as it is generated, forwarding new summary text
+                            sent = ""
+                            async for partial in request_stream.stream_output(debounce_by=None):
+                                if classification != partial.response_type:
+                                    classification = partial.response_type
+                                    yield sse_event("classification", {"response_type": classification, "source": "model"})
+                                summary = getattr(partial, "summary", None) or ""
+                                if len(summary) > len(sent) and summary.startswith(sent):
+                                    yield sse_event("summary_delta", {"text": summary[len(sent):]})
+                                    sent = summary
+                    elif Agent.is_call_tools_node(node):
+                        async with node.stream(run.ctx) as handle_stream:
+                            async for event in handle_stream:
+                                if isinstance(event, FunctionToolCallEvent):
+                                    tool_type = TOOL_RESPONSE_TYPES.get(event.part.tool_name)
+                                    if tool_type and tool_type != classification:
+                                        classification = tool_type
+                                        yield sse_event("classification", {"response_type": classification, "source": "model"})
+                                    yield sse_event("tool_start", {"tool": event.part.tool_name, "args": event.part.args_as_dict()})
+                                elif isinstance(event, FunctionToolResultEvent):
+                                    yield sse_event("tool_end", {"tool": event.result.tool_name})
+        output = run.result.output
+        state.usage.record(query, run.usage, time.perf_counter() - started, route.tier)
+    except TimeoutError:
+        degraded = observe_search(received, await state.degraded.respond(query, deps), "degraded")
+        yield sse_event("result", degraded.model_dump(mode="json"))
+        return
+    except Exception:
+        logger.exception("Streaming search failed", query=clip(query))
+        yield sse_event("error", {"message": "Search failed, please try again"})
+        return
+    finally:
+        state.admission.release(deps["customer_id"])
+        state.prefetch.finish(deps, prefetched)
+
+    state.response_cache.store(query, deps, output)
+    yield sse_event("result", observe_search(received, output, "agent").model_dump(mode="json"))
+
+@app.get("/search/stream")
+async def search_stream(
+    request: Request,
+    query: str,
+    customerId: str,
+    language: str,
+    erpBusinessEntityId: int
+):
+    """
+    Server-Sent Events variant of /search.
+
+    Sends a classification event right away, then tool progress and
+    incremental order summary text while the agent runs, and finally a
+    "result" event with the same payload /search would return. See
+    stream_search_events for the event types.
+    """
+    deps = build_deps(request.app.state, customerId, language, erpBusinessEntityId)
+    return StreamingResponse(
+        stream_search_events(query, deps, request.app.state),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
-    # Run agent with dependencies
-    result = await agent.run(query, deps=deps)
+class BatchSearchRequest(BaseModel):
+    queries: list[str]
+    customerId: str
+    language: str
+    erpBusinessEntityId: int
+    concurrency: int | None = None
+
+async def stream_batch_results(queries: list[str], deps: AgentDependencies, state, concurrency: int) -> AsyncIterator[str]:
+    """
+    Answer a batch of queries concurrently, yielding NDJSON lines as they finish.
+
+    Queries that normalize to the same text are answered once. All runs share
+    deps, and with it one ToolMemo, so catalog lookups and product searches
+    are deduplicated across the batch.
+    """
+    groups: dict[str, list[int]] = {}
+    for index, query in enumerate(queries):
+        groups.setdefault(normalize_query(query), []).append(index)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(indices: list[int]) -> tuple[list[int], SearchResponse | Overloaded | None]:
+        async with semaphore:
+            try:
+                return indices, await answer_query(queries[indices[0]], deps, state)
+            except Overloaded as e:
+                return indices, e
+            except Exception:
+                logger.exception("Batch query failed", query=clip(queries[indices[0]]))
+                return indices, None
 
-    # Return the discriminated union output
-    return result.output
+    tasks = [asyncio.ensure_future(answer(indices)) for indices in groups.values()]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            indices, response = await next_done
+            for index in indices:
+                line = {"index": index, "query": queries[index]}
+                if isinstance(response, Overloaded):
+                    line["error"] = "Search is busy, please retry"
+                    line["retry_after"] = response.retry_after
+                elif response is not None:
+                    line["response"] = response.model_dump(mode="json")
+                else:
+                    line["error"] = "Search failed, please try again"
+                yield json.dumps(line) + "\n"
+    finally:
+        # The client went away or the batch finished: stop any remaining work
+        for task in tasks:
+            task.cancel()
+
+@app.post("/search/batch")
+async def search_batch(request: Request, batch: BatchSearchRequest):
+    """
+    Answer many queries for the same customer/language context in one request.
+
+    Queries run concurrently, at most BATCH_MAX_CONCURRENCY (or the lower
+    "concurrency" from the body) at a time, and never more than admission
+    control lets one customer run, so the batch's own items do not queue
+    behind each other and time out as busy. Results stream back as
+    newline-delimited JSON in completion order:
+        {"index": int, "query": str, "response": {...}}
+        {"index": int, "query": str, "error": str}
+        {"index": int, "query": str, "error": str, "retry_after": int}
+
+    Returns:
+        application/x-ndjson stream with one line per query
+    """
+    if len(batch.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_QUERIES} queries per batch")
+    concurrency = max(1, min(batch.concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY, request.app.state.admission.max_per_customer))
+    deps = build_deps(request.app.state, batch.customerId, batch.language, batch.erpBusinessEntityId)
+    return StreamingResponse(
+        stream_batch_results(batch.queries, deps, request.app.state, concurrency),
+        media_type="application/x-ndjson",
+    )
@@ -0,0 +1,71 @@
+"""
+Measure model turns, tokens and latency per cable query for the live agent.
+
+Runs each query straight through app.agent (bypassing the response cache and
+fast path) against the real OpenRouter model and CableGuide API, and prints
+pydantic-ai usage per run. Run it on two revisions to compare prompt/tool
+changes, e.g. before and after resolve_cable.
+
+Requires OPENROUTER_API_KEY and network access.
+
+Usage:
+    python benchmarks/bench_agent_turns.py [--repeat 3] [query ...]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import app  # noqa: E402
+
+DEFAULT_QUERIES = [
+    "HDMI to USB-C cable",
+    "DisplayPort male to HDMI female",
+    "I need a cable from my laptop's USB-C port to a VGA projector",
+    "mini displayport to dvi adapter",
+    "XLR to 6.35mm jack",
+    "iPhone 15 charging cable",
+]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("queries", nargs="*", default=DEFAULT_QUERIES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--customer-id", default="benchmark")
+    parser.add_argument("--language", default="en-US")
+    parser.add_argument("--erp-business-entity-id", type=int, default=9)
+    args = parser.parse_args()
+
+    async with app.app.router.lifespan_context(app.app):
+        state = app.app.state
+        rows = []
+        for query in args.queries:
+            for _ in range(args.repeat):
+                deps = app.build_deps(state, args.customer_id, args.language, args.erp_business_entity_id)
+                started = time.perf_counter()
+                result = await app.agent.run(query, deps=deps)
+                seconds = time.perf_counter() - started
+                usage = result.usage
+                rows.append((query, usage.requests, usage.tool_calls, usage.input_tokens, usage.output_tokens, seconds))
+                print(
+                    f"{query[:45]:<45} turns={usage.requests} tools={usage.tool_calls} "
+                    f"in={usage.input_tokens} out={usage.output_tokens} {seconds:.2f}s -> {result.output}"
+                )
+
+    print()
+    print(f"runs:               {len(rows)}")
+    print(f"mean model turns:   {statistics.mean(row[1] for row in rows):.2f}")
+    print(f"mean tool calls:    {statistics.mean(row[2] for row in rows):.2f}")
+    print(f"mean input tokens:  {statistics.mean(row[3] for row in rows):.0f}")
+    print(f"mean output tokens: {statistics.mean(row[4] for row in rows):.0f}")
+    print(f"mean latency:       {statistics.mean(row[5] for row in rows):.2f}s")
+    print(f"p95 latency:        {sorted(row[5] for row in rows)[int(0.95 * (len(rows) - 1))]:.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,151 @@
+"""
+Worker startup time and memory with and without the shared catalog snapshot.
+
+Starts a stub CableGuide API (see stubs.py), then boots --workers worker
+processes at once the way gunicorn does, in three modes:
+
+  cold      the worker serves before its refresher finished: the first
+            cable query fetches its connectors from CableGuide
+  network   every worker builds the A->B map from CableGuide, as each
+            worker's refresher did before catalog snapshots
+  snapshot  one writer persists the map once, then every worker maps the
+            snapshot file and serves from it without network access
+
+Per worker it reports the time until the catalog is ready, the first fast
+path answer, upstream requests made, and RSS/PSS (Linux, from
+/proc/self/smaps_rollup; PSS splits shared pages between the processes
+mapping them) after every B list has been read once.
+
+Usage:
+    python benchmarks/bench_catalog_snapshot.py [--workers 8] [--upstream-latency-ms 50]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from stubs import StubProfile, StubServer, build_eet_stub  # noqa: E402
+
+
+def memory_kb() -> dict[str, int]:
+    """Rss and Pss of this process in kB."""
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                values[key] = int(rest.split()[0])
+    return values
+
+
+async def run_worker(mode: str):
+    """One worker boot; prints its measurements as a JSON line."""
+    started = time.perf_counter()
+    import app
+    imported = time.perf_counter()
+
+    http = app.UpstreamClients()
+    # Compile the matchers' regular expressions outside the timings
+    app.find_connector_mentions("HDMI")
+    app.extract_order_id("HDMI")
+
+    catalog_started = time.perf_counter()
+    catalog = app.ConnectorCatalog(http)
+    if mode == "snapshot":
+        catalog.load_snapshot()
+    elif mode != "cold":
+        await catalog.refresh()
+        if mode == "write":
+            await catalog.write_snapshot()
+    ready = time.perf_counter()
+
+    fast_path = app.FastPathResolver(catalog)
+    await fast_path.resolve("HDMI to USB-C")
+    first_query = time.perf_counter() - ready
+
+    # Read every B list, as a worker does over time while serving traffic
+    for name in await catalog.get_ends_a():
+        await catalog.get_ends_b(name)
+    await http.aclose()
+    print(json.dumps({
+        "import_seconds": imported - started,
+        "ready_seconds": ready - catalog_started,
+        "first_query_seconds": first_query,
+        "upstream_fetches": catalog.counters["upstream_fetches"],
+        **memory_kb(),
+    }))
+
+
+def boot_workers(mode: str, count: int, env: dict) -> list[dict]:
+    command = [sys.executable, __file__, "--worker", mode]
+    workers = [subprocess.Popen(command, env=env, stdout=subprocess.PIPE, text=True) for _ in range(count)]
+    results = []
+    for worker in workers:
+        output, _ = worker.communicate()
+        if worker.returncode != 0:
+            raise SystemExit(f"{mode} worker failed with exit code {worker.returncode}")
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def report(mode: str, results: list[dict]):
+    def mean(key: str) -> float:
+        return statistics.mean(result[key] for result in results)
+
+    print(
+        f"{mode:<10}{mean('ready_seconds') * 1000:>12.2f}{mean('first_query_seconds') * 1000:>14.2f}"
+        f"{mean('upstream_fetches'):>10.0f}{mean('Rss') / 1024:>10.1f}{mean('Pss') / 1024:>10.1f}"
+        f"{mean('import_seconds'):>10.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--upstream-latency-ms", type=float, default=50)
+    parser.add_argument("--worker", choices=["cold", "network", "write", "snapshot"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        asyncio.run(run_worker(args.worker))
+        return
+
+    # Import app.py in the parent only after the workers' environment is set
+    eet = StubServer()
+    workdir = tempfile.mkdtemp(prefix="bench_catalog_snapshot_")
+    env = {
+        **os.environ,
+        "EET_API_BASE_URL": eet.base_url,
+        "OPENROUTER_API_KEY": "benchmark",
+        "CATALOG_SNAPSHOT_PATH": os.path.join(workdir, "catalog_snapshot.bin"),
+        "PRODUCT_STORE_PATH": os.path.join(workdir, "product_store.sqlite3"),
+        "LOG_LEVEL": "ERROR",
+        "PYDANTIC_AI_NO_BANNER": "1",
+    }
+    os.environ.update(env)
+    import app
+
+    eet.start(build_eet_stub(StubProfile(latency=args.upstream_latency_ms / 1000), app.DEFAULT_CABLE_ENDS_A))
+    try:
+        cold = boot_workers("cold", args.workers, env)
+        network = boot_workers("network", args.workers, env)
+        boot_workers("write", 1, env)
+        snapshot = boot_workers("snapshot", args.workers, env)
+    finally:
+        eet.stop()
+
+    print(f"workers: {args.workers}, snapshot: {os.path.getsize(env['CATALOG_SNAPSHOT_PATH'])} bytes")
+    print(f"{'mode':<10}{'ready ms':>12}{'1st query ms':>14}{'fetches':>10}{'RSS MB':>10}{'PSS MB':>10}{'import s':>10}")
+    report("cold", cold)
+    report("network", network)
+    report("snapshot", snapshot)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Micro-benchmark: compiled connector matcher vs. the per-pattern regex loop.
+
+Runs extract_connector_types from app.py against the previous implementation
+on Google Custom Search payloads shaped like real product queries.
+
+Usage:
+    python benchmarks/bench_connector_matcher.py [--iterations 2000]
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+
+from app import CustomSearchReply, extract_connector_types  # noqa: E402
+
+
+def legacy_extract_connector_types(search_data: dict) -> list[str]:
+    """extract_connector_types as it was before the compiled matcher."""
+    connector_patterns = [
+        r'\bUSB[\s-]?C\b', r'\bUSB-C\b', r'\bUSB Type-C\b',
+        r'\bUSB[\s-]?A\b', r'\bUSB-A\b', r'\bUSB Type-A\b',
+        r'\bUSB[\s-]?B\b', r'\bUSB-B\b',
+        r'\bUSB[\s-]?Micro\b', r'\bMicro USB\b',
+        r'\bUSB[\s-]?Mini\b', r'\bMini USB\b',
+        r'\bHDMI\b',
+        r'\bDisplayPort\b', r'\bDP\b',
+        r'\bMini DisplayPort\b', r'\bMini DP\b',
+        r'\bDVI[-]?[DI]?\b',
+        r'\bVGA\b',
+        r'\bLightning\b',
+        r'\bThunderbolt\b',
+        r'\b3\.5mm\b', r'\b3\.5\s?mm\b', r'\bheadphone jack\b',
+        r'\b6\.35mm\b', r'\b1/4["\s]inch\b',
+        r'\b2\.5mm\b',
+        r'\bXLR\b',
+        r'\bRCA\b',
+        r'\bRJ45\b', r'\bRJ-45\b', r'\bEthernet\b',
+        r'\bRJ11\b', r'\bRJ-11\b',
+        r'\bPower Type [A-Z]\b',
+        r'\bIEC\b',
+        r'\bSchuko\b',
+        r'\bBNC\b',
+        r'\bSATA\b',
+        r'\beSATA\b',
+    ]
+
+    text_corpus = []
+    if "items" in search_data:
+        for item in search_data["items"]:
+            if "title" in item:
+                text_corpus.append(item["title"])
+            if "snippet" in item:
+                text_corpus.append(item["snippet"])
+            if "htmlSnippet" in item:
+                text_corpus.append(item["htmlSnippet"])
+
+    combined_text = " ".join(text_corpus)
+
+    found_connectors = []
+    seen = set()
+
+    for pattern in connector_patterns:
+        matches = re.finditer(pattern, combined_text, re.IGNORECASE)
+        for match in matches:
+            connector = match.group(0).strip()
+            connector_normalized = connector.upper().replace("-", " ").replace("  ", " ")
+
+            if connector_normalized not in seen:
+                found_connectors.append(connector)
+                seen.add(connector_normalized)
+
+    return found_connectors[:10]
+
+
+def cse_item(title: str, snippet: str) -> dict:
+    return {
+        "kind": "customsearch#result",
+        "title": title,
+        "htmlTitle": title.replace("cable", "<b>cable</b>"),
+        "link": "https://example.com/" + title.lower().replace(" ", "-"),
+        "displayLink": "example.com",
+        "snippet": snippet,
+        "htmlSnippet": snippet.replace("USB-C", "<b>USB-C</b>").replace("Lightning", "<b>Lightning</b>"),
+    }
+
+
+PAYLOADS = {
+    "iPhone 15 Pro cable connectors": {"items": [
+        cse_item("iPhone 15 Pro - Technical Specifications - Apple",
+                 "USB-C connector with USB 3 (up to 10Gb/s). Supports DisplayPort output up to 4K HDR. "
+                 "Charge with a USB-C to USB-C cable; older accessories need a Lightning adapter."),
+        cse_item("Which cable do I need for iPhone 15? USB-C explained",
+                 "Apple switched from Lightning to USB Type-C. Use a USB-C to Lightning adapter for "
+                 "old headphones, or a USB-C to 3.5mm headphone jack dongle."),
+        cse_item("Best iPhone 15 charging cables 2025",
+                 "We tested braided USB-C cables, USB-A to USB-C cables for older chargers and "
+                 "MagSafe. Avoid cheap cables without E-marker chips."),
+        cse_item("iPhone 15 Pro HDMI output guide",
+                 "Connect your iPhone 15 Pro to a TV with a USB-C to HDMI adapter. 4K at 60Hz is "
+                 "supported over DisplayPort Alt Mode."),
+        cse_item("Apple USB-C Digital AV Multiport Adapter",
+                 "The adapter lets you connect to an HDMI display, a USB-A device and a USB-C "
+                 "charging cable at the same time."),
+    ]},
+    "PS5 cable connectors": {"items": [
+        cse_item("PlayStation 5 ports and connections",
+                 "The PS5 has an HDMI 2.1 out, a USB-C port on the front, two USB-A ports on the "
+                 "back, an Ethernet (RJ45) port and an IEC C7 power connector."),
+        cse_item("What power cable does the PS5 use?",
+                 "The PS5 uses a figure-8 Power Type C7 cable. In Europe it ships with a Schuko plug "
+                 "(Power Type F), in the UK with Power Type G."),
+        cse_item("PS5 controller cable",
+                 "The DualSense charges over USB-C. Any USB-A to USB-C cable works with the console."),
+    ]},
+    "Dell monitor P2422H cable connectors": {"items": [
+        cse_item("Dell 24 Monitor P2422H specs",
+                 "Ports: 1 x DisplayPort 1.2, 1 x HDMI 1.4, 1 x VGA, 1 x USB-B upstream, "
+                 "4 x USB-A 5Gbps downstream. Includes DP cable and USB-A to USB-B cable."),
+        cse_item("Connecting P2422H to a laptop",
+                 "Use HDMI or DisplayPort. Older laptops may need a DVI-D to HDMI or Mini DP to DP cable."),
+        cse_item("P2422H audio", "The monitor has no 3.5mm audio output and no built-in speakers."),
+    ]},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'payload':<40} {'legacy µs':>10} {'compiled µs':>12} {'speedup':>8}")
+    for name, payload in PAYLOADS.items():
+        # The app validates the reply while reading the response body, outside the matcher
+        reply = CustomSearchReply.model_validate(payload)
+        legacy = timeit.timeit(lambda: legacy_extract_connector_types(payload), number=args.iterations)
+        compiled = timeit.timeit(lambda: extract_connector_types(reply), number=args.iterations)
+        legacy_us = legacy / args.iterations * 1e6
+        compiled_us = compiled / args.iterations * 1e6
+        print(f"{name:<40} {legacy_us:>10.1f} {compiled_us:>12.1f} {legacy_us / compiled_us:>7.1f}x")
+        print(f"    legacy:   {legacy_extract_connector_types(payload)}")
+        print(f"    compiled: {extract_connector_types(reply)}")
+
+
+if __name__ == "__main__":
+    main()
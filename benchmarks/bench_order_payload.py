@@ -0,0 +1,166 @@
+"""
+CPU time and memory per order status request, dict path versus typed path.
+
+Builds OrderStatus API bodies with --lines orderLines each (plus the fields
+a real reply carries that the app does not use) and runs both pipelines
+over the raw bytes:
+
+  dict   response.json(), the field-by-field copy of the former
+         process_order_response, the tool result serialized for the LLM,
+         and jsonable_encoder + json.dumps for the HTTP response
+  typed  json.loads and ProcessedOrder.model_validate, as OrderStatusCache
+         does, the tool result serialized for the LLM, and ModelJSONResponse
+         for the HTTP response
+
+Reports CPU time per request for each stage (best of --repeats runs, so
+other load on the machine does not skew the comparison), and from
+tracemalloc the peak memory allocated while handling one request and the
+memory retained by the processed order, which the order cache and the
+request's tool memo keep. tracemalloc only sees allocations made through
+Python's allocator, not pydantic-core's own parse buffers.
+
+Usage:
+    python benchmarks/bench_order_payload.py [--lines 10 100 1000 5000] [--repeats 5]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+os.environ.setdefault("PYDANTIC_AI_NO_BANNER", "1")
+
+import app  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic_ai.messages import ToolReturnPart  # noqa: E402
+
+
+def order_body(lines: int) -> bytes:
+    """An OrderStatus reply with the given number of order lines."""
+    return json.dumps({
+        "orderId": "12345",
+        "status": 3,
+        "orderDate": "2025-12-05T10:12:00",
+        "shippingAgentName": "DHL",
+        "shipToAddress": "Example Street 1, 2100 Copenhagen",
+        "subTotal": 1234.5,
+        "nextShipment": "2025-12-15",
+        "currency": "EUR",
+        "customerReference": "PO-2025-0042",
+        "orderLines": [
+            {
+                "itemId": f"ITEM-{line}",
+                "status": line % 4,
+                "description": f"HDMI to USB-C cable, 2 m, black (variant {line})",
+                "quantity": 1 + line % 5,
+                "unitPrice": 12.99,
+                "warehouse": "DK01",
+                "trackingNumbers": [f"00340434{line:010d}"],
+            }
+            for line in range(lines)
+        ],
+    }).encode()
+
+
+def legacy_process_order_response(data: dict) -> dict:
+    """process_order_response as it was before ProcessedOrder, for comparison."""
+    processed = {
+        "order_id": data.get("orderId"),
+        "status": app.translate_order_status(data.get("status", -1)),
+        "status_code": data.get("status"),
+        "order_date": data.get("orderDate"),
+        "shipping_agent": data.get("shippingAgentName"),
+        "ship_to_address": data.get("shipToAddress"),
+        "subtotal": data.get("subTotal"),
+        "next_shipment": data.get("nextShipment"),
+        "order_lines": []
+    }
+    if "orderLines" in data and data["orderLines"]:
+        for line in data["orderLines"]:
+            processed["order_lines"].append({
+                "item_id": line.get("itemId"),
+                "status": line.get("status")
+            })
+    processed["total_items"] = len(processed["order_lines"])
+    return processed
+
+
+def for_llm(processed) -> str:
+    """The tool result as pydantic-ai serializes it into the next model request."""
+    return ToolReturnPart(tool_name="get_order_status", content=processed).model_response_str()
+
+
+ANSWER = app.OrderStatusResponse(summary="Order 12345 is Dispatched with 3 items.", order_id="12345")
+
+# (parse, LLM serialization, HTTP response) per path
+PATHS = {
+    "dict": (
+        lambda body: legacy_process_order_response(json.loads(body)),
+        for_llm,
+        lambda: json.dumps(jsonable_encoder(ANSWER), ensure_ascii=False, separators=(",", ":")).encode(),
+    ),
+    "typed": (
+        lambda body: app.ProcessedOrder.model_validate(json.loads(body)),
+        for_llm,
+        lambda: app.ModelJSONResponse(ANSWER).body,
+    ),
+}
+
+
+def whole_request(path: str, body: bytes):
+    parse, serialize, respond = PATHS[path]
+    processed = parse(body)
+    serialize(processed)
+    respond()
+    return processed
+
+
+def cpu_seconds(fn, number: int, repeats: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=repeats)) / number
+
+
+def memory_bytes(path: str, body: bytes) -> tuple[int, int]:
+    """(peak bytes allocated during one request, bytes still held by its result)."""
+    whole_request(path, body)
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = whole_request(path, body)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak - baseline, current - baseline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'lines':>6}{'body KB':>9}{'path':>7}{'parse us':>10}{'LLM us':>9}{'HTTP us':>9}{'total us':>10}{'peak KB':>9}{'kept KB':>9}")
+    for lines in args.lines:
+        body = order_body(lines)
+        number = max(5, 20000 // max(lines, 10))
+        for name, (parse, serialize, respond) in PATHS.items():
+            processed = parse(body)
+            stages = [
+                cpu_seconds(lambda: parse(body), number, args.repeats),
+                cpu_seconds(lambda: serialize(processed), number, args.repeats),
+                cpu_seconds(respond, number, args.repeats),
+            ]
+            peak, kept = memory_bytes(name, body)
+            print(
+                f"{lines:>6}{len(body) / 1024:>9.1f}{name:>7}"
+                + "".join(f"{seconds * 1e6:>{width}.1f}" for seconds, width in zip(stages, (10, 9, 9)))
+                + f"{sum(stages) * 1e6:>10.1f}{peak / 1024:>9.1f}{kept / 1024:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Offline load test of /search against local stand-ins for every upstream.
+
+Starts stub CableGuide/OrderStatus and Google Custom Search servers (see
+stubs.py) with the requested latency and failure rates, replaces the LLM
+with a scripted model that replays the tool-calling trace of each query
+with a simulated think time, then drives /search through the full FastAPI
+app at the given concurrency. Nothing leaves the machine and no API keys
+are needed, so runs are repeatable and comparable across revisions.
+
+Reports client-side p50/p95/p99 latency and throughput, status codes,
+where answers came from (fast path, agent, cache, degraded) and the time
+spent in each agent tool, taken from the app's Prometheus metrics.
+
+Usage:
+    python benchmarks/bench_search.py [--requests 500] [--concurrency 16]
+        [--upstream-latency-ms 50] [--model-latency-ms 400]
+        [--error-rate 0.0] [--hang-rate 0.0] [--response-cache]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from stubs import StubProfile, StubServer, build_eet_stub, build_google_stub  # noqa: E402
+
+# (weight, query, tool calls the scripted model makes before answering).
+# Direct cable queries never reach the model, they measure the fast path.
+QUERY_MIX = [
+    (4, "HDMI to USB-C", []),
+    (2, "displayport male to hdmi female cable", []),
+    # A gender word on its own is not matched by the fast path, whichever end it is for
+    (1, "hdmi male to female", [("resolve_cable", {"from_hint": "HDMI male", "to_hint": "HDMI female"})]),
+    (1, "male to female hdmi", [("resolve_cable", {"from_hint": "HDMI male", "to_hint": "HDMI female"})]),
+    (3, "I need a cable from my laptop's USB-C port to a VGA projector", [("resolve_cable", {"from_hint": "USB-C", "to_hint": "VGA"})]),
+    (2, "mini displayport to dvi adapter", [("resolve_cable", {"from_hint": "Mini DisplayPort", "to_hint": "DVI-D"})]),
+    (2, "iPhone 15 charging cable", [
+        ("search_product_info", {"product_query": "iPhone 15"}),
+        ("resolve_cable", {"from_hint": "USB-C", "to_hint": "USB-C"}),
+    ]),
+    (1, "cable for my PS5 controller", [
+        ("search_product_info", {"product_query": "PS5 controller"}),
+        ("resolve_cable", {"from_hint": "USB-A", "to_hint": "USB-C"}),
+    ]),
+    (1, "something to connect my old monitor to the tower", [
+        ("get_cable_ends_a", {}),
+        ("get_cable_ends_b", {"cable_end_a": "VGA Male"}),
+    ]),
+    (3, "where is my order 12345", [("get_order_status", {"user_query": "where is my order 12345"})]),
+    (2, "status of my latest delivery", [("get_order_status", {"user_query": "status of my latest delivery"})]),
+    (1, "status of orders 12345, 12388 and 12391", [("get_order_statuses", {"user_query": "status of orders 12345, 12388 and 12391"})]),
+]
+TRACES = {query: trace for _, query, trace in QUERY_MIX}
+
+
+def configure_environment(args, eet: StubServer, google: StubServer, workdir: str):
+    """Point app.py at the stubs; must run before it is imported."""
+    os.environ.update({
+        "EET_API_BASE_URL": eet.base_url,
+        "GOOGLE_API_BASE_URL": google.base_url,
+        "GOOGLE_API_KEY": "benchmark",
+        "GOOGLE_CSE_ID": "benchmark",
+        "OPENROUTER_API_KEY": "benchmark",
+        "PRODUCT_STORE_PATH": os.path.join(workdir, "product_store.sqlite3"),
+        "CATALOG_SNAPSHOT_PATH": os.path.join(workdir, "catalog_snapshot.bin"),
+        "CSE_DAILY_QUOTA": "1000000",
+        "CSE_QUERIES_PER_SECOND": "1000",
+        "LOG_LEVEL": "ERROR",
+        "LOG_SAMPLE_RATE": "0",
+        "PYDANTIC_AI_NO_BANNER": "1",
+    })
+    if not args.response_cache:
+        os.environ["RESPONSE_CACHE_MAX_ENTRIES"] = "0"
+
+
+def scripted_model(app, model_latency: float, jitter: float):
+    """
+    FunctionModel that answers like the real agent would, minus the reasoning.
+
+    Each turn replays the next tool call from the query's trace; once the
+    trace is done it answers with the output tool, built from the last tool
+    result (the resolved cable, or a summary of the order).
+    """
+    from pydantic_ai.messages import ModelResponse, ToolCallPart, ToolReturnPart, UserPromptPart
+    from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+    async def respond(messages, info: AgentInfo) -> ModelResponse:
+        await asyncio.sleep(model_latency * (1 + random.uniform(-jitter, jitter)))
+        query = next(part.content for part in messages[0].parts if isinstance(part, UserPromptPart))
+        trace = TRACES.get(query, [])
+        step = sum(isinstance(message, ModelResponse) for message in messages)
+        if step < len(trace):
+            tool_name, tool_args = trace[step]
+            return ModelResponse(parts=[ToolCallPart(tool_name, tool_args)])
+
+        returns = [part for part in messages[-1].parts if isinstance(part, ToolReturnPart)]
+        result = returns[-1].content if returns else {}
+        if trace and trace[-1][0] == "get_order_status":
+            output_type = "Order"
+            output = {"response_type": "order", "summary": app.order_summary(result), "order_id": result.order_id}
+        elif trace and trace[-1][0] == "get_order_statuses":
+            output_type = "Order"
+            orders = [order for order in result["orders"] if isinstance(order, app.ProcessedOrder)]
+            output = {
+                "response_type": "order",
+                "summary": " ".join(app.order_summary(order) for order in orders),
+                "order_ids": [order.order_id for order in orders],
+            }
+        elif trace and trace[-1][0] == "get_cable_ends_b":
+            output_type = "Cable"
+            output = {"response_type": "cable", "from_connector": trace[-1][1]["cable_end_a"], "to_connector": result[0] if result else ""}
+        else:
+            output_type = "Cable"
+            output = {"response_type": "cable", "from_connector": result.get("from_connector", ""), "to_connector": result.get("to_connector", "")}
+        tool = next(tool for tool in info.output_tools if output_type in tool.name)
+        return ModelResponse(parts=[ToolCallPart(tool.name, output)])
+
+    return FunctionModel(respond, model_name="scripted")
+
+
+def scripted_classifier():
+    """Stand-in for the small-model classifier, for ROUTING_MODE=model runs."""
+    from pydantic_ai.messages import ModelResponse, ToolCallPart
+    from pydantic_ai.models.function import AgentInfo, FunctionModel
+
+    def respond(messages, info: AgentInfo) -> ModelResponse:
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, {"response": "cable"})])
+
+    return FunctionModel(respond, model_name="scripted-classifier")
+
+
+def histogram_totals(registry, name: str, label: str) -> dict[str, tuple[float, float]]:
+    """Current (count, total seconds) per label value of one of the app's latency histograms."""
+    totals: dict[str, list[float]] = {}
+    for metric in registry.collect():
+        if metric.name != name:
+            continue
+        for sample in metric.samples:
+            if sample.name.endswith("_count"):
+                totals.setdefault(sample.labels[label], [0.0, 0.0])[0] += sample.value
+            elif sample.name.endswith("_sum"):
+                totals.setdefault(sample.labels[label], [0.0, 0.0])[1] += sample.value
+    return {value: (count, seconds) for value, (count, seconds) in totals.items()}
+
+
+def metric_snapshot(registry) -> dict[str, dict[str, tuple[float, float]]]:
+    return {
+        "source": histogram_totals(registry, "eet_search_request_seconds", "source"),
+        "tool": histogram_totals(registry, "eet_search_tool_seconds", "tool"),
+    }
+
+
+def print_breakdown(title: str, before: dict, after: dict):
+    print(f"{title:<28}{'calls':>8}{'mean ms':>10}{'total s':>10}")
+    for key, (count, seconds) in sorted(after.items()):
+        before_count, before_seconds = before.get(key, (0.0, 0.0))
+        calls, total = count - before_count, seconds - before_seconds
+        if calls:
+            print(f"{key:<28}{calls:>8.0f}{total / calls * 1000:>10.1f}{total:>10.2f}")
+
+
+def percentile(values: list[float], p: float) -> float:
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+async def run_load(app, args) -> tuple[list[float], Counter, float, dict]:
+    import httpx
+
+    queries = [query for _, query, _ in QUERY_MIX]
+    weights = [weight for weight, _, _ in QUERY_MIX]
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+    transport = httpx.ASGITransport(app=app.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+
+        async def one_request(record: bool):
+            query = random.choices(queries, weights)[0]
+            params = {
+                "query": query,
+                "customerId": f"customer-{random.randrange(args.customers)}",
+                "language": "en-US",
+                "erpBusinessEntityId": 9,
+            }
+            started = time.perf_counter()
+            response = await client.get("/search", params=params)
+            if record:
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status_code] += 1
+
+        async def worker(count: int, record: bool):
+            for _ in range(count):
+                await one_request(record)
+
+        async def run(total: int, record: bool) -> float:
+            per_worker = [total // args.concurrency + (i < total % args.concurrency) for i in range(args.concurrency)]
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(count, record) for count in per_worker))
+            return time.perf_counter() - started
+
+        await run(args.warmup, record=False)
+        before = metric_snapshot(app.REGISTRY)
+        elapsed = await run(args.requests, record=True)
+    return latencies, statuses, elapsed, before
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--customers", type=int, default=50)
+    parser.add_argument("--upstream-latency-ms", type=float, default=50)
+    parser.add_argument("--google-latency-ms", type=float, default=150)
+    parser.add_argument("--model-latency-ms", type=float, default=400)
+    parser.add_argument("--jitter", type=float, default=0.5, help="+/- fraction applied to every latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream requests answered with 503")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="fraction of upstream requests that hang")
+    parser.add_argument("--hang-seconds", type=float, default=30.0)
+    parser.add_argument("--response-cache", action="store_true", help="leave the response cache on")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    eet, google = StubServer(), StubServer()
+    workdir = tempfile.mkdtemp(prefix="bench_search_")
+    configure_environment(args, eet, google, workdir)
+    import app
+
+    def profile(latency_ms: float) -> StubProfile:
+        return StubProfile(latency_ms / 1000, args.jitter, args.error_rate, args.hang_rate, args.hang_seconds)
+
+    eet.start(build_eet_stub(profile(args.upstream_latency_ms), app.DEFAULT_CABLE_ENDS_A))
+    google.start(build_google_stub(profile(args.google_latency_ms)))
+    model = scripted_model(app, args.model_latency_ms / 1000, args.jitter)
+    for tier in app.models:
+        app.models[tier] = app.HedgedModel(model, model)
+
+    try:
+        with app.classifier_agent.override(model=scripted_classifier()):
+            async with app.app.router.lifespan_context(app.app):
+                latencies, statuses, elapsed, before = await run_load(app, args)
+                after = metric_snapshot(app.REGISTRY)
+                state = app.app.state
+                component_stats = {
+                    "fast path": state.fast_path.stats(),
+                    "admission": state.admission.stats(),
+                    "degraded": state.degraded.stats(),
+                    "prefetch": state.prefetch.stats(),
+                    "breakers": state.http.breaker_stats(),
+                }
+    finally:
+        eet.stop()
+        google.stop()
+
+    latencies.sort()
+    print(f"requests:      {len(latencies)} at concurrency {args.concurrency} in {elapsed:.2f}s")
+    print(f"throughput:    {len(latencies) / elapsed:.1f} req/s")
+    print(f"latency p50:   {percentile(latencies, 50) * 1000:.1f} ms")
+    print(f"latency p95:   {percentile(latencies, 95) * 1000:.1f} ms")
+    print(f"latency p99:   {percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"latency max:   {latencies[-1] * 1000:.1f} ms")
+    print(f"status codes:  {dict(sorted(statuses.items()))}")
+    for name, stats in component_stats.items():
+        print(f"{name + ':':<15}{stats}")
+    print()
+    print_breakdown("answered by", before["source"], after["source"])
+    print()
+    print_breakdown("tool", before["tool"], after["tool"])
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,142 @@
+"""
+Local stand-ins for the upstream APIs, for offline benchmarks.
+
+Serves the CableGuide, AiSearch/OrderStatus and Google Custom Search
+endpoints app.py calls, with configurable latency and injected errors and
+hangs. Each stub runs under uvicorn on a loopback socket in its own thread,
+so the app talks to it over real HTTP exactly as it would in production.
+
+The port is reserved when the StubServer is created, so its base_url can be
+put in the environment before app.py is imported and reads it.
+
+Usage:
+    eet = StubServer()
+    os.environ["EET_API_BASE_URL"] = eet.base_url   # e.g. "http://127.0.0.1:40123"
+    eet.start(build_eet_stub(StubProfile(latency=0.05), connectors))
+    ...
+    eet.stop()
+"""
+import asyncio
+import hashlib
+import random
+import socket
+import threading
+import time
+from typing import NamedTuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+
+class StubProfile(NamedTuple):
+    latency: float = 0.05       # mean response time in seconds
+    jitter: float = 0.5         # +/- fraction of latency, uniformly distributed
+    error_rate: float = 0.0     # fraction of requests answered with HTTP 503
+    hang_rate: float = 0.0      # fraction of requests that hang for hang_seconds
+    hang_seconds: float = 30.0
+
+
+async def simulate(profile: StubProfile) -> Response | None:
+    """Sleep like the real upstream would; return an error response to send instead, if any."""
+    roll = random.random()
+    if roll < profile.hang_rate:
+        await asyncio.sleep(profile.hang_seconds)
+    await asyncio.sleep(max(0.0, profile.latency * (1 + random.uniform(-profile.jitter, profile.jitter))))
+    if roll > 1 - profile.error_rate:
+        return JSONResponse({"error": "injected failure"}, status_code=503)
+    return None
+
+
+def build_eet_stub(profile: StubProfile, connectors: list[str]) -> FastAPI:
+    """
+    CableGuide and order status endpoints.
+
+    Every connector is listed as compatible with every other one. Orders are
+    derived from the order ID, and carry an ETag so revalidation gets 304s.
+    """
+    stub = FastAPI()
+    cable_types = {"model": {"cableTypes": [{"id": name} for name in connectors]}}
+
+    @stub.get("/api/CableGuide/GetCableEndTypesA")
+    async def cable_ends_a():
+        return await simulate(profile) or cable_types
+
+    @stub.get("/api/CableGuide/GetCableEndTypesB")
+    async def cable_ends_b(cableEndTypeA: str):
+        return await simulate(profile) or cable_types
+
+    @stub.get("/api/AiSearch/OrderStatus")
+    async def order_status(request: Request, customerId: str, orderId: str | None = None):
+        failure = await simulate(profile)
+        if failure is not None:
+            return failure
+        order_id = orderId or str(10000 + int(hashlib.sha1(customerId.encode()).hexdigest()[:4], 16))
+        seed = int(order_id) if order_id.isdigit() else len(order_id)
+        etag = f'"{order_id}-{seed % 5}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        order = {
+            "orderId": order_id,
+            "status": seed % 5,
+            "orderDate": "2025-12-05T10:12:00",
+            "shippingAgentName": ["DHL", "UPS", "FedEx", "GLS"][seed % 4],
+            "shipToAddress": "Example Street 1, 2100 Copenhagen",
+            "subTotal": round(19.99 * (1 + seed % 7), 2),
+            "nextShipment": "2025-12-15" if seed % 2 else None,
+            "orderLines": [{"itemId": f"ITEM-{seed + line}", "status": None} for line in range(1 + seed % 4)],
+        }
+        return JSONResponse(order, headers={"ETag": etag})
+
+    return stub
+
+
+# Snippets Google would return for the products the benchmark asks about
+PRODUCT_SNIPPETS = {
+    "iphone": "The iPhone 15 charges over USB-C; the included cable is USB-C to USB-C.",
+    "ps5": "The DualSense controller charges with a USB-A to USB-C cable.",
+    "macbook": "MacBook Pro ports: Thunderbolt 4 (USB-C), HDMI and MagSafe 3.",
+    "kindle": "Older Kindle models use a Micro USB cable connected to a USB-A charger.",
+}
+
+
+def build_google_stub(profile: StubProfile) -> FastAPI:
+    """Custom Search endpoint answering with connector-bearing snippets."""
+    stub = FastAPI()
+
+    @stub.get("/customsearch/v1")
+    async def custom_search(q: str):
+        failure = await simulate(profile)
+        if failure is not None:
+            return failure
+        text = q.lower()
+        snippet = next((snippet for product, snippet in PRODUCT_SNIPPETS.items() if product in text), "Uses a USB-C connector.")
+        return {"items": [{"title": q, "snippet": snippet}, {"title": q, "snippet": "Compatible cables available."}]}
+
+    return stub
+
+
+class StubServer:
+    """Run an ASGI app under uvicorn on a free loopback port in a background thread."""
+
+    def __init__(self):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(("127.0.0.1", 0))
+        self.base_url = f"http://127.0.0.1:{self._socket.getsockname()[1]}"
+        self._server: uvicorn.Server | None = None
+        self._thread: threading.Thread | None = None
+
+    def start(self, stub: FastAPI):
+        config = uvicorn.Config(stub, log_level="warning", access_log=False, lifespan="off")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, kwargs={"sockets": [self._socket]}, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+
+    def stop(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=5)
+        self._socket.close()